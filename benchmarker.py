@@ -1,25 +1,101 @@
 import argparse
 import atexit
-import csv
+import contextlib
+import glob
+import hashlib
+import heapq
+import html
+import io
 import itertools
 import json
+import math
 import os
+import platform
+import queue
+import re
+import shutil
+import signal
+import socket
+import sqlite3
 import statistics
+import struct
 import subprocess
 import tarfile
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 from copy import deepcopy
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path, PurePath
 from sys import platform as operatingsystem_codename
-from typing import Any
-from zipfile import ZipFile
+from typing import IO, Any, cast
+from zipfile import ZIP_DEFLATED, BadZipFile, ZipFile
 
-import factorio_rcon
-import matplotlib.pyplot as plt
-import psutil
-import requests
+import numpy as np
+import numpy.typing as npt
+
+# matplotlib, requests, factorio_rcon and psutil are imported where they are used, most
+# commands don't need them and matplotlib alone takes longer to import than everything else
 
 threadreg: list[subprocess.Popen[Any]] = []
+# fmm always syncs into 'factorio/mods', so only one sync can happen at a time
+mods_lock = threading.Lock()
+# the `--version` output of every factorio binary, see `probe_factorio_version`
+factorio_versions: dict[str, dict[str, Any]] = {}
+versions_lock = threading.Lock()
+# the metadata of every save by path, see `save_info`
+save_index: dict[str, dict[str, Any]] = {}
+saves_lock = threading.Lock()
+WRITE_BUFFER_SIZE = 1 << 20
+RESULT_CACHE = PurePath("cache", "results")
+MOD_CACHE = PurePath("cache", "mods")
+VERSION_CACHE = PurePath("cache", "factorio_versions.json")
+SAVE_INDEX = PurePath("cache", "saves.json")
+# the entity census of every save by its hash, see `map_census`
+CENSUS_CACHE = PurePath("cache", "census")
+# the census counts the time of a subsystem is fitted against, "entities" are the counts of
+# the most common entity types
+COST_MODEL = {
+    "entityUpdate": ["entities"],
+    "transportLinesUpdate": ["transport_lines"],
+    "fluidsUpdate": ["fluid_systems"],
+    "electricNetworkUpdate": ["electric_networks", "electric_entities"],
+    "trains": ["trains"],
+}
+COST_MODEL_NAME = "entity_costs.json"
+# several factorio versions side by side, in '<store>/<version>'
+VERSION_STORE = PurePath("factorio_versions")
+DOWNLOAD_LINK = "https://factorio.com/get-download/{version}/headless/linux64"
+# the level header is at the start of level-init.dat, this is all that is read of it
+SAVE_HEADER_BYTES = 1 << 16
+HISTORY_DATABASE = "benchmark_history.sqlite"
+# per map/group settings in the save folders
+MANIFEST_NAME = "benchmark.json"
+# the seconds since the start of factorio in front of its log lines
+LOG_TIME = re.compile(r"^\s*(\d+\.\d+) ")
+# the names workers can give themselves, they end up in the results
+WORKER_NAME = re.compile(r"[A-Za-z0-9_.-]+")
+# the default memory budget of the saves staged with `--stage`
+STAGE_BUDGET_MB = 2048
+# the archive a result is packed into once it is complete
+ARCHIVE_SUFFIX = ".ticks"
+# a tick has to be faster than this for 60 UPS
+TICK_BUDGET_MS = 1000 / 60
+PERCENTILES = [50, 90, 99, 99.9]
+REPORT_TEMPLATE = Path(__file__).with_name("report_template.html")
+# the coarsest level of a tick series in the report, every further level has 4 times the points
+REPORT_POINTS = 1000
+# two sided 95% quantiles of the t-distribution for 1 to 30 degrees of freedom
+T_975 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]  # fmt: skip
 outheader = [
     "timestamp",
     "wholeUpdate",
@@ -68,14 +144,48 @@ def exit_handler() -> None:
     except Exception:  # noqa: PIE786
         print("factorio was already stopped")
         pass
+    for lock_file in Path("factorio", "instances").glob("*/.lock"):
+        os.remove(lock_file)
+        print("deleted the lock file of", lock_file.parent)
     # I should also clean up potential other files
     # such as the lock file (factorio/.lock on linux)
-    # also factorio.zip and maps.zip can be left over in rare cases and fail the reinstall.
+
+
+def probe_factorio_version(factorio_bin: PurePath) -> str:
+    """the output of `factorio --version`. It is cached in memory and in
+    'cache/factorio_versions.json' and only probed again when the size or mtime of the
+    binary change, e.g. after an update."""
+    path = Path(factorio_bin).absolute()
+    try:
+        stat = path.stat()
+        binary = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    except OSError:
+        binary = None
+    with versions_lock:
+        cached = factorio_versions.get(str(path))
+        if binary is not None and (cached is None or cached["binary"] != binary):
+            # another process might have probed it already
+            with contextlib.suppress(OSError, ValueError), open(VERSION_CACHE) as f:
+                factorio_versions.update(json.load(f))
+            cached = factorio_versions.get(str(path))
+        if binary is not None and cached is not None and cached["binary"] == binary:
+            return cast(str, cached["output"])
+        with os.popen(f"{factorio_bin} --version") as version_output:
+            output = version_output.read()
+        if binary is not None and output:
+            factorio_versions[str(path)] = {"binary": binary, "output": output}
+            for key in [key for key in factorio_versions if not Path(key).exists()]:
+                del factorio_versions[key]
+            Path(VERSION_CACHE).parent.mkdir(parents=True, exist_ok=True)
+            with open(f"{VERSION_CACHE}.part", "w") as f:
+                json.dump(factorio_versions, f, indent=2)
+            os.replace(f"{VERSION_CACHE}.part", VERSION_CACHE)
+        return output
 
 
 def get_factorio_version(factorio_bin: PurePath, full: bool = False) -> str:
     """returns the version string of the installed factorio instance"""
-    factorio_log_version = os.popen(f"{factorio_bin} --version").read()
+    factorio_log_version = probe_factorio_version(factorio_bin)
     result = factorio_log_version.splitlines()[0].split()[1]
     if full:
         result += " " + factorio_log_version.splitlines()[0].split()[4][:-1]
@@ -83,66 +193,197 @@ def get_factorio_version(factorio_bin: PurePath, full: bool = False) -> str:
     return result
 
 
+def run_server_commands(
+    factorio_bin: PurePath,
+    map_: PurePath,
+    commands: list[str],
+    port: int = 12245,
+    rcon_port: int = 12345,
+    config: PurePath | None = None,
+    until: str | None = None,
+) -> list[str] | None:
+    """starts a headless server with `map_` and its mods, sends `commands` over RCON once it
+    is up and stops it again, with `until` only after factorio logged a line containing it.
+    With a `config` the server uses its own write dir. Returns the responses to the commands
+    or None if factorio crashed."""
+    import psutil
+
+    mods_dir = prepare_mods(map_)
+    command = f"{Path.absolute(Path(factorio_bin))}  --start-server  {Path.absolute(Path(map_))}  --port  {port}  --rcon-port  {rcon_port}  --rcon-password  1234"
+    command += f"  --mod-directory  {Path(mods_dir).absolute()}"
+    if config is not None:
+        command += f"  --config  {config}"
+    print(command)
+    proc = psutil.Popen(args=command.split("  "), stdout=subprocess.PIPE)
+    print("starting factorio server...")
+    threadreg.append(proc)
+    lastlines: deque[str] = deque(maxlen=8)
+    responses: list[str] = []
+    client: Any = None
+    try:
+        while True:
+            line = proc.stdout.readline().decode().rstrip()
+
+            if "Starting RCON interface at IP ADD" in line:
+                import factorio_rcon
+
+                print("connecting to game...")
+                client = factorio_rcon.RCONClient("127.0.0.1", rcon_port, "1234")
+
+            if "New RCON connection from IP ADD" in line:
+                for server_command in commands:
+                    responses.append(client.send_command(server_command) or "")
+                if until is None:
+                    break
+
+            if until is not None and until in line:
+                break
+            if line == "":
+                print("\n".join(lastlines))
+                print("factorio crashed")
+                proc.wait()
+                proc.stdout.close()
+                threadreg.remove(proc)
+                return None
+            lastlines.append(line)
+    except Exception:
+        # a failed RCON command mustn't leave the server running on its ports
+        if client is not None:
+            client.close()
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+        threadreg.remove(proc)
+        raise
+
+    print("terminating factorio...")
+    client.close()
+    proc.terminate()
+    exit_code = proc.wait()
+    proc.stdout.close()
+    print("terminated with exit code: ", exit_code)
+    print()
+    threadreg.remove(proc)
+    return responses
+
+
 def migrate_map(
-    factorio_bin: PurePath, map: PurePath, inplace: bool, custom_script: str | None
-) -> None:
-    """migrate map to a new factorio version."""
+    factorio_bin: PurePath,
+    map: PurePath,
+    inplace: bool,
+    custom_script: str | None,
+    port: int = 12245,
+    rcon_port: int = 12345,
+    config: PurePath | None = None,
+) -> bool:
+    """migrate map to a new factorio version. With a `config` the server uses its own write
+    dir. Returns if it worked."""
     print("migrating map:" + str(map))
     if not inplace:
         oldmap = Path(map)
         newmap = Path(
-            PurePath.parent(map)
-            / (
-                str(PurePath.stem(map))
-                + get_factorio_version(factorio_bin).replace(".", "_")
-                + ".zip"
-            )
+            map.parent / (map.stem + get_factorio_version(factorio_bin).replace(".", "_") + ".zip")
         )
         newmap.write_bytes(oldmap.read_bytes())
         map = newmap
-    sync_mods(map)
 
-    command = f"{Path.absolute(factorio_bin)}  --start-server  {Path.absolute(map)}  --port  12245  --rcon-port  12345  --rcon-password  1234"
-    print(command)
-    proc = psutil.Popen(args=command.split("  "), stdout=subprocess.PIPE)
-    print("starting factorio server...")
-    threadreg.append(proc)
-    line: str = ""
-    lastlines = ["", "", "", "", "", "", "", ""]
-    while True:
-        lastlines.append(line)
-        lastlines.pop(0)
-        line = proc.stdout.readline().decode().rstrip()
-
-        if "Starting RCON interface at IP ADD" in line:
-            print("connecting to game...")
-            client = factorio_rcon.RCONClient("127.0.0.1", 12345, "1234")
-
-        if "New RCON connection from IP ADD" in line:
-            if custom_script is not None:
-                print("running custom script...")
-                print(custom_script)
-                resp = client.send_command(custom_script)
-                print(resp)
-            print("saving migrated map...")
-            resp = client.send_command("/server-save ")
-            print(resp)
-
-        if "Saving finished" in line:
-            print("map saved, terminating factorio...")
-            client.close()
-            proc.terminate()
-            exit_code = proc.wait()
-            print("terminated with exit code: ", exit_code)
-            print()
-            threadreg.remove(proc)
+    commands = ["/server-save "]
+    if custom_script is not None:
+        print("running custom script...")
+        print(custom_script)
+        commands.insert(0, custom_script)
+    responses = run_server_commands(
+        factorio_bin, map, commands, port, rcon_port, config, until="Saving finished"
+    )
+    if responses is None:
+        return False
+    for response in responses:
+        print(response)
+    print("map saved")
+    return True
+
+
+# counts the entities by type and the belts, fluid systems, electric networks and trains of
+# all surfaces. Transport lines are the lanes the belts are merged into, 2 per belt
+CENSUS_SCRIPT = " ".join(
+    [
+        "/silent-command",
+        "local entities, lines, fluids, networks, powered, trains = {}, 0, {}, {}, 0, 0",
+        "local belts = {['transport-belt'] = true, ['underground-belt'] = true,",
+        "splitter = true, loader = true, ['loader-1x1'] = true, ['linked-belt'] = true}",
+        "for _, surface in pairs(game.surfaces) do",
+        "for _, entity in pairs(surface.find_entities()) do",
+        "entities[entity.type] = (entities[entity.type] or 0) + 1",
+        "if belts[entity.type] then lines = lines + entity.get_max_transport_line_index() end",
+        "local fluidbox = entity.fluidbox",
+        "if fluidbox then for i = 1, #fluidbox do",
+        "local id = fluidbox.get_fluid_system_id(i) if id then fluids[id] = true end end end",
+        "local network = entity.electric_network_id",
+        "if network then networks[network] = true powered = powered + 1 end",
+        "end",
+        "trains = trains + #surface.get_trains()",
+        "end",
+        "local function size(set) local n = 0 for _ in pairs(set) do n = n + 1 end return n end",
+        "rcon.print(game.table_to_json({entities = entities, transport_lines = lines,",
+        "fluid_systems = size(fluids), electric_networks = size(networks),",
+        "electric_entities = powered, trains = trains}))",
+    ]
+)
+
+
+def take_census(
+    factorio_bin: PurePath,
+    map_: PurePath,
+    port: int = 12245,
+    rcon_port: int = 12345,
+    config: PurePath | None = None,
+) -> dict[str, Any] | None:
+    """loads `map_` in a headless server and counts what is in it with `CENSUS_SCRIPT`: the
+    entities by type, transport lines, fluid systems, electric networks, powered entities
+    and trains. None if factorio crashed or the answer isn't a census."""
+    print("taking census of " + str(map_))
+    responses = run_server_commands(factorio_bin, map_, [CENSUS_SCRIPT], port, rcon_port, config)
+    if not responses:
+        return None
+    try:
+        census = json.loads(responses[0])
+    except ValueError:
+        print("no census in the answer of factorio:", responses[0][:200])
+        return None
+    return census if isinstance(census, dict) and "entities" in census else None
+
+
+def map_census(
+    map_: PurePath, factorio_bin: PurePath, use_cache: bool = True
+) -> dict[str, Any] | None:
+    """the census of a save, cached in 'cache/census' by the hash of the save so it is only
+    taken again when the save changes"""
+    key = save_info(map_)["hash"] or hash_file(map_)
+    entry = PurePath(CENSUS_CACHE, f"{key}.json")
+    if use_cache:
+        with contextlib.suppress(OSError, ValueError), open(entry) as f:
+            return cast(dict[str, Any], json.load(f))
+    port, rcon_port = allocate_ports(1)[0]
+    census = take_census(factorio_bin, map_, port, rcon_port)
+    if census is not None:
+        Path(CENSUS_CACHE).mkdir(parents=True, exist_ok=True)
+        with open(f"{entry}.part", "w") as f:
+            json.dump(census, f, indent=2)
+        os.replace(f"{entry}.part", entry)
+    return census
 
-            break
-        if line == "":
-            print(lastlines[1])
-            print("factorio crashed")
-            threadreg.remove(proc)
-            break
+
+def census_features(census: dict[str, Any]) -> dict[str, float]:
+    """the counts of a census as one flat dict: the entity types and the other counts
+
+    >>> census_features({"entities": {"inserter": 10}, "transport_lines": 4, "trains": 1})
+    {'inserter': 10.0, 'transport_lines': 4.0, 'trains': 1.0}
+    """
+    features = {name: float(count) for name, count in census.get("entities", {}).items()}
+    for name, count in census.items():
+        if name != "entities":
+            features[name] = float(count)
+    return features
 
 
 def sync_mods(map: PurePath, disable_all: bool = False) -> None:
@@ -160,11 +401,356 @@ def sync_mods(map: PurePath, disable_all: bool = False) -> None:
     print(os.popen(set_mod_command).read())
 
 
-def install_maps(link: str) -> None:
+def read_optimized_uint(data: bytes, pos: int, size: int) -> tuple[int, int]:
+    """reads a space optimized integer of a factorio save: one byte, or 0xff followed by
+    the full `size` bytes. returns the value and the new position"""
+    if data[pos] != 0xFF:
+        return data[pos], pos + 1
+    fmt = {2: "<H", 4: "<I"}[size]
+    return struct.unpack_from(fmt, data, pos + 1)[0], pos + 1 + size
+
+
+def parse_save_header(data: bytes) -> list[tuple[str, str]]:
+    """parses the mods (name, version) out of the header of a factorio 1.x save.
+
+    >>> def string(s): return bytes([len(s)]) + s.encode()
+    >>> header = struct.pack("<4H", 1, 1, 80, 0) + b"\\0" + string("") + string("map")
+    >>> header += string("base") + b"\\0" * 3 + string("") + b"\\0" * 4 + bytes([1, 1, 80])
+    >>> header += struct.pack("<H", 0) + b"\\0" + bytes([2])
+    >>> header += string("base") + bytes([1, 1, 80]) + b"crc!"
+    >>> header += string("Krastorio2") + bytes([1, 3, 21]) + b"crc!"
+    >>> parse_save_header(header)
+    [('base', '1.1.80'), ('Krastorio2', '1.3.21')]
+    """
+    pos = 0
+
+    def read(fmt: str) -> Any:
+        nonlocal pos
+        value = struct.unpack_from(fmt, data, pos)[0]
+        pos += struct.calcsize(fmt)
+        return value
+
+    def read_uint(size: int) -> int:
+        nonlocal pos
+        value, pos = read_optimized_uint(data, pos, size)
+        return value
+
+    def read_string() -> str:
+        nonlocal pos
+        length = read_uint(4)
+        pos += length
+        if pos > len(data):
+            raise ValueError("string out of bounds")
+        return data[pos - length : pos].decode()
+
+    major = read("<H")
+    pos += 3 * 2  # minor, patch and build
+    if major == 0 or major > 1:
+        raise ValueError(f"unsupported save version {major}")
+    pos += 1
+    read_string()  # campaign
+    read_string()  # level name
+    read_string()  # base mod
+    pos += 3  # difficulty, finished, player won
+    read_string()  # next level
+    pos += 4  # can continue, finished but continuing, saving replay, allow debug options
+    for _ in range(3):  # loaded from version
+        read_uint(2)
+    pos += 2 + 1  # loaded from build, allowed commands
+    mods = []
+    for _ in range(read_uint(4)):
+        name = read_string()
+        version = ".".join(str(read_uint(2)) for _ in range(3))
+        pos += 4  # crc
+        mods.append((name, version))
+    if "base" not in dict(mods):
+        raise ValueError("the mod list doesn't contain base")
+    return mods
+
+
+def read_level_header(archive: ZipFile) -> bytes | None:
+    """the start of the level header of a save (level-init.dat, or level.dat in older
+    saves), decompressed if needed. None if the save has neither."""
+    members = {PurePath(name).name: name for name in archive.namelist()}
+    name = members.get("level-init.dat") or members.get("level.dat")
+    if name is None:
+        return None
+    with archive.open(name) as member:
+        data = member.read(SAVE_HEADER_BYTES)
+    with contextlib.suppress(zlib.error):
+        data = zlib.decompressobj().decompress(data, SAVE_HEADER_BYTES)
+    return data
+
+
+def read_save_mods(map_: PurePath) -> list[tuple[str, str]] | None:
+    """reads the mods a save was made with, without starting factorio. This is best effort,
+    None is returned if the header can't be read."""
+    try:
+        with ZipFile(map_) as archive:
+            data = read_level_header(archive)
+        return None if data is None else parse_save_header(data)
+    except (OSError, BadZipFile, ValueError, IndexError, struct.error):
+        return None
+
+
+def mods_fingerprint(mods: list[tuple[str, str]]) -> str:
+    """fingerprint of a mod list"""
+    return hashlib.sha256(json.dumps(sorted(mods)).encode()).hexdigest()[:16]
+
+
+def read_save_info(map_: PurePath) -> dict[str, Any]:
+    """the factorio version, mods and a content hash of a save. Only the central directory of
+    the zip and the level header are read: the hash covers the crc and size of every file in
+    the zip. Whatever can't be read is None."""
+    info: dict[str, Any] = {"version": None, "mods": None, "mods_fingerprint": None, "hash": None}
+    try:
+        with ZipFile(map_) as archive:
+            members = sorted(
+                (entry.filename, entry.CRC, entry.file_size) for entry in archive.infolist()
+            )
+            info["hash"] = hashlib.sha256(json.dumps(members).encode()).hexdigest()
+            data = read_level_header(archive)
+    except (OSError, BadZipFile):
+        return info
+    if data is None:
+        return info
+    with contextlib.suppress(struct.error):
+        info["version"] = ".".join(str(part) for part in struct.unpack_from("<3H", data))
+    with contextlib.suppress(ValueError, IndexError, struct.error):
+        mods = parse_save_header(data)
+        info["mods"] = [list(mod) for mod in mods]
+        info["mods_fingerprint"] = mods_fingerprint(mods)
+    return info
+
+
+def write_save_index() -> None:
+    """writes the save index back to 'cache/saves.json'"""
+    with saves_lock:
+        Path(SAVE_INDEX).parent.mkdir(parents=True, exist_ok=True)
+        with open(f"{SAVE_INDEX}.part", "w") as f:
+            json.dump(save_index, f)
+        os.replace(f"{SAVE_INDEX}.part", SAVE_INDEX)
+
+
+def save_info(map_: PurePath, persist: bool = True) -> dict[str, Any]:
+    """the entry of a save in the save index ('cache/saves.json'). A save is only read
+    again if its size or mtime changed, with `persist` the index is written back then."""
+    stat = Path(map_).stat()
+    key = os.path.normpath(map_)
+    with saves_lock:
+        if not save_index:
+            with contextlib.suppress(OSError, ValueError), open(SAVE_INDEX) as f:
+                save_index.update(json.load(f))
+        entry = save_index.get(key)
+        if entry is not None and (entry["mtime"], entry["size"]) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            return entry
+        entry = {"mtime": stat.st_mtime_ns, "size": stat.st_size} | read_save_info(map_)
+        save_index[key] = entry
+    if persist:
+        write_save_index()
+    return entry
+
+
+def index_saves(files: list[Path]) -> dict[Path, dict[str, Any]]:
+    """the index entries of `files`. New and changed saves are read, saves that don't exist
+    anymore are dropped and the index is written back once."""
+    start = time.monotonic()
+    entries = {file: save_info(file, persist=False) for file in files if file.is_file()}
+    with saves_lock:
+        for key in [key for key in save_index if not Path(key).is_file()]:
+            del save_index[key]
+    write_save_index()
+    print(f"indexed {len(entries)} saves in {time.monotonic() - start:.2f} s")
+    return entries
+
+
+def needs_migration(save_version: str | None, installed: str) -> bool:
+    """if a save was made with an older factorio than the `installed` one. Saves with an
+    unknown version always need it.
+
+    >>> needs_migration("1.1.80", "1.1.100 linux64 headless"), needs_migration("1.1.100", "1.1.100")
+    (True, False)
+    """
+    return save_version is None or version_key(save_version) < version_key(installed)
+
+
+def list_saves(map_regex: str, factorio_bin: str | None = None) -> None:
+    """prints the selected saves grouped by their mods, with the version they were saved
+    with, their size and if they need to be migrated to the installed factorio"""
+    saves = index_saves([file for file in find_maps(map_regex) if file.is_file()])
+    factorio_path = PurePath(factorio_bin or PurePath("factorio", "bin", "x64", "factorio"))
+    installed = get_factorio_version(factorio_path) if Path(factorio_path).is_file() else None
+    groups: dict[str, list[Path]] = {}
+    for file, info in saves.items():
+        groups.setdefault(info["mods_fingerprint"] or "unknown", []).append(file)
+    for fingerprint, files in sorted(groups.items()):
+        mods = saves[files[0]]["mods"]
+        mod_list = ", ".join(f"{name} {version}" for name, version in mods or [])
+        print(f"mods {fingerprint}: {mod_list or 'unknown'}")
+        for file in sorted(files):
+            info = saves[file]
+            line = f"  {str(file):60} {info['version'] or '?':>10} {info['size'] / 1e6:8.1f} MB"
+            if installed is not None and needs_migration(info["version"], installed):
+                line += "  needs migration"
+            print(line)
+
+
+def get_save_mods_fingerprint(map_: PurePath) -> str | None:
+    """fingerprint of the mods a save needs, None if they can't be read from the save"""
+    try:
+        return cast(str | None, save_info(map_)["mods_fingerprint"])
+    except OSError:
+        return None
+
+
+def snapshot_mods(destination: Path) -> None:
+    """copies the mods that are enabled in 'factorio/mods' to `destination`. Mod archives
+    are hard linked if possible"""
+    mods_dir = Path("factorio", "mods")
+    enabled = {
+        mod["name"]
+        for mod in json.loads(Path(mods_dir, "mod-list.json").read_text())["mods"]
+        if mod["enabled"]
+    }
+    part = Path(f"{destination}.part")
+    shutil.rmtree(part, ignore_errors=True)
+    part.mkdir(parents=True)
+    for entry in mods_dir.iterdir():
+        mod = re.fullmatch(r"(.+)_\d+\.\d+\.\d+", entry.stem)
+        if entry.suffix in (".json", ".dat"):
+            shutil.copy2(entry, part)
+        elif mod is None or mod.group(1) not in enabled:
+            continue
+        elif entry.is_dir():
+            shutil.copytree(entry, Path(part, entry.name))
+        else:
+            try:
+                os.link(entry, Path(part, entry.name))
+            except OSError:
+                shutil.copy2(entry, part)
+    os.replace(part, destination)
+
+
+def prepare_mods(map_: PurePath) -> PurePath:
+    """returns a mod directory with the mods the save needs. Every mod set is synced once
+    and kept in the mod cache, so switching between mod sets is instant. Saves whose header
+    can't be read are synced every time."""
+    fingerprint = get_save_mods_fingerprint(map_)
+    if fingerprint is not None and Path(MOD_CACHE, fingerprint).is_dir():
+        return PurePath(MOD_CACHE, fingerprint)
+    with mods_lock:
+        if fingerprint is not None and Path(MOD_CACHE, fingerprint).is_dir():
+            # another instance synced them in the meantime
+            return PurePath(MOD_CACHE, fingerprint)
+        sync_mods(map_)
+        if fingerprint is None:
+            # key it by the synced mods instead
+            fingerprint = get_mods_fingerprint(False)[:16]
+            if Path(MOD_CACHE, fingerprint).is_dir():
+                return PurePath(MOD_CACHE, fingerprint)
+        snapshot_mods(Path(MOD_CACHE, fingerprint))
+    return PurePath(MOD_CACHE, fingerprint)
+
+
+class Download(io.RawIOBase):
+    """downloads `link` into '<destination>.part' while it is read, so archives can be
+    extracted straight from the stream. The content is hashed on the fly and a dropped
+    connection is resumed with a range request. If a part file of an interrupted download
+    already exists, it is resumed and `resumed` is set, the reader then only gets the rest."""
+
+    def __init__(self, link: str, destination: str, retries: int = 5) -> None:
+        super().__init__()
+        self.link = link
+        self.destination = destination
+        self.part = f"{destination}.part"
+        self.retries = retries
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+        self.resumed = Path(self.part).exists()
+        if self.resumed:
+            with open(self.part, "rb") as f:
+                while chunk := f.read(WRITE_BUFFER_SIZE):
+                    self.sha256.update(chunk)
+                    self.offset += len(chunk)
+        self.file = open(self.part, "ab")  # noqa: SIM115
+        self.chunks = self.download()
+        self.buffer = memoryview(b"")
+
+    def download(self) -> Iterator[bytes]:
+        import requests
+
+        attempt = 0
+        while True:
+            headers = {"Range": f"bytes={self.offset}-"} if self.offset else {}
+            try:
+                with requests.get(self.link, headers=headers, stream=True, timeout=60) as response:
+                    if response.status_code == 416:
+                        # the part file is already complete
+                        return
+                    response.raise_for_status()
+                    if self.offset and response.status_code != 206:
+                        if not self.resumed and self.file.tell():
+                            raise OSError("the server doesn't support resuming downloads")
+                        print("the server doesn't support resuming, starting over")
+                        self.file.truncate(0)
+                        self.sha256 = hashlib.sha256()
+                        self.offset = 0
+                    total = self.offset + int(response.headers.get("Content-Length", -1))
+                    for chunk in response.iter_content(WRITE_BUFFER_SIZE):
+                        self.file.write(chunk)
+                        self.sha256.update(chunk)
+                        self.offset += len(chunk)
+                        yield chunk
+                    if self.offset < total:
+                        raise requests.ConnectionError(f"got {self.offset} of {total} bytes")
+                    return
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                print(f"download interrupted ({e}), resuming at {self.offset} bytes")
+                time.sleep(attempt)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self.buffer:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.buffer = memoryview(chunk)
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def finish(self, sha256: str | None = None) -> str:
+        """downloads whatever hasn't been read yet, verifies the checksum and moves the file to
+        its destination. returns the sha256 of the file"""
+        for _ in self.chunks:
+            pass
+        self.file.close()
+        digest = self.sha256.hexdigest()
+        if sha256 is not None and digest != sha256.lower():
+            os.remove(self.part)
+            raise ValueError(f"checksum mismatch for {self.link}: {digest} != {sha256}")
+        os.replace(self.part, self.destination)
+        return digest
+
+    def close(self) -> None:
+        self.file.close()
+        super().close()
+
+
+def install_maps(link: str, sha256: str | None = None) -> None:
     """download maps from the walterpi server"""
-    file = requests.get(link)
-    with open("maps.zip", "xb") as mapsfile:
-        mapsfile.write(file.content)
+    # zip files can't be extracted from a stream, the directory is at the end
+    with Download(link, "maps.zip") as download:
+        download.finish(sha256)
     with ZipFile("maps.zip", "r") as zip:
         zip.extractall("saves")
     os.remove("maps.zip")
@@ -172,14 +758,108 @@ def install_maps(link: str) -> None:
 
 def install_factorio(
     link: str = "https://factorio.com/get-download/stable/headless/linux64",
+    sha256: str | None = None,
+    destination: str = "",
 ) -> None:
-    """Download and extract the latest version of Factorio."""
-    file = requests.get(link)
-    with open("factorio.zip", "xb") as zipfile:
-        zipfile.write(file.content)
-    with tarfile.open("factorio.zip", "r:xz") as tar:
-        tar.extractall("")
-    os.remove("factorio.zip")
+    """Download and extract the latest version of Factorio. The archive contains a 'factorio'
+    folder, which is extracted into `destination`. With `sha256` the archive is verified
+    before anything is extracted."""
+    archive = str(PurePath(destination, "factorio.tar.xz"))
+    with Download(link, archive) as download:
+        if download.resumed or sha256 is not None:
+            if download.resumed:
+                print("resuming an earlier download")
+            download.finish(sha256)
+            with tarfile.open(archive, "r:xz") as tar:
+                tar.extractall(destination)
+        else:
+            # extracted while it is downloaded
+            with tarfile.open(fileobj=io.BufferedReader(download), mode="r|xz") as tar:
+                tar.extractall(destination)
+            download.finish()
+    os.remove(archive)
+
+
+def version_binary(version: str) -> PurePath:
+    """the binary of a version in the version store"""
+    return PurePath(VERSION_STORE, version, "bin", "x64", "factorio")
+
+
+def stored_versions() -> list[str]:
+    """the versions in the version store, oldest first"""
+    if not Path(VERSION_STORE).is_dir():
+        return []
+    versions = [entry.name for entry in Path(VERSION_STORE).iterdir()]
+    return sorted((v for v in versions if Path(version_binary(v)).is_file()), key=version_key)
+
+
+def dedupe_install(directory: Path) -> int:
+    """hard links every file of an install to the same file in the object store
+    '<store>/.objects', so the files that didn't change between versions are only stored
+    once. Returns the bytes saved."""
+    objects = Path(VERSION_STORE, ".objects")
+    objects.mkdir(parents=True, exist_ok=True)
+    saved = 0
+    for file in sorted(directory.rglob("*")):
+        if file.is_symlink() or not file.is_file():
+            continue
+        # the mode is part of the key, hard links share it
+        stat = file.stat()
+        stored = Path(objects, f"{hash_file(file)}-{stat.st_mode & 0o777:o}")
+        try:
+            if stored.exists():
+                file.unlink()
+                os.link(stored, file)
+                saved += stat.st_size
+            else:
+                os.link(file, stored)
+        except OSError as e:
+            # file systems without hard links keep full copies
+            if not file.exists():
+                shutil.copy2(stored, file)
+            print("can't deduplicate the install:", e)
+            break
+    return saved
+
+
+def resolve_version(link: str) -> str | None:
+    """the version a download link of an alias like 'stable' redirects to, None if the
+    redirect can't be followed or doesn't name a version"""
+    import requests
+
+    try:
+        response = requests.head(link, allow_redirects=True, timeout=60)
+    except requests.RequestException:
+        return None
+    # like https://dl.factorio.com/releases/factorio-headless_linux_2.0.15.tar.xz?secure=...
+    version = re.search(r"(\d+\.\d+\.\d+)\.tar", response.url)
+    return version.group(1) if version else None
+
+
+def install_version(version: str, sha256: str | None = None) -> str:
+    """installs a headless factorio into the version store, next to the other versions.
+    `version` is a version like '1.1.100' or 'stable'/'latest', which is resolved to the
+    version it currently stands for. Nothing is downloaded if the version is already stored.
+    Returns the installed version."""
+    link = DOWNLOAD_LINK.format(version=version)
+    if not re.fullmatch(r"\d+\.\d+\.\d+", version):
+        version = resolve_version(link) or version
+    if Path(version_binary(version)).is_file():
+        return version
+    part = Path(VERSION_STORE, f"{version}.part")
+    shutil.rmtree(part, ignore_errors=True)
+    part.mkdir(parents=True)
+    print(f"installing factorio {version} into {VERSION_STORE}")
+    install_factorio(link, sha256, str(part))
+    installed = get_factorio_version(PurePath(part, "factorio", "bin", "x64", "factorio"))
+    if Path(version_binary(installed)).is_file():
+        print(f"{version} is {installed}, which is already installed")
+    else:
+        saved = dedupe_install(Path(part, "factorio"))
+        print(f"{saved / 1e6:.1f} MB shared with the other versions")
+        os.replace(Path(part, "factorio"), Path(VERSION_STORE, installed))
+    shutil.rmtree(part)
+    return installed
 
 
 # for mypy
@@ -187,6 +867,675 @@ def remove_character_from_string(s: str, char: str = "\r") -> str:
     return s.replace(char, "")
 
 
+def parse_tick_line(line: str) -> list[int] | None:
+    """returns the metrics of a `--benchmark-verbose` tick line, None for any other line"""
+    if not line.startswith("t") or not line[1:2].isdigit():
+        return None
+    fields = line.split(",")
+    if len(fields) < len(outheader) + 1:
+        return None
+    try:
+        return [int(field) for field in fields[1 : len(outheader) + 1]]
+    except ValueError:
+        return None
+
+
+def read_benchmark_log(stream: IO[bytes]) -> Iterator[tuple[str, list[int] | None]]:
+    """yields every line of the factorio output as it arrives, together with the parsed
+    tick metrics if it is a tick line."""
+    for raw_line in stream:
+        line = remove_character_from_string(raw_line.decode(errors="replace").rstrip("\n"))
+        yield line, parse_tick_line(line)
+
+
+def parse_cpu_list(cpu_list: str) -> list[int]:
+    """parses a linux cpu list like '0-3,8-11'"""
+    cpus: list[int] = []
+    for part in cpu_list.strip().split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+
+def get_core_sets(jobs: int) -> list[list[int]]:
+    """splits the available cpus into `jobs` disjoint core sets. On linux every set is kept
+    inside one L3 cache (or NUMA node) if possible."""
+    import psutil
+
+    available = sorted(psutil.Process().cpu_affinity() or range(psutil.cpu_count()))
+    domains: list[list[int]] = []
+    for pattern in (
+        "/sys/devices/system/cpu/cpu*/cache/index3/shared_cpu_list",
+        "/sys/devices/system/node/node*/cpulist",
+    ):
+        for domain_file in sorted(glob.glob(pattern)):
+            with open(domain_file) as f:
+                domain = [cpu for cpu in parse_cpu_list(f.read()) if cpu in available]
+            if domain and domain not in domains:
+                domains.append(domain)
+        if len(domains) > 1:
+            break
+    if len(domains) <= 1:
+        domains = [available]
+    return split_core_sets(domains, jobs)
+
+
+def split_core_sets(domains: list[list[int]], jobs: int) -> list[list[int]]:
+    """splits the cpus of the cache/NUMA domains into `jobs` disjoint core sets that don't
+    cross domain borders.
+
+    >>> split_core_sets([[0, 1, 2, 3], [4, 5, 6, 7]], 2)
+    [[0, 1, 2, 3], [4, 5, 6, 7]]
+    >>> split_core_sets([[0, 1, 2, 3], [4, 5, 6, 7]], 3)
+    [[0, 1], [4, 5], [2, 3]]
+    """
+    # split every domain into as many sets as it has to hold
+    per_domain = -(-jobs // len(domains))
+    core_sets: list[list[int]] = []
+    for domain in domains:
+        size = max(len(domain) // per_domain, 1)
+        core_sets.extend(domain[i * size : (i + 1) * size] for i in range(per_domain))
+    core_sets = [core_set for core_set in core_sets if core_set]
+    if len(core_sets) < jobs:
+        raise ValueError(f"can't split {sum(map(len, domains))} cpus into {jobs} core sets")
+    # spread the jobs over the domains instead of filling the first one up
+    return [core_sets[i] for i in sorted(range(len(core_sets)), key=lambda i: i % per_domain)][
+        :jobs
+    ]
+
+
+def create_instance_dir(instance: int | str) -> PurePath:
+    """creates a separate write directory for a factorio instance, so multiple instances can
+    run at the same time without their lock files colliding. returns the config file"""
+    instance_dir = Path("factorio", "instances", str(instance)).absolute()
+    instance_dir.mkdir(parents=True, exist_ok=True)
+    config = PurePath(instance_dir, "config.ini")
+    with open(config, "w") as f:
+        f.write("[path]\n")
+        f.write("read-data=__PATH__executable__/../../data\n")
+        f.write(f"write-data={instance_dir}\n")
+    return config
+
+
+class SaveStager:
+    """copies saves into a RAM backed directory (in /dev/shm by default) before they are
+    benchmarked, so factorio doesn't read them from a disk or network share while it loads.
+    A background thread stages the prefetched saves in order while the earlier ones run. The
+    copies are kept within `budget` bytes: copies nobody uses are evicted, oldest first,
+    otherwise the thread waits until a benchmark releases its copy. Saves larger than the
+    budget are loaded from where they are."""
+
+    def __init__(self, directory: str | None = None, budget: int = STAGE_BUDGET_MB << 20) -> None:
+        base = directory or ("/dev/shm" if Path("/dev/shm").is_dir() else tempfile.gettempdir())
+        Path(base).mkdir(parents=True, exist_ok=True)
+        self.directory = Path(tempfile.mkdtemp(prefix="factorio-benchmark-", dir=base))
+        self.budget = budget
+        self.condition = threading.Condition()
+        self.staged: dict[PurePath, Future[PurePath]] = {}
+        # the bytes of every staged copy, the users of every save and the unused copies in
+        # the order they were released
+        self.sizes: dict[PurePath, int] = {}
+        self.users: dict[PurePath, int] = {}
+        self.idle: dict[PurePath, None] = {}
+        self.closed = False
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def prefetch(self, maps: list[Path]) -> None:
+        """stages `maps` in this order in the background"""
+        with self.condition:
+            for map_ in maps:
+                if map_ not in self.staged:
+                    self.staged[map_] = self.executor.submit(self.stage, map_)
+
+    def stage(self, map_: PurePath) -> PurePath:
+        size = Path(map_).stat().st_size
+        if size > self.budget:
+            print(f"{map_} is larger than the staging budget, it is loaded from disk")
+            return map_
+        with self.condition:
+            while sum(self.sizes.values()) + size > self.budget:
+                if self.closed:
+                    return map_
+                if self.idle:
+                    self.evict(next(iter(self.idle)))
+                else:
+                    self.condition.wait()
+            self.sizes[map_] = size
+        target = Path(self.directory, PurePath(map_).relative_to(PurePath(map_).anchor))
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(map_, f"{target}.part")
+            os.replace(f"{target}.part", target)
+        except OSError as e:
+            print(f"staging {map_} failed, it is loaded from disk: {e}")
+            with self.condition:
+                del self.sizes[map_]
+                self.condition.notify_all()
+            return map_
+        return PurePath(target)
+
+    def evict(self, map_: PurePath) -> None:
+        """removes the staged copy of an unused save, with the condition held"""
+        del self.idle[map_]
+        del self.sizes[map_]
+        path = self.staged.pop(map_).result()
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+    def get(self, map_: Path) -> PurePath:
+        """the staged copy of `map_`, staged now if it wasn't prefetched. Until it is released
+        it isn't evicted."""
+        with self.condition:
+            if map_ not in self.staged:
+                self.staged[map_] = self.executor.submit(self.stage, map_)
+            self.users[map_] = self.users.get(map_, 0) + 1
+            self.idle.pop(map_, None)
+            future = self.staged[map_]
+        return future.result()
+
+    def release(self, map_: Path) -> None:
+        with self.condition:
+            self.users[map_] -= 1
+            if not self.users[map_] and map_ in self.sizes:
+                self.idle[map_] = None
+            self.condition.notify_all()
+
+    def close(self) -> None:
+        """stops staging and removes all staged copies"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.executor.shutdown(cancel_futures=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def pinned_command(command: list[str], cpus: list[int] | None) -> list[str] | None:
+    """`command` started by taskset, which pins itself to `cpus` before it executes factorio,
+    so every thread factorio starts inherits the affinity. None where taskset isn't there.
+    A `preexec_fn` would do the same, but it isn't safe with the threads of `-j`."""
+    if cpus is None or shutil.which("taskset") is None:
+        return None
+    return ["taskset", "--cpu-list", ",".join(map(str, cpus)), *command]
+
+
+def pin_process(pid: int, cpus: list[int]) -> None:
+    """restricts the process and all of its current threads to the given cpus"""
+    import psutil
+
+    process = psutil.Process(pid)
+    if not hasattr(process, "cpu_affinity"):
+        print("setting the cpu affinity isn't supported on this platform")
+        return
+    process.cpu_affinity(cpus)
+    if operatingsystem_codename == "linux":
+        for thread in process.threads():
+            with contextlib.suppress(psutil.NoSuchProcess):
+                psutil.Process(thread.id).cpu_affinity(cpus)
+
+
+class TelemetrySampler(threading.Thread):
+    """samples the resource usage of a factorio process and the load of the system every
+    `interval` seconds while it runs. The samples are timestamped with the monotonic clock in
+    ns, the clock factorio uses for its timestamp column on linux, so they line up with the
+    ticks. If `perf` is installed, its hardware counters are recorded as well."""
+
+    PERF_EVENTS = ["cycles", "instructions", "cache-misses", "branch-misses"]
+
+    def __init__(self, pid: int, interval: float) -> None:
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.samples: dict[str, list[float]] = {}
+        self.perf: subprocess.Popen[str] | None = None
+        self.perf_start = 0
+
+    def start_perf(self) -> None:
+        if operatingsystem_codename != "linux" or shutil.which("perf") is None:
+            return
+        command = ["perf", "stat", "-x", ",", "-e", ",".join(self.PERF_EVENTS)]
+        command += ["-I", str(max(int(self.interval * 1000), 10)), "-p", str(self.pid)]
+        self.perf_start = time.monotonic_ns()
+        self.perf = subprocess.Popen(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+
+    def sample(self, process: Any) -> None:
+        import psutil
+
+        sample = {"timestamp": time.monotonic_ns()}
+        cpu_times = process.cpu_times()
+        ctx_switches = process.num_ctx_switches()
+        sample |= {
+            "rss": process.memory_info().rss,
+            "user_time": cpu_times.user,
+            "system_time": cpu_times.system,
+            "voluntary_ctx_switches": ctx_switches.voluntary,
+            "involuntary_ctx_switches": ctx_switches.involuntary,
+        }
+        if operatingsystem_codename == "linux":
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            sample["minor_faults"] = int(fields[7])
+            sample["major_faults"] = int(fields[9])
+        frequency = psutil.cpu_freq()
+        if frequency is not None:
+            sample["cpu_frequency"] = frequency.current
+        sample["load"] = psutil.getloadavg()[0]
+        for name, value in sample.items():
+            self.samples.setdefault(name, []).append(value)
+
+    def run(self) -> None:
+        import psutil
+
+        self.start_perf()
+        try:
+            process = psutil.Process(self.pid)
+            while not self.stopped.is_set():
+                self.sample(process)
+                self.stopped.wait(self.interval)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, OSError):
+            pass
+
+    def read_perf(self) -> dict[str, npt.NDArray[Any]]:
+        """stops perf and returns its counters per interval, missing counts are nan"""
+        if self.perf is None:
+            return {}
+        if self.perf.poll() is None:
+            self.perf.send_signal(signal.SIGINT)
+        _, output = self.perf.communicate()
+        intervals: dict[float, dict[str, float]] = {}
+        for line in output.splitlines():
+            fields = line.split(",")
+            if len(fields) < 4 or fields[3] not in self.PERF_EVENTS:
+                continue
+            with contextlib.suppress(ValueError):
+                intervals.setdefault(float(fields[0]), {})[fields[3]] = float(fields[1])
+        times = sorted(intervals)
+        counters = {
+            f"perf_{event.replace('-', '_')}": np.array(
+                [intervals[t].get(event, np.nan) for t in times]
+            )
+            for event in self.PERF_EVENTS
+        }
+        counters["perf_timestamp"] = np.array(
+            [self.perf_start + int(t * 1e9) for t in times], dtype=np.int64
+        )
+        return counters
+
+    def stop(self) -> dict[str, npt.NDArray[Any]]:
+        """stops sampling and returns every metric as an array"""
+        self.stopped.set()
+        self.join()
+        length = len(self.samples.get("timestamp", []))
+        arrays: dict[str, npt.NDArray[Any]] = {
+            name: np.array(values, dtype=np.int64 if name == "timestamp" else np.float64)
+            for name, values in self.samples.items()
+            if len(values) == length
+        }
+        return arrays | self.read_perf()
+
+
+def save_telemetry(path: str, telemetry: dict[str, npt.NDArray[Any]], append: bool) -> None:
+    """saves the telemetry of a benchmark, with `append` it is added to the existing samples"""
+    if append and Path(path).exists():
+        with np.load(path) as existing:
+            telemetry = {
+                name: np.concatenate([existing[name], values])
+                for name, values in telemetry.items()
+                if name in existing
+            }
+    np.savez_compressed(path, **telemetry)
+
+
+def encode_column(values: npt.NDArray[np.int64]) -> bytes:
+    """delta encodes the (runs, ticks) values of a metric along the ticks. The zigzag mapped
+    deltas are split into byte planes, so the mostly empty high bytes compress to nothing.
+
+    >>> values = np.array([[5, 7, 6, 9], [1000, 998, 1003, 1003]])
+    >>> decode_column(encode_column(values), values.shape).tolist()
+    [[5, 7, 6, 9], [1000, 998, 1003, 1003]]
+    """
+    deltas = np.diff(values, axis=1, prepend=0).astype(np.int64)
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    return zigzag.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def decode_column(data: bytes, shape: tuple[int, ...]) -> npt.NDArray[np.int64]:
+    """the inverse of `encode_column`"""
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(8, -1)
+    zigzag = np.ascontiguousarray(planes.T).view(np.int64).reshape(shape)
+    deltas = (zigzag >> 1) ^ -(zigzag & 1)
+    return np.cumsum(deltas, axis=1)
+
+
+def archive_result(result_path: PurePath) -> bool:
+    """packs the log and the tick data of a result into `<result>.ticks`, a zip with the
+    header as json, the log lines without the tick rows and one compressed column per
+    metric. Results from before the tick data was stored separately are parsed from the
+    log. The text log and the `.npy` file are removed afterwards."""
+    tick_file = Path(f"{result_path}.npy")
+    with open(result_path) as f:
+        header: dict[str, Any] = json.loads(f.readline())
+        log: list[str] = []
+        rows: list[list[int]] = []
+        for line in f:
+            values = parse_tick_line(line.rstrip("\n"))
+            if values is None:
+                log.append(line)
+            elif not tick_file.exists():
+                rows.append(values)
+    if "timestamp" not in header:
+        header["timestamp"] = datetime.fromtimestamp(Path(result_path).stat().st_mtime).isoformat(
+            timespec="seconds"
+        )
+    if tick_file.exists():
+        tick_data: npt.NDArray[np.int64] = np.load(tick_file, mmap_mode="r")
+    else:
+        runs = len(header.get("avgs", []))
+        if runs == 0 or not rows or len(rows) % runs:
+            print(f"can't split the {len(rows)} ticks of {result_path} into {runs} runs")
+            return False
+        tick_data = np.array(rows, dtype=np.int64).reshape(runs, -1, len(outheader))
+    header["archive"] = {
+        "format": 1,
+        "shape": list(tick_data.shape[:2]),
+        "columns": outheader,
+        "encoding": "delta+zigzag+shuffle",
+    }
+    part_path = f"{result_path}{ARCHIVE_SUFFIX}.part"
+    with ZipFile(part_path, "w", ZIP_DEFLATED) as archive:
+        archive.writestr("header.json", json.dumps(header))
+        archive.writestr("log.txt", "".join(log))
+        for col, name in enumerate(outheader):
+            archive.writestr(f"columns/{name}.bin", encode_column(tick_data[:, :, col]))
+    del tick_data
+    os.replace(part_path, f"{result_path}{ARCHIVE_SUFFIX}")
+    os.remove(result_path)
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(tick_file)
+    return True
+
+
+def load_tick_data(
+    result_path: PurePath, columns: list[str] | None = None
+) -> npt.NDArray[np.int64]:
+    """the (runs, ticks, metrics) tick data of a result in ns, from the archive or the `.npy`
+    file of a result that isn't archived yet. With `columns` only these metrics are read."""
+    indices = [outheader.index(name) for name in columns or outheader]
+    if Path(f"{result_path}.npy").exists():
+        tick_data: npt.NDArray[np.int64] = np.load(f"{result_path}.npy", mmap_mode="r")
+        return tick_data if columns is None else tick_data[:, :, indices]
+    with ZipFile(f"{result_path}{ARCHIVE_SUFFIX}") as archive:
+        layout = json.loads(archive.read("header.json"))["archive"]
+        shape = tuple(layout["shape"])
+        tick_data = np.empty((*shape, len(indices)), dtype=np.int64)
+        for i, col in enumerate(indices):
+            data = archive.read(f"columns/{outheader[col]}.bin")
+            tick_data[:, :, i] = decode_column(data, shape)
+    return tick_data
+
+
+def find_results(folder: str, map_regex: str) -> list[Path]:
+    """the results in a result folder, archived or not"""
+    results = {
+        file.with_suffix("")
+        for file in Path(folder, "saves").glob(map_regex)
+        if file.suffix in (".npy", ARCHIVE_SUFFIX) and file.is_file()
+    }
+    return sorted(results)
+
+
+def convert_results(folder: str) -> None:
+    """archives all results in a result folder, also the ones of older versions"""
+    converted = 0
+    for file in sorted(Path(folder, "saves").rglob("*")):
+        if not file.is_file() or file.suffix in (".npy", ".npz", ".zip", ".part", ARCHIVE_SUFFIX):
+            continue
+        try:
+            header = read_result_header(file)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(header, dict) or "avgs" not in header:
+            continue
+        size = sum(part.stat().st_size for part in (file, Path(f"{file}.npy")) if part.exists())
+        if archive_result(file):
+            archived = Path(f"{file}{ARCHIVE_SUFFIX}").stat().st_size
+            print(f"{file}: {size / 1e6:.1f} MB -> {archived / 1e6:.1f} MB")
+            converted += 1
+    print(f"converted {converted} results in {folder}")
+
+
+class AbortRules:
+    """when a benchmark is given up: if one factorio call takes more than `max_seconds` of wall
+    time, or if a run of at least `min_ups_ticks` ticks is below `min_ups` and more runs are to
+    come. Factorio only reports how long a run took once it is over, so the slow run itself is
+    always finished, the check saves the runs after it. A benchmark whose last run is too slow
+    is kept."""
+
+    def __init__(
+        self,
+        max_seconds: float | None = None,
+        min_ups: float | None = None,
+        min_ups_ticks: int = 1000,
+    ) -> None:
+        self.max_seconds = max_seconds
+        self.min_ups = min_ups
+        self.min_ups_ticks = min_ups_ticks
+
+    def check_ups(self, ticks: int, run_ns: int) -> str | None:
+        """the reason to abort after a run of `ticks` ticks that took `run_ns`, None to go on
+
+        >>> AbortRules(min_ups=60, min_ups_ticks=100).check_ups(100, 100 * 20 * 10**6)
+        '50.0 UPS after 100 ticks, below 60'
+        """
+        if self.min_ups is None or ticks < self.min_ups_ticks or run_ns <= 0:
+            return None
+        ups = ticks * 1e9 / run_ns
+        if ups < self.min_ups:
+            return f"{ups:.1f} UPS after {ticks} ticks, below {self.min_ups:g}"
+        return None
+
+
+def format_duration(seconds: float | None) -> str:
+    """`seconds` as h:mm:ss, '?' if it is unknown"""
+    return str(timedelta(seconds=round(seconds))) if seconds is not None else "?"
+
+
+class SessionProgress:
+    """the progress of a benchmark session, shared by all parallel instances. Every `interval`
+    seconds the running benchmarks are printed with their UPS and the ETA of the session. The
+    ETA is the game time of the remaining ticks, predicted from the history or the ticks so
+    far, scaled by the wall time the session took per second of game time until now. Factorio
+    reports the ticks of a run only once it is over, so the progress moves a run at a time."""
+
+    def __init__(self, interval: float = 10) -> None:
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.last_print = self.start
+        # the ticks and predicted tick time in ms of every map
+        self.planned: dict[str, tuple[int, float | None]] = {}
+        self.ticks: dict[str, int] = {}
+        self.game_ns: dict[str, int] = {}
+        self.running: dict[str, dict[str, Any]] = {}
+        self.finished: set[str] = set()
+        self.aborted: dict[str, str] = {}
+
+    def plan(self, name: str, ticks: int, tick_ms: float | None) -> None:
+        """adds a map with `ticks` ticks over all runs, predicted to take `tick_ms` per tick"""
+        with self.lock:
+            self.planned[name] = (ticks, tick_ms)
+
+    def update(
+        self,
+        name: str,
+        run: int,
+        runs: int,
+        tick: int,
+        ticks: int,
+        new_ticks: int,
+        new_ns: int,
+    ) -> None:
+        """reports `new_ticks` more ticks of `name` that took `new_ns` of game time, it is now
+        at `tick` of `ticks` in run `run` of `runs`"""
+        with self.lock:
+            self.ticks[name] = self.ticks.get(name, 0) + new_ticks
+            self.game_ns[name] = self.game_ns.get(name, 0) + new_ns
+            self.running[name] = {
+                "run": run,
+                "runs": runs,
+                "tick": tick,
+                "ticks": ticks,
+                "ups": new_ticks * 1e9 / new_ns if new_ns > 0 else 0.0,
+            }
+            now = time.monotonic()
+            if now - self.last_print < self.interval:
+                return
+            self.last_print = now
+        self.print_status()
+
+    def finish(self, name: str) -> None:
+        with self.lock:
+            self.running.pop(name, None)
+            self.finished.add(name)
+
+    def abort(self, name: str, reason: str) -> None:
+        with self.lock:
+            self.running.pop(name, None)
+            self.aborted[name] = reason
+
+    def snapshot(self) -> dict[str, Any]:
+        """the state of the session, as served on /progress"""
+        with self.lock:
+            elapsed = time.monotonic() - self.start
+            observed = {
+                name: self.game_ns[name] / 1e6 / ticks
+                for name, ticks in self.ticks.items()
+                if ticks
+            }
+            predicted = [tick_ms for _, tick_ms in self.planned.values() if tick_ms is not None]
+            if predicted:
+                fallback: float | None = statistics.median(predicted)
+            else:
+                fallback = statistics.median(observed.values()) if observed else None
+            remaining: float | None = 0.0
+            maps = {}
+            for name, (planned, tick_ms) in self.planned.items():
+                done = self.ticks.get(name, 0)
+                state = "planned"
+                if name in self.aborted:
+                    state = "aborted"
+                elif name in self.finished:
+                    state = "done"
+                elif name in self.running:
+                    state = "running"
+                maps[name] = {
+                    "state": state,
+                    "ticks_done": done,
+                    "ticks_planned": planned,
+                    **(self.running.get(name) or {}),
+                }
+                if state in ("planned", "running"):
+                    cost = observed.get(name, tick_ms if tick_ms is not None else fallback)
+                    if cost is None or remaining is None:
+                        remaining = None
+                    else:
+                        remaining += max(planned - done, 0) * cost / 1000
+            game_seconds = sum(self.game_ns.values()) / 1e9
+            eta = None
+            if remaining is not None and game_seconds:
+                eta = remaining * elapsed / game_seconds
+            return {
+                "elapsed": elapsed,
+                "eta": eta,
+                "ticks_done": sum(self.ticks.values()),
+                "ticks_planned": sum(planned for planned, _ in self.planned.values()),
+                "maps": maps,
+            }
+
+    def eta(self) -> float | None:
+        """the seconds until all planned maps are benchmarked, None before the first ticks"""
+        return cast(float | None, self.snapshot()["eta"])
+
+    def print_status(self) -> None:
+        state = self.snapshot()
+        print(
+            f"[{format_duration(state['elapsed'])} elapsed, ETA {format_duration(state['eta'])}] "
+            f"{state['ticks_done']}/{state['ticks_planned']} ticks"
+        )
+        for name, info in state["maps"].items():
+            if info["state"] == "running":
+                print(
+                    f"  {name:58} run {info['run']}/{info['runs']} "
+                    f"tick {info['tick']}/{info['ticks']} {info['ups']:9.1f} UPS"
+                )
+
+    def metrics(self) -> str:
+        """the state of the session in the prometheus text format, as served on /metrics"""
+        state = self.snapshot()
+        lines = []
+
+        def gauge(name: str, samples: list[tuple[str, float]]) -> None:
+            lines.append(f"# TYPE factorio_benchmark_{name} gauge")
+            lines.extend(f"factorio_benchmark_{name}{labels} {value}" for labels, value in samples)
+
+        def label(map_name: str) -> str:
+            escaped = map_name.replace("\\", "\\\\").replace('"', '\\"')
+            return f'{{map="{escaped}"}}'
+
+        gauge("elapsed_seconds", [("", state["elapsed"])])
+        if state["eta"] is not None:
+            gauge("eta_seconds", [("", state["eta"])])
+        gauge("ticks_done", [("", state["ticks_done"])])
+        gauge("ticks_planned", [("", state["ticks_planned"])])
+        counts: dict[str, int] = {state: 0 for state in ("planned", "running", "done", "aborted")}
+        for info in state["maps"].values():
+            counts[info["state"]] += 1
+        gauge("maps", [(f'{{state="{name}"}}', count) for name, count in counts.items()])
+        running = {name: info for name, info in state["maps"].items() if info["state"] == "running"}
+        for key in ("ups", "run", "tick"):
+            gauge(key, [(label(name), info[key]) for name, info in running.items()])
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer(ThreadingHTTPServer):
+    def __init__(self, address: tuple[str, int], progress: SessionProgress) -> None:
+        super().__init__(address, MetricsHandler)
+        self.progress = progress
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """the progress of a benchmark session:
+    GET /metrics   -> prometheus text format
+    GET /progress  -> json
+    """
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def do_GET(self) -> None:
+        progress = cast(MetricsServer, self.server).progress
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            data = progress.metrics().encode()
+            content_type = "text/plain; version=0.0.4"
+        elif path == "/progress":
+            data = json.dumps(progress.snapshot()).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
 def run_benchmark(
     map_: PurePath,
     folder: str,
@@ -196,25 +1545,57 @@ def run_benchmark(
     save: bool = True,
     disable_mods: bool = True,
     high_priority: bool | None = None,
-) -> None:
+    cpus: list[int] | None = None,
+    config: PurePath | None = None,
+    previous: tuple[npt.NDArray[np.int64], list[float]] | None = None,
+    header: dict[str, Any] | None = None,
+    mods_dir: PurePath | None = None,
+    telemetry: float | None = None,
+    skipticks: int | None = 0,
+    progress: SessionProgress | None = None,
+    abort: AbortRules | None = None,
+    staged: PurePath | None = None,
+) -> list[float] | None:
     """Run a benchmark on the given map with the specified number of ticks and
-    runs."""
+    runs. Factorio loads the map from `staged` if it was staged, the load time of the map is
+    measured separately from the ticks. The tick data and run averages of `previous` runs
+    are merged into the result, `header` is added to the header of the result file.
+    `mods_dir` overrides the mod directory, otherwise the mods are synced into
+    'factorio/mods'. With `telemetry` the process and system are sampled every `telemetry`
+    seconds. The tick statistics in the header leave out the first `skipticks` ticks, None
+    detects the warm-up. Every run is reported to `progress` once factorio is done with it, a
+    run that breaks one of the `abort` rules stops factorio and fails the benchmark.
+    Returns the average tick time of every run or None if the benchmark failed."""
+    import psutil
+
     if not factorio_bin:
         factorio_bin = PurePath("factorio", "bin", "x64", "factorio")
     # setting mods
-    if not disable_mods:
-        sync_mods(map_)
+    if not disable_mods and mods_dir is None:
+        with mods_lock:
+            sync_mods(map_)
 
     print("Running benchmark...")
     # Get Version
     version: str = get_factorio_version(factorio_bin, True)
     # psutil.Popen on Linux it doesn't work well with str()
     command: list[str] = [str(factorio_bin)]
-    command.extend(["--benchmark", str(map_)])
+    command.extend(["--benchmark", str(staged or map_)])
     command.extend(["--benchmark-ticks", str(ticks)])
     command.extend(["--benchmark-runs", str(runs)])
     command.extend(["--benchmark-verbose", "all"])
     command.extend(["--benchmark-sanitize"])
+    if config is not None:
+        # separate write dir
+        command.extend(["--config", str(config)])
+    if mods_dir is not None:
+        command.extend(["--mod-directory", str(Path(mods_dir).absolute())])
+    elif config is not None:
+        command.extend(["--mod-directory", str(Path("factorio", "mods").absolute())])
+    pinned = pinned_command(command, cpus)
+    # the monotonic time factorio is started at, the log times are relative to it
+    start_ns = time.monotonic_ns()
+    process = psutil.Popen(pinned or command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
     if high_priority is True:
         priority = {
             "linux": -20,
@@ -222,297 +1603,2388 @@ def run_benchmark(
             "cygwin": 128,
         }[operatingsystem_codename]
         print("nice = ", priority)
-        process = psutil.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         process.nice(priority)
-    else:
-        process = psutil.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if cpus is not None and pinned is None:
+        # too late for the threads factorio started in the meantime, but the best there is
+        pin_process(process.pid, cpus)
+    sampler = None
+    if telemetry is not None:
+        sampler = TelemetrySampler(process.pid, telemetry)
+        sampler.start()
 
-    factorio_log, err = map(
-        lambda a: remove_character_from_string(a.decode(), "\r"), process.communicate()
-    )
+    aborted: list[str] = []
 
-    if "Performed" not in factorio_log:
-        print("Benchmark failed")
-        print(factorio_log)
-        print(err)
-    else:
+    def stop(reason: str) -> None:
+        if not aborted:
+            aborted.append(reason)
+            with contextlib.suppress(psutil.NoSuchProcess):
+                process.terminate()
+
+    timer = None
+    if abort is not None and abort.max_seconds is not None:
+        timer = threading.Timer(
+            abort.max_seconds, stop, [f"still running after {abort.max_seconds:g} s"]
+        )
+        timer.daemon = True
+        timer.start()
+
+    # the log is read line by line and written out straight away so memory stays flat
+    # no matter how many ticks or runs are requested.
+    result_path = PurePath(folder, PurePath(map_).parent, PurePath(map_).stem)
+    part_path = PurePath(f"{result_path}.part")
+    lastlines: deque[str] = deque(maxlen=20)
+    previous_runs = len(previous[1]) if previous is not None else 0
+    total_runs = previous_runs + runs
+    avgs: list[float] = list(previous[1]) if previous is not None else []
+    # the tick metrics are also stored as a (runs, ticks, metrics) array for the aggregation
+    tick_data: npt.NDArray[np.int64] | None = None
+    if save:
+        tick_data = np.lib.format.open_memmap(  # type: ignore[no-untyped-call]
+            f"{result_path}.npy",
+            mode="w+",
+            dtype=np.int64,
+            shape=(total_runs, ticks, len(outheader)),
+        )
+    if tick_data is not None and previous is not None:
+        tick_data[:previous_runs] = previous[0]
+    row = previous_runs * ticks
+    name = str(PurePath(map_).with_suffix(""))
+    # the log time of 'Loading map', the log time of the last line before the first run and
+    # the timestamp of the first tick
+    load_start: float | None = None
+    load_end: float | None = None
+    first_tick_ns: int | None = None
+    with open(part_path if save else os.devnull, "w", buffering=WRITE_BUFFER_SIZE) as part:
+        for line, values in read_benchmark_log(process.stdout):
+            lastlines.append(line)
+            if values is not None and row < total_runs * ticks:
+                if row == previous_runs * ticks:
+                    first_tick_ns = values[0]
+                if tick_data is not None:
+                    tick_data[row // ticks, row % ticks] = values
+                row += 1
+            if "Performed" in line:
+                # the tick rows only come after the last run, this line comes after every run
+                run_ms = float(line.split()[-2])
+                avgs.append(run_ms / ticks)
+                run_ns = int(run_ms * 1e6)
+                if progress is not None:
+                    progress.update(name, len(avgs), total_runs, ticks, ticks, ticks, run_ns)
+                if (
+                    abort is not None
+                    and len(avgs) < total_runs
+                    and (reason := abort.check_ups(ticks, run_ns)) is not None
+                ):
+                    stop(reason)
+            if values is None:
+                # the tick rows are already in the tick data
+                part.write(line + "\n")
+                if len(avgs) == previous_runs and (log_time := LOG_TIME.match(line)):
+                    if "Loading map" in line:
+                        load_start = float(log_time.group(1))
+                    load_end = float(log_time.group(1))
+    if timer is not None:
+        timer.cancel()
+    process.wait()
+    process.stdout.close()
+    samples = sampler.stop() if sampler is not None else None
+
+    if tick_data is not None:
+        if row < total_runs * ticks:
+            # only keep the runs that were completely logged
+            if not aborted:
+                print(f"only got {row} of {total_runs * ticks} ticks")
+            complete = np.array(tick_data[: row // ticks])
+            del tick_data
+            np.save(f"{result_path}.npy", complete)
+        else:
+            del tick_data
+
+    if aborted or len(avgs) == previous_runs:
+        if aborted:
+            print(f"Benchmark aborted: {aborted[0]}")
+            if progress is not None:
+                progress.abort(name, aborted[0])
+        else:
+            print("Benchmark failed")
+            print("\n".join(lastlines))
         if save:
-            # print(factorio_log)
-            print(version)
-            avgs = [
-                float(line.split()[-2]) / ticks
-                for line in factorio_log.split("\n")
-                if "Performed" in line
-            ]
-            avg = statistics.mean(avgs)
-            ups = 1000 / avg
-            avgs_str: list[str] = [f"{i:.3f}" for i in avgs]
-            print("Map benchmarked at:")
-            print("avg = {:.3f} ms {}".format(avg, avgs_str))
-            print("{:.3f} UPS".format(ups))
-            print()
-            out: dict[str, str | float | list[str]] = dict()
-            out["version"] = version
-            out["avg"] = avg
-            out["ups"] = ups
-            out["avgs"] = avgs_str
-            filtered_output = [str(json.dumps(out))]
-            filtered_output.extend(
-                [line for line in factorio_log.split("\n") if "ed" in line or "t" in line]
-            )
-            with open(PurePath(folder, PurePath(map_).parent, PurePath(map_).stem), "x") as f:
-                f.write("\n".join(filtered_output))
+            os.remove(part_path)
+            os.remove(f"{result_path}.npy")
+        return None
+    load_time = None
+    if load_start is not None and first_tick_ns is not None:
+        # the ticks are timestamped with the monotonic clock, the loading ends where they start.
+        # Lines logged during the runs don't count.
+        first_tick = (first_tick_ns - start_ns) / 1e9
+        if load_start <= first_tick <= (time.monotonic_ns() - start_ns) / 1e9:
+            load_time = first_tick - load_start
+    if load_time is None and load_start is not None and load_end is not None:
+        # the timestamps use another clock, the last line before the first run is the closest
+        load_time = load_end - load_start
+    if load_time is not None:
+        print(f"map loaded in {load_time:.3f} s")
+    if save:
+        out = summarize_runs(version, avgs)
+        if load_time is not None:
+            out["load_time"] = round(load_time, 3)
+        if previous is not None:
+            out["cached_runs"] = previous_runs
+        if cpus is not None:
+            out["cpus"] = cpus
+        out |= summarize_ticks(np.load(f"{result_path}.npy", mmap_mode="r"), skipticks)
+        out |= header or {}
+        with open(result_path, "x") as f, open(part_path, "r") as part:
+            f.write(json.dumps(out) + "\n")
+            shutil.copyfileobj(part, f, WRITE_BUFFER_SIZE)
+        os.remove(part_path)
+        if samples is not None:
+            save_telemetry(f"{result_path}_telemetry.npz", samples, append=previous is not None)
+    return avgs
 
 
-def migrate_folder(
-    inplace: bool = False,
-    factorio_bin: str | None = None,
-    map_regex: str = "*",
-    filenames: list[Path] | list[str] | None = None,
-    custom_script: str | None = None,
-) -> None:
-    factorio_path = PurePath(
-        factorio_bin if factorio_bin else PurePath("factorio", "bin", "x64", "factorio")
-    )
+def summarize_runs(version: str, avgs: list[float]) -> dict[str, Any]:
+    """prints the result of the runs and returns it as the header of the result file"""
+    print(version)
+    avg = statistics.mean(avgs)
+    ups = 1000 / avg
+    avgs_str: list[str] = [f"{i:.3f}" for i in avgs]
+    print("Map benchmarked at:")
+    print("avg = {:.3f} ms {}".format(avg, avgs_str))
+    print("{:.3f} UPS".format(ups))
+    error = relative_error(avgs)
+    if len(avgs) > 1:
+        print("95% confidence interval: ± {:.3f} ms ({:.2%})".format(error * avg, error))
+    print()
+    out: dict[str, Any] = dict()
+    out["version"] = version
+    out["timestamp"] = datetime.now().isoformat(timespec="seconds")
+    out["avg"] = avg
+    out["ups"] = ups
+    out["avgs"] = avgs_str
+    if len(avgs) > 1:
+        out["ci95"] = error * avg
+        out["relative_error"] = error
+    return out
+
+
+def tick_statistics(
+    tick_data: npt.NDArray[np.int64], budget: float = TICK_BUDGET_MS
+) -> dict[str, npt.NDArray[np.float64]]:
+    """the distribution of every metric over all runs and ticks of (runs, ticks, metrics) tick
+    data in ns. Besides mean, std, max and percentiles it counts the ticks over the `budget`
+    in ms, the streaks of consecutive ticks over it and the length of the longest streak. The
+    metrics are done one at a time, so only a copy of one column is held in memory.
+
+    >>> data = np.array([[[5], [20], [20], [5], [20]], [[5], [5], [5], [5], [30]]]) * 10**6
+    >>> stats = tick_statistics(data)
+    >>> [stats[name][0].item() for name in ("max", "over_budget", "streaks", "longest_streak")]
+    [30.0, 4.0, 3.0, 2.0]
+    """
+    names = ["mean", "std", "max", "over_budget", "streaks", "longest_streak"]
+    names += [f"p{q:g}" for q in PERCENTILES]
+    stats = {name: np.empty(tick_data.shape[-1]) for name in names}
+    for col in range(tick_data.shape[-1]):
+        data = tick_data[:, :, col].astype(np.float64)
+        data /= 1e6
+        stats["mean"][col] = data.mean()
+        stats["std"][col] = data.std()
+        stats["max"][col] = data.max()
+        for q, value in zip(PERCENTILES, np.percentile(data, PERCENTILES)):
+            stats[f"p{q:g}"][col] = value
+        over = data > budget
+        del data
+        # the length of the streak every tick belongs to, reset by every tick within the budget
+        count = np.cumsum(over, axis=1)
+        streak = count - np.maximum.accumulate(np.where(over, 0, count), axis=1)
+        stats["over_budget"][col] = over.sum()
+        stats["streaks"][col] = over[:, 0].sum() + (over[:, 1:] & ~over[:, :-1]).sum()
+        stats["longest_streak"][col] = streak.max()
+    return stats
+
+
+def stored_statistics(
+    result_path: PurePath, skipticks: int
+) -> dict[str, npt.NDArray[np.float64]] | None:
+    """the tick statistics the header of a result holds for `skipticks`, like
+    `tick_statistics` returns them but with nan for the timestamp. None if there are none."""
+    try:
+        header = read_result_header(result_path)
+    except (OSError, ValueError, KeyError, BadZipFile):
+        return None
+    statistics = header.get("statistics")
+    if header.get("skipticks") != skipticks or not isinstance(statistics, dict):
+        return None
+    if any(metric not in statistics for metric in outheader[1:]):
+        return None
+    return {
+        name: np.array([np.nan] + [statistics[metric][name] for metric in outheader[1:]])
+        for name in statistics[outheader[1]]
+    }
+
+
+def detect_warmup(series: npt.NDArray[np.float64], batch: int = 5) -> int:
+    """the number of leading ticks to discard before `series` is in its steady state, found
+    with MSER-5: the ticks are averaged in batches of 5 and the truncation point is the one
+    that minimizes the standard error of the mean of the remaining batches. Only the first
+    half of the series is considered.
+
+    >>> detect_warmup(np.array([9.0] * 40 + [1.0, 2.0] * 100))
+    40
+    """
+    n = len(series) // batch
+    if n < 2:
+        return 0
+    batches = np.asarray(series[: n * batch], dtype=np.float64).reshape(n, batch).mean(axis=1)
+    # sums of all batches from d on, for every truncation point d
+    sums = np.cumsum(batches[::-1])[::-1]
+    squares = np.cumsum((batches**2)[::-1])[::-1]
+    remaining = np.arange(n, 0, -1)
+    mser = (squares - sums**2 / remaining) / remaining**2
+    return int(np.argmin(mser[: n // 2])) * batch
+
+
+def resolve_skipticks(tick_data: npt.NDArray[np.int64], skipticks: int | None) -> int:
+    """`skipticks`, or the detected warm-up of the median wholeUpdate time if it is None"""
+    if skipticks is not None:
+        return skipticks
+    whole = np.median(tick_data[:, :, outheader.index("wholeUpdate")], axis=0)
+    detected = detect_warmup(whole)
+    if detected >= len(whole) // 2 - 5:
+        print("the tick time didn't settle in the first half, consider running more ticks")
+    return detected
+
+
+def result_skipticks(
+    result_path: PurePath, tick_data: npt.NDArray[np.int64], skipticks: int | None
+) -> int:
+    """the ticks to skip for the tick data of a result, with automatic detection the value
+    recorded in the result header is used"""
+    if skipticks is not None:
+        return skipticks
+    with contextlib.suppress(OSError, ValueError, KeyError, TypeError):
+        return int(read_result_header(result_path)["skipticks"])
+    return resolve_skipticks(tick_data, None)
+
+
+def summarize_ticks(tick_data: npt.NDArray[np.int64], skipticks: int | None) -> dict[str, Any]:
+    """prints the tail latency of the tick time and returns the statistics of every metric
+    for the header of the result file. If `skipticks` is None it is detected."""
+    if skipticks is None:
+        skipticks = resolve_skipticks(tick_data, None)
+        print(f"skipping the first {skipticks} ticks")
+    if tick_data[:, skipticks:].size == 0:
+        return {"skipticks": skipticks}
+    stats = tick_statistics(tick_data[:, skipticks:])
+    whole = outheader.index("wholeUpdate")
+    print(
+        "p99 = {:.3f} ms, p99.9 = {:.3f} ms, max = {:.3f} ms".format(
+            stats["p99"][whole], stats["p99.9"][whole], stats["max"][whole]
+        )
+    )
+    print(
+        "{:.0f} ticks over {:.2f} ms in {:.0f} streaks, the longest {:.0f} ticks".format(
+            stats["over_budget"][whole],
+            TICK_BUDGET_MS,
+            stats["streaks"][whole],
+            stats["longest_streak"][whole],
+        )
+    )
+    print()
+    # the timestamp isn't a duration
+    return {
+        "skipticks": skipticks,
+        "statistics": {
+            metric: {name: round(values[col].item(), 4) for name, values in stats.items()}
+            for col, metric in enumerate(outheader)
+            if col > 0
+        },
+    }
+
+
+def hash_file(path: PurePath) -> str:
+    """sha256 of the file content"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(WRITE_BUFFER_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_mods_fingerprint(disable_mods: bool, mods_dir: PurePath | None = None) -> str:
+    """fingerprint of the mods in `mods_dir`, by default the ones that are currently synced
+    into 'factorio/mods'"""
+    if disable_mods:
+        return "disabled"
+    sha256 = hashlib.sha256()
+    mods_dir = Path(mods_dir or PurePath("factorio", "mods"))
+    with contextlib.suppress(FileNotFoundError):
+        sha256.update(Path(mods_dir, "mod-list.json").read_bytes())
+    for mod in sorted(mods_dir.glob("*.zip")):
+        sha256.update(f"{mod.name}:{mod.stat().st_size}".encode())
+    return sha256.hexdigest()
+
+
+def result_cache_key(map_: PurePath, version: str, mods: str, ticks: int) -> str:
+    """the key of a map in the result cache. The number of runs isn't part of it, so runs can
+    be added to an existing entry."""
+    key = json.dumps([hash_file(map_), version, mods, ticks])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def load_cached_result(key: str) -> tuple[npt.NDArray[np.int64], list[float]] | None:
+    """returns the tick data and run averages stored in the result cache"""
+    entry = PurePath(RESULT_CACHE, key)
+    try:
+        with open(f"{entry}.json") as f:
+            avgs: list[float] = json.load(f)["avgs"]
+        tick_data: npt.NDArray[np.int64] = np.load(f"{entry}.npy", mmap_mode="r")
+    except FileNotFoundError:
+        return None
+    if len(tick_data) != len(avgs):
+        print("broken cache entry", key)
+        return None
+    return tick_data, avgs
+
+
+def store_cached_result(
+    key: str, map_: PurePath, version: str, ticks: int, tick_data_file: str, avgs: list[float]
+) -> None:
+    """stores the runs of a benchmark in the result cache, replacing the previous entry"""
+    Path(RESULT_CACHE).mkdir(parents=True, exist_ok=True)
+    entry = PurePath(RESULT_CACHE, key)
+    # replaced instead of overwritten, the old entry might still be memory mapped
+    shutil.copyfile(tick_data_file, f"{entry}.npy.part")
+    os.replace(f"{entry}.npy.part", f"{entry}.npy")
+    with open(f"{entry}.json", "w") as f:
+        json.dump({"map": str(map_), "version": version, "ticks": ticks, "avgs": avgs}, f)
+
+
+def relative_error(avgs: list[float]) -> float:
+    """half width of the 95% confidence interval of the mean, relative to the mean"""
+    if len(avgs) < 2:
+        return float("inf")
+    t = T_975[len(avgs) - 2] if len(avgs) - 2 < len(T_975) else 1.96
+    return t * statistics.stdev(avgs) / math.sqrt(len(avgs)) / statistics.mean(avgs)
+
+
+def missing_runs(
+    avgs: list[float], runs: int, target_error: float | None, max_runs: int, batch_size: int
+) -> int:
+    """the number of runs that still have to be benchmarked. Without a target error that's
+    just what's missing to `runs`, otherwise batches are added until the target is reached."""
+    if len(avgs) < runs:
+        return runs - len(avgs)
+    if target_error is None or len(avgs) >= max_runs or relative_error(avgs) <= target_error:
+        return 0
+    return min(batch_size, max_runs - len(avgs))
+
+
+def find_maps(
+    map_regex: str, filenames: list[Path] | list[PurePath] | list[str] | None = None
+) -> list[Path]:
+    """the given files or the saves matching `map_regex`, without the manifests"""
+    if filenames:
+        return [Path(file) for file in filenames]
+    return [file for file in Path("saves").glob(map_regex) if file.name != MANIFEST_NAME]
+
+
+def load_manifest(map_: PurePath) -> dict[str, Any]:
+    """the settings of a map from the manifests in its folder and the folders above it. A
+    manifest sets ticks, runs, priority and description for every map below it, the entries
+    in its "maps" object override them for single maps (by file name without .zip). Settings
+    of deeper folders win."""
+    settings: dict[str, Any] = {}
+    folder = PurePath()
+    for part in PurePath(map_).parent.parts:
+        folder = PurePath(folder, part)
+        try:
+            with open(PurePath(folder, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            continue
+        except ValueError as e:
+            print(f"ignoring the broken manifest {PurePath(folder, MANIFEST_NAME)}: {e}")
+            continue
+        settings |= {key: value for key, value in manifest.items() if key != "maps"}
+        settings |= manifest.get("maps", {}).get(PurePath(map_).stem, {})
+    return settings
+
+
+def allocate_runs(
+    costs: list[float],
+    deviations: list[float],
+    priorities: list[float],
+    budget: float,
+    min_runs: int = 2,
+) -> list[int]:
+    """splits a time `budget` into runs per map. Every map gets `min_runs`, then the runs are
+    added one at a time where they reduce the priority weighted variance of the mean
+    (deviation² / runs) the most per second of cost, which minimizes the total error.
+
+    >>> allocate_runs([1, 1, 4], [0.01, 0.04, 0.04], [1, 1, 1], 30)
+    [3, 11, 4]
+    """
+    runs = [min_runs] * len(costs)
+    remaining = budget - sum(cost * min_runs for cost in costs)
+    if remaining < 0:
+        print(f"the time budget is too small for {min_runs} runs of every map")
+        return runs
+
+    def gain(i: int) -> float:
+        variance = priorities[i] * deviations[i] ** 2
+        return (variance / runs[i] - variance / (runs[i] + 1)) / costs[i]
+
+    heap = [(-gain(i), i) for i in range(len(costs))]
+    heapq.heapify(heap)
+    while heap:
+        _, i = heapq.heappop(heap)
+        if costs[i] > remaining:
+            continue
+        runs[i] += 1
+        remaining -= costs[i]
+        heapq.heappush(heap, (-gain(i), i))
+    return runs
+
+
+def plan_time_budget(
+    files: list[Path],
+    settings: dict[Path, dict[str, Any]],
+    budget: float,
+    database: str = HISTORY_DATABASE,
+) -> dict[Path, int]:
+    """the runs of every map that fit into `budget` seconds. The duration of a run is
+    predicted from the tick time of the map in the history, its variation from the spread of
+    the run means. Maps without history get the median of the others."""
+    history = history_costs(database, get_hardware_fingerprint()["id"])
+    known = [
+        history[str(file.with_suffix(""))] for file in files if str(file.with_suffix("")) in history
+    ]
+    default = (
+        statistics.median(cost for cost, _ in known) if known else 10.0,
+        statistics.median(deviation for _, deviation in known) if known else 0.02,
+    )
+    costs, deviations = [], []
+    for file in files:
+        tick_time, deviation = history.get(str(file.with_suffix("")), default)
+        costs.append(settings[file]["ticks"] * tick_time / 1000)
+        deviations.append(deviation)
+    priorities = [float(settings[file].get("priority", 1)) for file in files]
+    runs = allocate_runs(costs, deviations, priorities, budget)
+    print(f"planned {sum(r * c for r, c in zip(runs, costs)):.0f} s of the {budget:.0f} s budget")
+    for file, file_runs, cost in zip(files, runs, costs):
+        print(f"{str(file):60} {file_runs:4} runs of {cost:8.1f} s")
+    return dict(zip(files, runs))
+
+
+def benchmark_map(
+    map_: PurePath,
+    folder: str,
+    ticks: int,
+    runs: int,
+    factorio_bin: PurePath,
+    disable_mods: bool = True,
+    high_priority: bool | None = None,
+    cpus: list[int] | None = None,
+    config: PurePath | None = None,
+    use_cache: bool = True,
+    target_error: float | None = None,
+    max_runs: int = 0,
+    batch_size: int = 2,
+    telemetry: float | None = None,
+    skipticks: int | None = 0,
+    description: str | None = None,
+    progress: SessionProgress | None = None,
+    abort: AbortRules | None = None,
+    staged: PurePath | None = None,
+) -> None:
+    """benchmarks a map, runs that are already in the result cache are reused and only the
+    missing runs are benchmarked. With a `target_error` further batches of runs are added
+    until the confidence interval of the mean tick time is small enough or `max_runs` is
+    reached. `progress`, `abort` and `staged` are passed on to `run_benchmark`."""
+    mods_dir = None if disable_mods else prepare_mods(map_)
+    version = get_factorio_version(factorio_bin, True)
+    max_runs = max(max_runs, runs)
+    result_path = PurePath(folder, PurePath(map_).parent, PurePath(map_).stem)
+
+    mods = get_mods_fingerprint(disable_mods, mods_dir)
+    header: dict[str, Any] = {"mods": mods, "hardware": get_hardware_fingerprint()}
+    if description:
+        header["description"] = description
+    key = None
+    previous = None
+    if use_cache:
+        key = result_cache_key(map_, version, mods, ticks)
+        previous = load_cached_result(key)
+    if previous is not None:
+        keep = runs if target_error is None else max_runs
+        previous = (previous[0][:keep], previous[1][:keep])
+        print(f"using {len(previous[1])} cached runs")
+    avgs = previous[1] if previous is not None else []
+
+    benchmarked = False
+    while needed := missing_runs(avgs, runs, target_error, max_runs, batch_size):
+        if benchmarked:
+            # the last batch becomes the base for the next one
+            os.replace(result_path, f"{result_path}.previous")
+            os.replace(f"{result_path}.npy", f"{result_path}.previous.npy")
+            previous = (np.load(f"{result_path}.previous.npy", mmap_mode="r"), avgs)
+            print(f"relative error {relative_error(avgs):.2%}, running {needed} more runs")
+        batch = run_benchmark(
+            map_,
+            folder,
+            ticks,
+            needed,
+            factorio_bin,
+            disable_mods=disable_mods,
+            high_priority=high_priority,
+            cpus=cpus,
+            config=config,
+            previous=previous,
+            header=header,
+            mods_dir=mods_dir,
+            telemetry=telemetry,
+            skipticks=skipticks,
+            progress=progress,
+            abort=abort,
+            staged=staged,
+        )
+        if benchmarked:
+            del previous
+            if batch is None:
+                os.replace(f"{result_path}.previous", result_path)
+                os.replace(f"{result_path}.previous.npy", f"{result_path}.npy")
+            else:
+                # keep the logs of the earlier batches, without their header
+                with open(result_path, "a") as f, open(f"{result_path}.previous") as old:
+                    old.readline()
+                    shutil.copyfileobj(old, f, WRITE_BUFFER_SIZE)
+                os.remove(f"{result_path}.previous")
+                os.remove(f"{result_path}.previous.npy")
+        if batch is None:
+            break
+        avgs = batch
+        benchmarked = True
+
+    if not benchmarked:
+        if previous is None:
+            return
+        # everything came from the cache
+        np.save(f"{result_path}.npy", previous[0])
+        out = summarize_runs(version, avgs) | summarize_ticks(previous[0], skipticks) | header
+        out["cached_runs"] = len(avgs)
+        with open(result_path, "x") as f:
+            f.write(json.dumps(out) + "\n")
+    elif key is not None:
+        store_cached_result(key, map_, version, ticks, f"{result_path}.npy", avgs)
+    if Path(result_path).is_file():
+        archive_result(result_path)
+
+
+def port_is_free(port: int, kind: socket.SocketKind) -> bool:
+    with socket.socket(socket.AF_INET, kind) as sock:
+        try:
+            sock.bind(("0.0.0.0", port))
+        except OSError:
+            return False
+    return True
+
+
+def allocate_ports(count: int, port: int = 12245, rcon_port: int = 12345) -> list[tuple[int, int]]:
+    """finds `count` free pairs of game (udp) and rcon (tcp) ports, starting at the defaults"""
+    pairs: list[tuple[int, int]] = []
+    while len(pairs) < count:
+        if port_is_free(port, socket.SOCK_DGRAM) and port_is_free(rcon_port, socket.SOCK_STREAM):
+            pairs.append((port, rcon_port))
+        port += 1
+        rcon_port += 1
+    return pairs
+
+
+def migrate_folder(
+    inplace: bool = False,
+    factorio_bin: str | None = None,
+    map_regex: str = "*",
+    filenames: list[Path] | list[str] | None = None,
+    custom_script: str | None = None,
+    jobs: int = 1,
+    retries: int = 2,
+) -> None:
+    """migrates all selected maps, with `jobs` servers at the same time. Every server gets
+    its own ports and write dir, failed migrations are retried."""
+    factorio_path = PurePath(
+        factorio_bin if factorio_bin else PurePath("factorio", "bin", "x64", "factorio")
+    )
+
+    files = [file for file in find_maps(map_regex, filenames) if file.is_file()]
+    if custom_script is None:
+        # saves that are already on the installed version are left alone
+        installed = get_factorio_version(factorio_path)
+        saves = index_saves(files)
+        current = [file for file in files if not needs_migration(saves[file]["version"], installed)]
+        if current:
+            print(f"{len(current)} saves are already on version {installed}")
+        files = [file for file in files if file not in current]
+
+    # every server gets its ports and write dir from a slot
+    slots: queue.Queue[tuple[int, int, PurePath | None]] = queue.Queue()
+    for instance, (port, rcon_port) in enumerate(allocate_ports(jobs)):
+        slots.put((port, rcon_port, create_instance_dir(f"server{instance}") if jobs > 1 else None))
+
+    def migrate_in_slot(file: Path) -> tuple[bool, int, float]:
+        import factorio_rcon
+
+        start = time.monotonic()
+        for attempt in range(1, retries + 2):
+            port, rcon_port, config = slots.get()
+            try:
+                if migrate_map(
+                    factorio_path, file, inplace, custom_script, port, rcon_port, config
+                ):
+                    return True, attempt, time.monotonic() - start
+            except (OSError, factorio_rcon.RCONBaseError) as e:
+                print(f"migrating {file} raised {e!r}")
+            finally:
+                slots.put((port, rcon_port, config))
+            print(f"migrating {file} failed (attempt {attempt})")
+        return False, retries + 1, time.monotonic() - start
+
+    summary: dict[Path, tuple[bool, int, float]] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {file: executor.submit(migrate_in_slot, file) for file in deepcopy(files)}
+        for file, future in futures.items():
+            summary[file] = future.result()
+
+    print("==================")
+    print("migration summary")
+    for file, (success, attempts, duration) in sorted(summary.items(), key=lambda x: -x[1][2]):
+        status = "ok" if success else "failed"
+        print(f"{str(file):60} {status:6} {duration:8.1f} s  {attempts} attempt(s)")
+    print(f"{sum(result[0] for result in summary.values())} of {len(summary)} maps migrated")
+
+    exit()
+
+
+def benchmark_folder(
+    ticks: int,
+    runs: int,
+    disable_mods: bool,
+    skipticks: int | None,
+    consistency: str | None,
+    map_regex: str = "*",
+    factorio_bin: str | None = None,
+    folder: str | None = None,
+    filenames: list[str] | list[PurePath] | None = None,
+    high_priority: bool | None = None,
+    jobs: int = 1,
+    use_cache: bool = True,
+    target_error: float | None = None,
+    max_runs: int = 0,
+    batch_size: int = 2,
+    telemetry: float | None = None,
+    graphs: str = "both",
+    time_budget: float | None = None,
+    database: str = HISTORY_DATABASE,
+    abort: AbortRules | None = None,
+    metrics_port: int | None = None,
+    stage_dir: str | None = None,
+    stage_budget: float | None = None,
+) -> None:
+    """Run benchmarks on all maps that match the given regular expression. The settings of
+    the manifests in the save folders override `ticks` and `runs`, with a `time_budget` in
+    seconds the runs are planned to fit into it. The progress and ETA of the session are
+    printed and, with a `metrics_port`, served on http://127.0.0.1:<metrics_port>/metrics.
+    Maps that break the `abort` rules are skipped and listed in 'aborted.json'. With a
+    `stage_dir` or `stage_budget` in MB the saves are staged into RAM ahead of their turn,
+    see `SaveStager`."""
+    if not folder:
+        folder = f"benchmark_on_{date.today()}_{datetime.now().strftime('%H_%M_%S')}"
+
+    Path(folder, "saves").mkdir(parents=True, exist_ok=True)
+    Path(folder, "graphs").mkdir(parents=True, exist_ok=True)
+
+    files = [file for file in find_maps(map_regex, filenames) if file.is_file()]
+
+    factorio_path = PurePath(factorio_bin or PurePath("factorio", "bin", "x64", "factorio"))
+
+    saves = index_saves(files)
+    if not disable_mods:
+        # maps with the same mods run after each other, so every mod set is synced once
+        mod_sets = {file: saves[file]["mods_fingerprint"] or "" for file in files}
+        files.sort(key=lambda file: mod_sets[file])
+        print(f"{len(set(mod_sets.values()))} different mod sets")
+
+    # the manifests override ticks and runs, maps with a higher priority run first
+    settings: dict[Path, dict[str, Any]] = {
+        file: {"ticks": ticks, "runs": runs} | load_manifest(file) for file in files
+    }
+    files.sort(key=lambda file: -float(settings[file].get("priority", 1)))
+    if time_budget is not None:
+        for file, budget_runs in plan_time_budget(files, settings, time_budget, database).items():
+            settings[file]["runs"] = budget_runs
+
+    out_folder: str = folder
+    # every parallel instance gets its own core set and write dir, handed out as slots
+    slots: queue.Queue[tuple[list[int] | None, PurePath | None]] = queue.Queue()
+    if jobs > 1:
+        for instance, core_set in enumerate(get_core_sets(jobs)):
+            print(f"instance {instance} runs on cpus {core_set}")
+            slots.put((core_set, create_instance_dir(instance)))
+    else:
+        slots.put((None, None))
+    progress = SessionProgress()
+    stager: SaveStager | None = None
+
+    def run_in_slot(
+        map_: PurePath,
+        run_ticks: int,
+        run_runs: int,
+        save: bool,
+        description: str | None = None,
+    ) -> list[float] | None:
+        cpus, config = slots.get()
+        staged = stager.get(Path(map_)) if stager is not None and save else None
+        try:
+            if save:
+                benchmark_map(
+                    map_,
+                    out_folder,
+                    ticks=run_ticks,
+                    runs=run_runs,
+                    factorio_bin=factorio_path,
+                    disable_mods=disable_mods,
+                    high_priority=high_priority,
+                    cpus=cpus,
+                    config=config,
+                    use_cache=use_cache,
+                    target_error=target_error,
+                    max_runs=max_runs,
+                    batch_size=batch_size,
+                    telemetry=telemetry,
+                    skipticks=skipticks,
+                    description=description,
+                    progress=progress,
+                    abort=abort,
+                    staged=staged,
+                )
+                progress.finish(str(map_.with_suffix("")))
+                return None
+            else:
+                return run_benchmark(
+                    map_,
+                    out_folder,
+                    ticks=run_ticks,
+                    runs=run_runs,
+                    save=save,
+                    disable_mods=disable_mods,
+                    factorio_bin=factorio_path,
+                    high_priority=high_priority,
+                    cpus=cpus,
+                    config=config,
+                )
+        finally:
+            slots.put((cpus, config))
+            if staged is not None and stager is not None:
+                stager.release(Path(map_))
+
+    def warm_up(warmup_map: PurePath, max_rounds: int = 10) -> None:
+        # until the tick time and cpu frequency stop changing
+        last: tuple[float, float] | None = None
+        for warmup_round in range(1, max_rounds + 1):
+            avgs = run_in_slot(warmup_map, 100, 1, False)
+            if avgs is None:
+                return
+            current = (avgs[-1], get_cpu_frequency())
+            if last is not None and all(is_stable(a, b) for a, b in zip(last, current)):
+                print(f"warmed up after {warmup_round} runs")
+                return
+            last = current
+        print("the tick time didn't settle during the warm up")
+
+    if stage_dir is not None or stage_budget is not None:
+        stager = SaveStager(stage_dir, int((stage_budget or STAGE_BUDGET_MB) * (1 << 20)))
+    try:
+        if stager is not None:
+            print(f"staging the saves in {stager.directory}")
+            stager.prefetch(files)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            print("Warming up the system...")
+            warmup_map = PurePath("saves", "factorio_maps", "big_bases", "flame10k.zip")
+            if not Path(warmup_map).is_file():
+                # fall back to the first map of the benchmark
+                warmup_map = next((file for file in files if file.is_file()), warmup_map)
+            for warmup in [executor.submit(warm_up, warmup_map) for _ in range(jobs)]:
+                warmup.result()
+            print("Finished warming up, starting the actual benchmark...")
+
+            # the ETA only counts the time from here on
+            progress.start = time.monotonic()
+            history = history_costs(database, get_hardware_fingerprint()["id"])
+            for file in files:
+                name = str(file.with_suffix(""))
+                map_settings = settings[file]
+                progress.plan(
+                    name,
+                    map_settings["ticks"] * map_settings["runs"],
+                    history.get(name, (None,))[0],
+                )
+            server = None
+            if metrics_port is not None:
+                server = MetricsServer(("127.0.0.1", metrics_port), progress)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                print(f"progress on http://127.0.0.1:{server.server_port}/metrics")
+
+            print()
+            print("==================")
+            print("benchmark maps")
+            print("==================")
+            print("")
+
+            futures = []
+            for filename in files:
+                print(filename)
+                map_settings = settings[filename]
+                if map_settings.get("description"):
+                    print(map_settings["description"])
+                Path(folder, PurePath(filename).parent).mkdir(parents=True, exist_ok=True)
+                futures.append(
+                    executor.submit(
+                        run_in_slot,
+                        filename,
+                        map_settings["ticks"],
+                        map_settings["runs"],
+                        True,
+                        map_settings.get("description"),
+                    )
+                )
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                if server is not None:
+                    server.shutdown()
+                    server.server_close()
+    finally:
+        # the staging thread would otherwise keep the interpreter from exiting
+        if stager is not None:
+            stager.close()
+    progress.print_status()
+
+    if progress.aborted:
+        print(f"{len(progress.aborted)} maps were aborted")
+        for name, reason in progress.aborted.items():
+            print(f"{name:60} {reason}")
+        with open(PurePath(folder, "aborted.json"), "w") as f:
+            json.dump(progress.aborted, f, indent=2)
+
+    print("==================")
+    print("creating graphs")
+    render_results(folder, map_regex, skipticks, consistency, graphs=graphs)
+    ingest_results(folder, skipticks, database, map_regex=map_regex)
+
+    print("")
+    print("the benchmark is finished")
+    print("==================")
+
+
+def get_cpu_frequency() -> float:
+    """the current cpu frequency in MHz, 0 if it can't be read"""
+    import psutil
+
+    frequency = psutil.cpu_freq()
+    return float(frequency.current) if frequency is not None else 0.0
+
+
+def is_stable(last: float, current: float, tolerance: float = 0.02) -> bool:
+    """if `current` is within `tolerance` of `last`"""
+    return abs(current - last) <= tolerance * abs(last)
+
+
+def get_hardware_fingerprint() -> dict[str, Any]:
+    """a summary of the hardware the benchmarks run on, `id` is a hash of the rest"""
+    import psutil
+
+    cpu_model = platform.processor()
+    with contextlib.suppress(OSError), open("/proc/cpuinfo") as f:
+        for line in f:
+            if line.startswith("model name"):
+                cpu_model = line.split(":", 1)[1].strip()
+                break
+    fingerprint: dict[str, Any] = {
+        "cpu": cpu_model,
+        "logical_cpus": psutil.cpu_count(),
+        "physical_cpus": psutil.cpu_count(logical=False),
+        "memory": psutil.virtual_memory().total,
+        "system": platform.platform(),
+    }
+    fingerprint["id"] = hashlib.sha256(json.dumps(fingerprint).encode()).hexdigest()[:16]
+    fingerprint["host"] = platform.node()
+    return fingerprint
+
+
+class BenchmarkCoordinator:
+    """hands out benchmark jobs to workers and collects their results. A job whose worker
+    stops sending heartbeats is put back into the queue."""
+
+    def __init__(
+        self,
+        jobs: list[dict[str, Any]],
+        lease_timeout: float = 60,
+        max_attempts: int = 3,
+    ) -> None:
+        self.jobs = {job["id"]: job for job in jobs}
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.pending: deque[int] = deque(self.jobs)
+        self.leases: dict[int, tuple[str, float]] = {}
+        self.attempts: dict[int, int] = {job_id: 0 for job_id in self.jobs}
+        self.done: set[int] = set()
+        self.failed: set[int] = set()
+        self.workers: dict[str, dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def finished(self) -> bool:
+        with self.lock:
+            return len(self.done) + len(self.failed) == len(self.jobs)
+
+    def lease(self, worker: str, version: str, hardware: dict[str, Any]) -> dict[str, Any] | None:
+        """returns the next job the worker can run"""
+        with self.lock:
+            self.workers[worker] = hardware
+            for job_id in self.pending:
+                if self.jobs[job_id]["version"] in (None, version):
+                    self.pending.remove(job_id)
+                    self.leases[job_id] = (worker, time.monotonic() + self.lease_timeout)
+                    self.attempts[job_id] += 1
+                    print(f"job {job_id} ({self.jobs[job_id]['map']}) leased to {worker}")
+                    return self.jobs[job_id] | {"heartbeat": self.lease_timeout / 3}
+            return None
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """extends the lease, False if the worker lost it"""
+        with self.lock:
+            if self.leases.get(job_id, ("", 0))[0] != worker:
+                return False
+            self.leases[job_id] = (worker, time.monotonic() + self.lease_timeout)
+            return True
+
+    def release(self, job_id: int, worker: str, success: bool) -> bool:
+        """ends the lease of a job, failed jobs are retried"""
+        with self.lock:
+            if self.leases.get(job_id, ("", 0))[0] != worker:
+                return False
+            del self.leases[job_id]
+            if success:
+                self.done.add(job_id)
+            else:
+                self.retry(job_id)
+            return True
+
+    def expire(self) -> None:
+        """puts the jobs of dead workers back into the queue"""
+        with self.lock:
+            now = time.monotonic()
+            for job_id, (worker, deadline) in list(self.leases.items()):
+                if deadline < now:
+                    print(f"lost worker {worker} on job {job_id}")
+                    del self.leases[job_id]
+                    self.retry(job_id)
+
+    def retry(self, job_id: int) -> None:
+        if self.attempts[job_id] >= self.max_attempts:
+            print(f"job {job_id} ({self.jobs[job_id]['map']}) failed")
+            self.failed.add(job_id)
+        else:
+            self.pending.appendleft(job_id)
+
+    def result_path(self, job_id: int) -> PurePath:
+        map_ = PurePath(self.jobs[job_id]["map"])
+        return PurePath(self.jobs[job_id]["folder"], map_.parent, map_.stem)
+
+    def upload_path(self, job_id: int, name: str) -> PurePath:
+        """where an upload of the current lease of a job is stored until the job is done,
+        next to the result and named after the attempt, so a stale worker can't clobber it"""
+        with self.lock:
+            attempt = self.attempts[job_id]
+        result_path = self.result_path(job_id)
+        upload = PurePath(f"{result_path}.{name}.{attempt}")
+        if not Path(upload).resolve().is_relative_to(Path(self.jobs[job_id]["folder"]).resolve()):
+            raise ValueError(f"{upload} is outside of the result folder")
+        return upload
+
+
+class CoordinatorServer(ThreadingHTTPServer):
+    def __init__(self, address: tuple[str, int], coordinator: BenchmarkCoordinator) -> None:
+        super().__init__(address, CoordinatorHandler)
+        self.coordinator = coordinator
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    """the http interface of the coordinator:
+    POST /lease                  -> a job as json, 204 if there is none right now, 410 if done
+    POST /heartbeat/<job>        -> 409 if the lease was lost
+    GET  /map/<job>              -> the save file
+    PUT  /upload/<job>/<file>    -> `log` or `tick_data` of the result
+    POST /done/<job>, /failed/<job>
+    Malformed requests and worker names that don't match `WORKER_NAME` get a 400.
+    """
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def reply(self, code: int, body: dict[str, Any] | None = None) -> None:
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self) -> dict[str, Any]:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if not isinstance(body, dict):
+            raise ValueError("the body isn't a json object")
+        return body
+
+    def job_id(self, job: str) -> int:
+        """the id of a job in the path, ValueError if there is no such job"""
+        job_id = int(job)
+        if job_id not in cast(CoordinatorServer, self.server).coordinator.jobs:
+            raise ValueError(f"unknown job {job}")
+        return job_id
+
+    def worker(self, name: object) -> str:
+        """`name` if it is a valid worker name, ValueError otherwise"""
+        if not isinstance(name, str) or not WORKER_NAME.fullmatch(name):
+            raise ValueError(f"invalid worker name {name!r}")
+        return name
+
+    def do_GET(self) -> None:
+        coordinator = cast(CoordinatorServer, self.server).coordinator
+        try:
+            action, job = self.path.strip("/").split("/")[:2]
+            job_id = self.job_id(job)
+        except ValueError:
+            self.reply(404)
+            return
+        if action != "map":
+            self.reply(404)
+            return
+        map_ = Path(coordinator.jobs[job_id]["map"])
+        self.send_response(200)
+        self.send_header("Content-Length", str(map_.stat().st_size))
+        self.end_headers()
+        with open(map_, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, WRITE_BUFFER_SIZE)
+
+    def do_PUT(self) -> None:
+        coordinator = cast(CoordinatorServer, self.server).coordinator
+        try:
+            action, job, name = self.path.strip("/").split("/")[:3]
+            job_id = self.job_id(job)
+            worker = self.worker(self.headers["Worker"])
+            remaining = int(self.headers["Content-Length"])
+        except (ValueError, TypeError):
+            self.reply(400)
+            return
+        if action != "upload" or name not in ("log", "tick_data"):
+            self.reply(404)
+            return
+        if not coordinator.heartbeat(job_id, worker):
+            self.reply(409)
+            return
+        upload = coordinator.upload_path(job_id, name)
+        Path(upload).parent.mkdir(parents=True, exist_ok=True)
+        with open(upload, "wb") as f:
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, WRITE_BUFFER_SIZE))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        self.reply(200)
+
+    def do_POST(self) -> None:
+        coordinator = cast(CoordinatorServer, self.server).coordinator
+        try:
+            action, *job = self.path.strip("/").split("/")
+            body = self.read_json()
+            worker = self.worker(body["worker"])
+            job_id = self.job_id(job[0]) if action != "lease" else -1
+            if action == "lease" and not isinstance(body["hardware"], dict):
+                raise ValueError("the hardware isn't a json object")
+            if action == "done" and not isinstance(body["header"].get("ups"), (int, float)):
+                raise ValueError("the header has no ups")
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+            self.reply(400)
+            return
+        if action == "lease":
+            if coordinator.finished():
+                self.reply(410)
+            elif leased := coordinator.lease(worker, str(body.get("version")), body["hardware"]):
+                self.reply(200, leased)
+            else:
+                self.reply(204)
+        elif action == "heartbeat":
+            self.reply(200 if coordinator.heartbeat(job_id, worker) else 409)
+        elif action == "done":
+            if not coordinator.heartbeat(job_id, worker):
+                self.reply(409)
+                return
+            result_path = coordinator.result_path(job_id)
+            log_path = coordinator.upload_path(job_id, "log")
+            tick_data_path = coordinator.upload_path(job_id, "tick_data")
+            if not (Path(log_path).is_file() and Path(tick_data_path).is_file()):
+                self.reply(400)
+                return
+            header = body["header"] | {"worker": worker, "hardware": coordinator.workers[worker]}
+            with open(result_path, "w") as f, open(log_path) as log:
+                log.readline()
+                f.write(json.dumps(header) + "\n")
+                shutil.copyfileobj(log, f, WRITE_BUFFER_SIZE)
+            os.remove(log_path)
+            os.replace(tick_data_path, f"{result_path}.npy")
+            archive_result(result_path)
+            coordinator.release(job_id, worker, True)
+            print(f"job {job_id} finished by {worker}: {header['ups']:.3f} UPS")
+            self.reply(200)
+        elif action == "failed":
+            self.reply(200 if coordinator.release(job_id, worker, False) else 409)
+        else:
+            self.reply(404)
+
+
+def run_coordinator(
+    address: str,
+    ticks: int,
+    runs: int,
+    disable_mods: bool,
+    skipticks: int | None,
+    consistency: str | None,
+    map_regex: str = "*",
+    versions: list[str] | None = None,
+    folder: str | None = None,
+    lease_timeout: float = 60,
+) -> None:
+    """benchmarks all selected maps (for every given factorio version) on remote workers"""
+    if not folder:
+        folder = f"benchmark_on_{date.today()}_{datetime.now().strftime('%H_%M_%S')}"
+    host, _, port = address.rpartition(":")
+    jobs: list[dict[str, Any]] = []
+    version_list: list[str | None] = [*versions] if versions else [None]
+    for version in version_list:
+        # every version gets its own result folder
+        version_folder = str(PurePath(folder, version) if version else folder)
+        for file in find_maps(map_regex):
+            if file.is_file():
+                job: dict[str, Any] = {"id": len(jobs), "map": str(file), "version": version}
+                job |= {"ticks": ticks, "runs": runs} | load_manifest(file)
+                job["disable_mods"] = disable_mods
+                job["skipticks"] = skipticks
+                jobs.append(job | {"folder": version_folder})
+    coordinator = BenchmarkCoordinator(jobs, lease_timeout)
+    for job in jobs:
+        Path(coordinator.result_path(job["id"])).parent.mkdir(parents=True, exist_ok=True)
+
+    server = CoordinatorServer((host or "0.0.0.0", int(port)), coordinator)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"coordinating {len(jobs)} jobs on {host or '0.0.0.0'}:{server.server_port}")
+    while not coordinator.finished():
+        time.sleep(1)
+        coordinator.expire()
+    server.shutdown()
+    server.server_close()
+
+    with open(PurePath(folder, "workers.json"), "w") as f:
+        json.dump(coordinator.workers, f, indent=2)
+    print(f"{len(coordinator.done)} jobs done, {len(coordinator.failed)} failed")
+    print("==================")
+    print("creating graphs")
+    for version_folder in sorted({job["folder"] for job in jobs}):
+        render_results(version_folder, map_regex, skipticks, consistency)
+        ingest_results(version_folder, skipticks, map_regex=map_regex)
+
+
+def run_worker(
+    url: str,
+    factorio_bin: str | None = None,
+    name: str | None = None,
+    poll_interval: float = 5,
+) -> None:
+    """runs the jobs of a coordinator until all of them are done"""
+    import requests
+
+    factorio_path = PurePath(factorio_bin or PurePath("factorio", "bin", "x64", "factorio"))
+    name = name or f"{platform.node()}-{os.getpid()}"
+    if not WORKER_NAME.fullmatch(name):
+        raise ValueError(f"worker names may only contain {WORKER_NAME.pattern}, not {name!r}")
+    hardware = get_hardware_fingerprint()
+    version = get_factorio_version(factorio_path)
+    # own write dir, so several workers can run on the same machine
+    config = create_instance_dir(name)
+    workdir = Path("factorio", "instances", name, "jobs")
+
+    unreachable = 0
+    while True:
+        try:
+            response = requests.post(
+                f"{url}/lease", json={"worker": name, "version": version, "hardware": hardware}
+            )
+            unreachable = 0
+        except requests.ConnectionError:
+            # the coordinator shuts down once everything is done
+            unreachable += 1
+            if unreachable > 3:
+                print("the coordinator isn't reachable anymore")
+                return
+            time.sleep(poll_interval)
+            continue
+        if response.status_code == 410:
+            print("all jobs are done")
+            return
+        if response.status_code == 204:
+            time.sleep(poll_interval)
+            continue
+        response.raise_for_status()
+        job: dict[str, Any] = response.json()
+        print(f"running job {job['id']}: {job['map']}")
+
+        stop = threading.Event()
+
+        def heartbeat(
+            job_id: int = job["id"],
+            interval: float = job["heartbeat"],
+            stop: threading.Event = stop,
+        ) -> None:
+            while not stop.wait(interval):
+                try:
+                    requests.post(
+                        f"{url}/heartbeat/{job_id}", json={"worker": name}, timeout=interval
+                    )
+                except requests.RequestException as e:
+                    # the lease lasts a few intervals, the next heartbeat can still save it
+                    print(f"heartbeat of job {job_id} failed: {e}")
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+        try:
+            map_ = PurePath(workdir, job["map"])
+            Path(map_).parent.mkdir(parents=True, exist_ok=True)
+            with requests.get(f"{url}/map/{job['id']}", stream=True) as download:
+                download.raise_for_status()
+                with open(map_, "wb") as f:
+                    shutil.copyfileobj(download.raw, f, WRITE_BUFFER_SIZE)
+            result_path = PurePath(workdir, map_.parent, map_.stem)
+            Path(result_path).parent.mkdir(parents=True, exist_ok=True)
+            avgs = run_benchmark(
+                map_,
+                str(workdir),
+                job["ticks"],
+                job["runs"],
+                factorio_path,
+                disable_mods=job["disable_mods"],
+                config=config,
+                skipticks=job.get("skipticks"),
+            )
+            if avgs is None:
+                requests.post(f"{url}/failed/{job['id']}", json={"worker": name})
+                continue
+            uploads = [("log", str(result_path)), ("tick_data", f"{result_path}.npy")]
+            for upload_name, upload_file in uploads:
+                with open(upload_file, "rb") as upload:
+                    response = requests.put(
+                        f"{url}/upload/{job['id']}/{upload_name}",
+                        data=upload,
+                        headers={"Worker": name},
+                    )
+                if response.status_code == 409:
+                    break
+                response.raise_for_status()
+            else:
+                with open(result_path) as result:
+                    header = json.loads(result.readline())
+                response = requests.post(
+                    f"{url}/done/{job['id']}", json={"worker": name, "header": header}
+                )
+            if response.status_code == 409:
+                # the lease expired and the job went to another worker
+                print(f"lost the lease of job {job['id']}, dropping the result")
+                continue
+            response.raise_for_status()
+        finally:
+            stop.set()
+            heartbeat_thread.join()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def plot_ups_consistency(
+    folder: str,
+    subfolder: PurePath,
+    data: npt.NDArray[np.float64],
+    skipticks: int,
+    name: str = "default",
+) -> None:
+    """plots the tick times of every run, `data` has the shape (runs, ticks)"""
+    from matplotlib.figure import Figure
+
+    subfolder_path = PurePath(folder, "graphs", subfolder)
+
+    # if not Path(subfolder_path).exists:
+    Path(subfolder_path).mkdir(parents=True, exist_ok=True)
+
+    t = np.arange(skipticks, skipticks + data.shape[1])
+    # first discard the highest value as that can frequently be an outlier.
+    c = np.sort(data, axis=0)[:-1] if len(data) > 1 else data
+    med = np.median(c, axis=0)
+    maxi = c.max(axis=0)
+    mini = c.min(axis=0)
+
+    fig = Figure()
+    ax = fig.subplots()
+    for run in data:
+        ax.plot(
+            t,
+            run,
+            "k",
+            alpha=0.2,
+            linewidth=0.6,
+        )
+    ax.plot(t, med, "r", label="median", linewidth=0.6)
+    ax.set_title(label=name)
+    ax.set_xlabel(xlabel="tick")
+    ax.set_ylabel(ylabel="tick time [ms]")
+    ax.legend()
+    fig.tight_layout()
+    # Use PurePath to build the file path for the output image
+    out_path = PurePath(subfolder_path, f"{name}_all.png")
+    fig.savefig(out_path, dpi=800)
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(t, maxi, label="maximum", linewidth=0.3)
+    ax.plot(t, mini, label="minimum", linewidth=0.3)
+    ax.plot(t, med, "r", label="median", linewidth=0.6)
+    ax.set_title(label=name)
+    ax.set_xlabel(xlabel="tick")
+    ax.set_ylabel(ylabel="tick time [ms]")
+    ax.legend()
+    fig.tight_layout()
+    # Use PurePath to build the file path for the output image
+    out_path = PurePath(subfolder_path, f"{name}_min_max_med.png")
+    fig.savefig(out_path, dpi=800)
+
+
+def plot_bar_chart(
+    values: list[float],
+    maps: list[str],
+    title: str,
+    out_path: PurePath,
+    xlabel: str = "Mean frametime [ms/frame]",
+    fmt: str = "{:.3f}",
+) -> None:
+    """plots one horizontal bar per map"""
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    hbars = ax.barh(maps, values)
+    ax.bar_label(
+        hbars,
+        labels=[fmt.format(x) for x in values],
+        padding=3,
+    )
+    ax.margins(0.1, 0.05)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel("Map name")
+    fig.tight_layout()
+    fig.savefig(out_path)
+
+
+def plot_benchmark_results(
+    data_table: list[list[float]],
+    titles: list[str],
+    maps: list[str],
+    folder: str,
+    subfolder: PurePath,
+    errfile: list[list[int]],
+    executor: Executor | None = None,
+    tail_table: list[dict[str, list[float]]] | None = None,
+) -> list[Future[None]]:
+    """Generate plots of benchmark results. If an executor is given the plots are only
+    submitted to it and the futures are returned. `tail_table` holds the tick statistics of
+    every map, they are plotted as p99 charts and the ticks over budget."""
+    # Create the output subfolder if it does not exist
+    subfolder_path = PurePath(folder, "graphs", subfolder)
+    # if not Path(subfolder_path).exists:
+    Path(subfolder_path).mkdir(parents=True, exist_ok=True)
+
+    charts: list[tuple[Any, ...]] = []
+    for col in itertools.chain(range(1, 11), range(22, 32)):
+        # Use PurePath to build the file path for the output image
+        out_path = PurePath(subfolder_path, f"{titles[col]}.png")
+        charts.append(([a[col] for a in data_table], maps, titles[col], out_path))
+        if tail_table is not None:
+            out_path = PurePath(subfolder_path, f"{titles[col]}_p99.png")
+            values = [stats["p99"][col] for stats in tail_table]
+            charts.append((values, maps, f"{titles[col]} p99", out_path, "p99 [ms/frame]"))
+    if tail_table is not None:
+        out_path = PurePath(subfolder_path, "ticks_over_budget.png")
+        values = [stats["over_budget"][outheader.index("wholeUpdate")] for stats in tail_table]
+        title = f"ticks over {TICK_BUDGET_MS:.2f} ms"
+        charts.append((values, maps, title, out_path, "ticks", "{:.0f}"))
+
+    futures: list[Future[None]] = []
+    for args in charts:
+        if executor is None:
+            plot_bar_chart(*args)
+        else:
+            futures.append(executor.submit(plot_bar_chart, *args))
+    return futures
+
+
+def lttb(values: npt.NDArray[np.float64], threshold: int) -> npt.NDArray[np.int64]:
+    """the indices of the points Largest-Triangle-Three-Buckets keeps to draw `values` with
+    `threshold` points. The first and last point are always kept, from every bucket in between
+    the point that spans the largest triangle with the previous point and the next bucket.
+
+    >>> lttb(np.array([1.0, 1, 1, 8, 1, 1, 1, 1, 1, -6, 1]), 5).tolist()
+    [0, 3, 4, 9, 10]
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        next_x = (next_start + next_end - 1) / 2
+        next_y = values[next_start:next_end].mean()
+        x = np.arange(start, end)
+        area = np.abs(
+            (a - next_x) * (values[start:end] - values[a]) - (a - x) * (next_y - values[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def series_pyramid(
+    data: npt.NDArray[np.float64], prefix: str, max_points: int | None = None
+) -> tuple[dict[str, Any], list[tuple[str, str]]]:
+    """downsamples (runs, ticks) data into levels with 4 times the points of the previous one,
+    up to the full series or `max_points`. The median of the runs is downsampled with LTTB,
+    the minimum and maximum are kept per bucket so peaks are never lost. Returns the
+    description of the levels and the json of every level"""
+    median = np.median(data, axis=0)
+    low = data.min(axis=0)
+    high = data.max(axis=0)
+    n = len(median)
+    levels: list[dict[str, Any]] = []
+    blocks: list[tuple[str, str]] = []
+    points = REPORT_POINTS if max_points is None else min(REPORT_POINTS, max_points)
+    while True:
+        points = min(points, n)
+        if points == n:
+            x = envelope_x = np.arange(n)
+            level = {"med": median, "lo": low, "hi": high}
+        else:
+            x = lttb(median, points)
+            bucket = math.ceil(n / points)
+            padding = (0, -n % bucket)
+            envelope_x = np.arange(0, n, bucket)
+            level = {
+                "med": median[x],
+                "lo": np.pad(low, padding, mode="edge").reshape(-1, bucket).min(axis=1),
+                "hi": np.pad(high, padding, mode="edge").reshape(-1, bucket).max(axis=1),
+            }
+        block = {"x": x.tolist(), "ex": envelope_x.tolist()}
+        block |= {name: np.round(values, 3).tolist() for name, values in level.items()}
+        block_id = f"{prefix}-{len(levels)}"
+        blocks.append((block_id, json.dumps(block, separators=(",", ":"))))
+        levels.append({"id": block_id, "points": points})
+        if points == n or (max_points is not None and points >= max_points):
+            break
+        points *= 4
+    return {"length": n, "levels": levels}, blocks
+
+
+def map_report(
+    result_path: PurePath, skipticks: int, metric: str, key: str, max_points: int = 500
+) -> tuple[dict[str, Any], list[tuple[str, str]]]:
+    """the statistics and tick series of a map for the html report. Only `metric` gets the
+    full resolution, the other metrics are limited to `max_points`"""
+    tick_data = load_tick_data(result_path)[:, skipticks:, :]
+    stats = stored_statistics(result_path, skipticks) or tick_statistics(tick_data)
+    series: dict[str, Any] = {}
+    blocks: list[tuple[str, str]] = []
+    for col, name in enumerate(outheader):
+        if col == 0:
+            continue
+        data = tick_data[:, :, col] / 1000000
+        series[name], new_blocks = series_pyramid(
+            data, f"{key}-{col}", None if name == metric else max_points
+        )
+        blocks.extend(new_blocks)
+    report = {
+        "name": PurePath(result_path).name,
+        "skipticks": skipticks,
+        "stats": {name: values[1:].tolist() for name, values in stats.items()},
+        "series": series,
+    }
+    return report, blocks
+
+
+def write_report(
+    folder: str,
+    reports: dict[PurePath, list[tuple[dict[str, Any], list[tuple[str, str]]]]],
+    metric: str,
+) -> PurePath:
+    """writes a self contained html report of the maps in `reports`, grouped by subfolder. The
+    tick series are stored in json blocks that the page only parses when they are drawn"""
+    index = {
+        "metric": metric,
+        "metrics": outheader[1:],
+        "statistics": ["mean", "std", "p50", "p90", "p99", "p99.9", "max", "over_budget"],
+        "budget": TICK_BUDGET_MS,
+        "groups": [
+            {"name": str(subfolder), "maps": [report for report, _ in maps]}
+            for subfolder, maps in reports.items()
+        ],
+    }
+    out_path = PurePath(folder, "report.html")
+    head, tail = REPORT_TEMPLATE.read_text().split("$DATA")
+    head = head.replace("$TITLE", html.escape(PurePath(folder).name))
+    # a closing script tag in the json would end the block
+    head = head.replace("$INDEX", json.dumps(index).replace("</", "<\\/"))
+    with open(out_path, "w", buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(head)
+        for _, blocks in itertools.chain(*reports.values()):
+            for block_id, block in blocks:
+                f.write(f'<script type="application/json" id="{block_id}">{block}</script>\n')
+        f.write(tail)
+    print("report written to", out_path)
+    return out_path
+
+
+def render_results(
+    folder: str,
+    map_regex: str,
+    skipticks: int | None,
+    consistency: str | None,
+    workers: int | None = None,
+    graphs: str = "both",
+) -> None:
+    """aggregates the tick data of a result folder and renders all the graphs on a process
+    pool. can also be used on the results of an earlier session. `graphs` is 'png', 'html'
+    for the report or 'both'. If `skipticks` is None the warm-up of every map is skipped."""
+    # group the results by subfolder, every subfolder gets its own set of graphs
+    tables: dict[PurePath, tuple[list[str], list[list[float]], list[dict[str, list[float]]]]] = {}
+    report_futures: dict[PurePath, list[Future[tuple[dict[str, Any], list[tuple[str, str]]]]]]
+    report_futures = {}
+    if graphs != "html":
+        # imported before the pool starts, so forked workers don't import it again each
+        import matplotlib.figure  # noqa: F401
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures: list[Future[None]] = []
+        for file in find_results(folder, map_regex):
+            # only the columnar tick data is needed, the logs are kept for reference
+            file_name = file.name
+            subfolder = PurePath(*file.parent.parts[len(PurePath(folder).parts) + 1 :])
+
+            # (runs, ticks, metrics) in ns
+            tick_data = load_tick_data(file)
+            map_skipticks = result_skipticks(file, tick_data, skipticks)
+            tick_data = tick_data[:, map_skipticks:, :]
+            if tick_data.size == 0:
+                print("no tick data for", file_name)
+                continue
+
+            maps, processed_table, tail_table = tables.setdefault(subfolder, ([], [], []))
+            maps.append(file_name)
+            # computed when the result was written, unless it skips a different warm-up
+            stats = stored_statistics(file, map_skipticks) or tick_statistics(tick_data)
+            processed_table.append(stats["mean"].tolist())
+            tail_table.append({name: values.tolist() for name, values in stats.items()})
+
+            if graphs != "png":
+                report_futures.setdefault(subfolder, []).append(
+                    executor.submit(
+                        map_report,
+                        file,
+                        map_skipticks,
+                        consistency or "wholeUpdate",
+                        f"m{sum(map(len, report_futures.values()))}",
+                    )
+                )
+            if consistency is not None and graphs != "html":
+                # do the consistency plot
+                futures.append(
+                    executor.submit(
+                        plot_ups_consistency,
+                        folder=folder,
+                        subfolder=subfolder,
+                        data=tick_data[:, :, outheader.index(consistency)] / 1000000,
+                        skipticks=map_skipticks,
+                        name="consistency_" + file_name + "_" + consistency,
+                    )
+                )
+
+        for subfolder, (maps, processed_table, tail_table) in tables.items():
+            if graphs == "html":
+                break
+            futures.extend(
+                plot_benchmark_results(
+                    processed_table, outheader, maps, folder, subfolder, [], executor, tail_table
+                )
+            )
+        if report_futures:
+            reports = {
+                subfolder: [future.result() for future in maps]
+                for subfolder, maps in report_futures.items()
+            }
+            write_report(folder, reports, consistency or "wholeUpdate")
+        for future in futures:
+            future.result()
+
+
+def read_result_header(result_path: PurePath) -> dict[str, Any]:
+    """the json header of a result, from its archive or the first line of its log"""
+    if Path(f"{result_path}{ARCHIVE_SUFFIX}").exists():
+        with ZipFile(f"{result_path}{ARCHIVE_SUFFIX}") as archive:
+            return cast(dict[str, Any], json.loads(archive.read("header.json")))
+    with open(result_path) as f:
+        return cast(dict[str, Any], json.loads(f.readline()))
+
+
+def version_key(version: str) -> tuple[int, ...]:
+    """sort key for version strings like '1.1.100 linux64 headless'"""
+    return tuple(int(part) for part in version.split()[0].split(".") if part.isdigit())
+
+
+def open_history(database: str = HISTORY_DATABASE) -> sqlite3.Connection:
+    """opens the history database and creates the tables if necessary"""
+    connection = sqlite3.connect(database)
+    # sqlite only enforces the foreign keys and their ON DELETE CASCADE when asked to
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY,
+            folder TEXT NOT NULL,
+            map TEXT NOT NULL,
+            version TEXT NOT NULL,
+            mods TEXT NOT NULL,
+            hardware TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            ticks INTEGER NOT NULL,
+            runs INTEGER NOT NULL,
+            skipticks INTEGER NOT NULL,
+            UNIQUE (folder, map)
+        );
+        CREATE INDEX IF NOT EXISTS results_by_map
+            ON results (map, version, mods, hardware, timestamp);
+        CREATE INDEX IF NOT EXISTS results_by_version ON results (version, map);
+        -- aggregates of every metric over all runs and ticks, in ms
+        CREATE TABLE IF NOT EXISTS metrics (
+            result_id INTEGER NOT NULL REFERENCES results (id) ON DELETE CASCADE,
+            metric TEXT NOT NULL,
+            mean REAL NOT NULL,
+            std REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            PRIMARY KEY (result_id, metric)
+        ) WITHOUT ROWID;
+        -- the mean of every metric per run, the samples for the significance tests
+        CREATE TABLE IF NOT EXISTS run_metrics (
+            result_id INTEGER NOT NULL REFERENCES results (id) ON DELETE CASCADE,
+            metric TEXT NOT NULL,
+            run INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            PRIMARY KEY (result_id, metric, run)
+        ) WITHOUT ROWID;
+        """
+    )
+    return connection
+
+
+def escape_like(text: str) -> str:
+    """`text` as a literal in a LIKE pattern with ESCAPE '\\'
+
+    >>> escape_like("saves/belt_10%")
+    'saves/belt\\\\_10\\\\%'
+    """
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def ingest_results(
+    folder: str,
+    skipticks: int | None,
+    database: str = HISTORY_DATABASE,
+    map_regex: str = "**/*",
+) -> None:
+    """adds all results of a result folder to the history database, with `skipticks` None
+    the warm-up recorded in every result is skipped"""
+    connection = open_history(database)
+    ingested = 0
+    with connection:
+        for result_path in find_results(folder, map_regex):
+            try:
+                header = read_result_header(result_path)
+            except (OSError, ValueError, BadZipFile):
+                print("no result header for", result_path)
+                continue
+            tick_data = load_tick_data(result_path)
+            map_skipticks = result_skipticks(result_path, tick_data, skipticks)
+            tick_data = tick_data[:, map_skipticks:, :]
+            if tick_data.size == 0:
+                continue
+            timestamp = header.get("timestamp") or datetime.fromtimestamp(
+                result_path.stat().st_mtime
+            ).isoformat(timespec="seconds")
+            hardware = header.get("hardware", {}).get("id", "unknown")
+            map_name = str(result_path.relative_to(folder))
+            connection.execute(
+                "DELETE FROM results WHERE folder = ? AND map = ?", (str(folder), map_name)
+            )
+            result_id = connection.execute(
+                "INSERT INTO results (folder, map, version, mods, hardware, timestamp, ticks, "
+                "runs, skipticks) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(folder),
+                    map_name,
+                    header["version"],
+                    header.get("mods", "unknown"),
+                    hardware,
+                    timestamp,
+                    tick_data.shape[1] + map_skipticks,
+                    tick_data.shape[0],
+                    map_skipticks,
+                ),
+            ).lastrowid
+            # databases written without foreign keys can hold metrics of a deleted result whose
+            # id is now reused
+            connection.execute("DELETE FROM metrics WHERE result_id = ?", (result_id,))
+            connection.execute("DELETE FROM run_metrics WHERE result_id = ?", (result_id,))
+            ms = tick_data / 1000000
+            connection.executemany(
+                "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)",
+                zip(
+                    itertools.repeat(result_id),
+                    outheader,
+                    ms.mean(axis=(0, 1)).tolist(),
+                    ms.std(axis=(0, 1)).tolist(),
+                    ms.min(axis=(0, 1)).tolist(),
+                    ms.max(axis=(0, 1)).tolist(),
+                ),
+            )
+            run_means = ms.mean(axis=1)
+            connection.executemany(
+                "INSERT INTO run_metrics VALUES (?, ?, ?, ?)",
+                (
+                    (result_id, metric, run, float(run_means[run, index]))
+                    for run in range(len(run_means))
+                    for index, metric in enumerate(outheader)
+                ),
+            )
+            ingested += 1
+    connection.close()
+    print(f"added {ingested} results from {folder} to {database}")
+
+
+def incomplete_beta(a: float, b: float, x: float) -> float:
+    """the regularized incomplete beta function I_x(a, b)"""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    if x > (a + 1) / (a + b + 2):
+        return 1 - incomplete_beta(b, a, 1 - x)
+    front = math.exp(
+        math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x)
+    )
+    # continued fraction, evaluated with the modified Lentz method
+    tiny = 1e-300
+    c, d = 1.0, 1 - (a + b) * x / (a + 1)
+    d = 1 / (d if abs(d) > tiny else tiny)
+    f = d
+    for m in range(1, 200):
+        for numerator in (
+            m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+            -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1)),
+        ):
+            d = 1 + numerator * d
+            d = 1 / (d if abs(d) > tiny else tiny)
+            c = 1 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            f *= c * d
+        if abs(c * d - 1) < 1e-12:
+            break
+    return front * f / a
+
+
+def welch_test(a: list[float], b: list[float]) -> float:
+    """two sided p-value of Welch's t-test for a difference between the means of a and b
+
+    >>> round(welch_test([1.0, 1.1, 0.9, 1.0], [1.5, 1.6, 1.4, 1.5]), 5)
+    0.00013
+    """
+    if len(a) < 2 or len(b) < 2:
+        return float("nan")
+    var_a = statistics.variance(a) / len(a)
+    var_b = statistics.variance(b) / len(b)
+    difference = statistics.mean(b) - statistics.mean(a)
+    if var_a + var_b == 0:
+        return 1.0 if difference == 0 else 0.0
+    t = difference / math.sqrt(var_a + var_b)
+    df = (var_a + var_b) ** 2 / (var_a**2 / (len(a) - 1) + var_b**2 / (len(b) - 1))
+    return incomplete_beta(df / 2, 0.5, df / (df + t * t))
+
+
+def version_tests(
+    version_a: str,
+    version_b: str,
+    database: str = HISTORY_DATABASE,
+    map_pattern: str = "%",
+) -> list[tuple[float, str, str, float, float]]:
+    """compares the per run means of every metric between two factorio versions, for all maps
+    benchmarked on the same hardware with the same mods. Returns a welch test of every metric
+    of every map as (p-value, map, metric, mean a, mean b)."""
+    connection = open_history(database)
+    rows = connection.execute(
+        """
+        SELECT r.map, r.mods, r.hardware, r.version, m.metric, group_concat(m.mean)
+        FROM results r JOIN run_metrics m ON m.result_id = r.id
+        WHERE (r.version = ? OR r.version = ? OR r.version LIKE ? || ' %' ESCAPE '\\'
+               OR r.version LIKE ? || ' %' ESCAPE '\\') AND r.map LIKE ? ESCAPE '\\'
+        GROUP BY r.map, r.mods, r.hardware, r.version, m.metric
+        """,
+        (version_a, version_b, escape_like(version_a), escape_like(version_b), map_pattern),
+    ).fetchall()
+    connection.close()
+
+    samples: dict[tuple[str, str, str, str], dict[bool, list[float]]] = {}
+    for map_name, mods, hardware, version, metric, means in rows:
+        is_b = version.split()[0] == version_b.split()[0]
+        samples.setdefault((map_name, mods, hardware, metric), {})[is_b] = [
+            float(mean) for mean in means.split(",")
+        ]
+
+    tests: list[tuple[float, str, str, float, float]] = []
+    for (map_name, _, _, metric), sample in sorted(samples.items()):
+        if len(sample) != 2 or metric == "timestamp":
+            continue
+        mean_a, mean_b = statistics.mean(sample[False]), statistics.mean(sample[True])
+        p = welch_test(sample[False], sample[True])
+        if not math.isnan(p):
+            tests.append((p, map_name, metric, mean_a, mean_b))
+    return tests
+
+
+def holm_slowdowns(
+    tests: list[tuple[float, str, str, float, float]], alpha: float, min_change: float
+) -> list[tuple[str, str, float, float, float]]:
+    """the significant slowdowns of `tests` as (map, metric, mean a, mean b, p-value). The
+    significance level is holm-bonferroni corrected for all tests together, so `alpha` is the
+    chance of any false alarm."""
+    regressions: list[tuple[str, str, float, float, float]] = []
+    for rank, (p, map_name, metric, mean_a, mean_b) in enumerate(sorted(tests)):
+        if p >= alpha / (len(tests) - rank):
+            break
+        if mean_b > mean_a * (1 + min_change):
+            regressions.append((map_name, metric, mean_a, mean_b, p))
+    return sorted(regressions)
+
+
+def print_slowdown(map_name: str, metric: str, mean_a: float, mean_b: float, p: float) -> None:
+    print(
+        f"{map_name:40} {metric:30} {mean_a:9.4f} ms -> {mean_b:9.4f} ms "
+        f"({mean_b / mean_a - 1:+.1%}, p = {p:.2g})"
+    )
+
+
+def compare_versions(
+    version_a: str,
+    version_b: str,
+    database: str = HISTORY_DATABASE,
+    alpha: float = 0.05,
+    min_change: float = 0.01,
+    map_pattern: str = "%",
+) -> list[tuple[str, str, float, float, float]]:
+    """compares the per run means of every metric between two factorio versions, for all maps
+    benchmarked on the same hardware with the same mods. Prints and returns the statistically
+    significant slowdowns as (map, metric, mean a, mean b, p-value). The significance level
+    is corrected for the number of comparisons."""
+    regressions = holm_slowdowns(
+        version_tests(version_a, version_b, database, map_pattern), alpha, min_change
+    )
+    print(f"slowdowns from {version_a} to {version_b} (p < {alpha}):")
+    for regression in regressions:
+        print_slowdown(*regression)
+    if not regressions:
+        print("none")
+    return regressions
+
+
+def find_regressions(
+    database: str = HISTORY_DATABASE, alpha: float = 0.05, min_change: float = 0.01
+) -> list[tuple[str, str, float, float, float]]:
+    """compares the two latest factorio versions of every map in the history. The tests of all
+    maps are corrected together, like those of `compare_versions`."""
+    connection = open_history(database)
+    maps: dict[str, set[str]] = {}
+    for map_name, version in connection.execute("SELECT DISTINCT map, version FROM results"):
+        maps.setdefault(map_name, set()).add(version.split()[0])
+    connection.close()
+
+    tests: list[tuple[float, str, str, float, float]] = []
+    compared: dict[str, tuple[str, str]] = {}
+    for map_name, versions in sorted(maps.items()):
+        if len(versions) < 2:
+            continue
+        previous, latest = sorted(versions, key=version_key)[-2:]
+        compared[map_name] = (previous, latest)
+        tests.extend(version_tests(previous, latest, database, escape_like(map_name)))
+    regressions = holm_slowdowns(tests, alpha, min_change)
+
+    print(f"slowdowns from the previous to the latest version of every map (p < {alpha}):")
+    for regression in regressions:
+        previous, latest = compared[regression[0]]
+        print(f"{previous} -> {latest}: ", end="")
+        print_slowdown(*regression)
+    if not regressions:
+        print("none")
+    return regressions
+
+
+def bootstrap_speedup(
+    a: npt.NDArray[np.float64],
+    b: npt.NDArray[np.float64],
+    resamples: int = 10000,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """the speedup of b over a (mean a / mean b) of every metric and its bootstrap confidence
+    interval. a and b are the (runs, metrics) run means, run i of a and b are a pair that
+    ran right after each other, so the pairs are resampled together.
+
+    >>> a = np.array([[10.0], [10.5], [9.5], [10.2]])
+    >>> speedup, low, high = bootstrap_speedup(a, a / 2)
+    >>> speedup.round(2).tolist(), low.round(2).tolist(), high.round(2).tolist()
+    ([2.0], [2.0], [2.0])
+    """
+    rng = np.random.default_rng(seed)
+    pairs = rng.integers(0, len(a), (resamples, len(a)))
+    speedups = a[pairs].mean(axis=1) / b[pairs].mean(axis=1)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(speedups, [tail, 100 - tail], axis=0)
+    return a.mean(axis=0) / b.mean(axis=0), low, high
+
+
+def ab_verdict(low: float, high: float) -> str:
+    if low > 1:
+        return "B is faster"
+    if high < 1:
+        return "B is slower"
+    return "no significant difference"
+
+
+def ab_compare(
+    files: list[Path],
+    sides: list[tuple[PurePath, PurePath | None]],
+    ticks: int,
+    runs: int,
+    folder: str | None = None,
+    disable_mods: bool = True,
+    skipticks: int | None = None,
+    high_priority: bool | None = None,
+    alpha: float = 0.05,
+) -> dict[str, Any]:
+    """benchmarks every map with the two (factorio binary, mod directory) `sides` A and B,
+    interleaved as ABBA ABBA... so drift affects both the same. The results of A and B are
+    stored as normal result folders 'A' and 'B', the speedups with their bootstrap confidence
+    intervals in 'ab_comparison.json'."""
+    if not files:
+        print("no maps to compare")
+        return {}
+    if not folder:
+        folder = f"ab_on_{date.today()}_{datetime.now().strftime('%H_%M_%S')}"
+    names = ["A", "B"]
+    for name, (factorio_bin, mods_dir) in zip(names, sides):
+        print(f"{name}: {factorio_bin} {get_factorio_version(factorio_bin, True)}", mods_dir or "")
+
+    print("Warming up the system...")
+    for factorio_bin, mods_dir in sides:
+        run_benchmark(files[0], folder, 100, 1, factorio_bin, save=False, mods_dir=mods_dir)
+
+    comparison: dict[str, Any] = {}
+    for file in files:
+        print(file)
+        save_mods = None if disable_mods else prepare_mods(file)
+        run_files: dict[str, dict[int, PurePath]] = {name: {} for name in names}
+        run_avgs: dict[str, dict[int, float]] = {name: {} for name in names}
+        for i in range(runs):
+            order = [0, 1] if i % 2 == 0 else [1, 0]
+            for side in order:
+                factorio_bin, mods_dir = sides[side]
+                run_folder = str(PurePath(folder, names[side], "runs", str(i)))
+                Path(run_folder, file.parent).mkdir(parents=True, exist_ok=True)
+                avgs = run_benchmark(
+                    file,
+                    run_folder,
+                    ticks,
+                    1,
+                    factorio_bin,
+                    high_priority=high_priority,
+                    mods_dir=mods_dir or save_mods,
+                    skipticks=skipticks,
+                )
+                if avgs is not None:
+                    run_files[names[side]][i] = PurePath(run_folder, file.parent, file.stem)
+                    run_avgs[names[side]][i] = avgs[0]
+        # only runs where both sides worked are pairs
+        paired = sorted(set(run_files["A"]) & set(run_files["B"]))
+        if len(paired) < 2:
+            print(f"not enough runs of {file} worked for a comparison")
+            continue
 
-    files = [Path(file) for file in filenames] if filenames else [*Path("saves").glob(map_regex)]
+        tick_data = {}
+        for name, (factorio_bin, _) in zip(names, sides):
+            data = np.concatenate([np.load(f"{run_files[name][i]}.npy") for i in paired])
+            tick_data[name] = data
+            result_path = PurePath(folder, name, file.parent, file.stem)
+            Path(result_path).parent.mkdir(parents=True, exist_ok=True)
+            np.save(f"{result_path}.npy", data)
+            out = summarize_runs(
+                get_factorio_version(factorio_bin, True), [run_avgs[name][i] for i in paired]
+            )
+            out |= summarize_ticks(data, skipticks) | {"ab_side": name}
+            with open(result_path, "w") as f:
+                f.write(json.dumps(out) + "\n")
+                for i in paired:
+                    with open(run_files[name][i]) as run_log:
+                        run_log.readline()
+                        shutil.copyfileobj(run_log, f, WRITE_BUFFER_SIZE)
+            archive_result(result_path)
 
-    for file in deepcopy(files):
-        if Path.is_file(file):
-            migrate_map(factorio_path, file, inplace, custom_script)
+        skip = skipticks
+        if skip is None:
+            skip = max(resolve_skipticks(data, None) for data in tick_data.values())
+        means = {
+            name: data[:, skip:, 1:].mean(axis=1) / 1000000 for name, data in tick_data.items()
+        }
+        # metrics the map doesn't use are left out
+        used = [
+            col
+            for col in range(len(outheader) - 1)
+            if max(means["A"][:, col].mean(), means["B"][:, col].mean()) >= 0.001
+        ]
+        # bonferroni corrected, so the verdicts hold for all metrics together
+        speedup, low, high = bootstrap_speedup(
+            means["A"][:, used],
+            means["B"][:, used],
+            resamples=20000,
+            confidence=1 - alpha / max(len(used), 1),
+        )
+        metrics = {}
+        print(f"{'metric':30} {'A [ms]':>10} {'B [ms]':>10} {'speedup':>8}  interval")
+        for index, col in enumerate(used):
+            metric = outheader[col + 1]
+            mean_a, mean_b = means["A"][:, col].mean(), means["B"][:, col].mean()
+            verdict = ab_verdict(low[index], high[index])
+            metrics[metric] = {
+                "a": mean_a,
+                "b": mean_b,
+                "speedup": speedup[index],
+                "low": low[index],
+                "high": high[index],
+                "verdict": verdict,
+            }
+            print(
+                f"{metric:30} {mean_a:10.3f} {mean_b:10.3f} {speedup[index]:8.3f}  "
+                f"[{low[index]:.3f}, {high[index]:.3f}] {verdict}"
+            )
+        print()
+        comparison[str(file)] = {"runs": len(paired), "skipticks": skip, "metrics": metrics}
 
-    exit()
+    with open(PurePath(folder, "ab_comparison.json"), "w") as f:
+        json.dump(
+            {"sides": {name: [str(b), str(m or "")] for name, (b, m) in zip(names, sides)}}
+            | {"maps": comparison},
+            f,
+            indent=2,
+            default=float,
+        )
+    for name in names:
+        # the runs are merged into the result of every side
+        shutil.rmtree(PurePath(folder, name, "runs"), ignore_errors=True)
+    return comparison
 
 
-def benchmark_folder(
-    ticks: int,
-    runs: int,
-    disable_mods: bool,
-    skipticks: int,
-    consistency: str,
-    map_regex: str = "*",
-    factorio_bin: str | None = None,
-    folder: str | None = None,
-    filenames: list[str] | list[PurePath] | None = None,
-    high_priority: bool | None = None,
-) -> None:
-    """Run benchmarks on all maps that match the given regular expression."""
+def benchmark_matrix(versions: list[str], folder: str | None = None, **options: Any) -> None:
+    """benchmarks the selected maps with every factorio version of `versions`, which are
+    installed into the version store if needed. Every version gets a normal result folder
+    '<folder>/<version>', `options` are passed to `benchmark_folder`. Afterwards the versions
+    are compared with `compare_matrix`."""
     if not folder:
-        folder = f"benchmark_on_{date.today()}_{datetime.now().strftime('%H_%M_%S')}"
-
-    Path(folder, "saves").mkdir(parents=True, exist_ok=True)
-    Path(folder, "graphs").mkdir(parents=True, exist_ok=True)
+        folder = f"matrix_on_{date.today()}_{datetime.now().strftime('%H_%M_%S')}"
+    installed = [install_version(version) for version in versions]
+    for version in installed:
+        print("==================")
+        print(f"factorio {version}")
+        print("==================")
+        benchmark_folder(
+            factorio_bin=str(version_binary(version)),
+            folder=str(PurePath(folder, version)),
+            **options,
+        )
+    compare_matrix(folder, installed)
 
-    files = [Path(file) for file in filenames] if filenames else [*Path("saves").glob(map_regex)]
 
-    factorio_path = PurePath(
-        factorio_bin or PurePath("factorio", "bin", "x64", "factorio")
-    )
+def plot_grouped_bar_chart(
+    values: dict[str, list[float]], maps: list[str], title: str, out_path: PurePath, xlabel: str
+) -> None:
+    """plots a group of horizontal bars per map, one bar for every key of `values`"""
+    from matplotlib.figure import Figure
 
-    print("Warming up the system...")
-    run_benchmark(
-        PurePath("saves", "factorio_maps", "big_bases", "flame10k.zip"),
-        folder,
-        ticks=100,
-        runs=1,
-        save=False,
-        disable_mods=disable_mods,
-        factorio_bin=factorio_path,
-        high_priority=high_priority,
-    )
-    print("Finished warming up, starting the actual benchmark...")
+    fig = Figure(figsize=(8, 1 + 0.3 * len(maps) * len(values)))
+    ax = fig.subplots()
+    height = 0.8 / len(values)
+    positions = np.arange(len(maps))
+    for i, (label, bars) in enumerate(values.items()):
+        ax.barh(positions + i * height, bars, height, label=label)
+    ax.set_yticks(positions + height * (len(values) - 1) / 2, maps)
+    ax.invert_yaxis()
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(out_path)
 
-    print()
-    print("==================")
-    print("benchmark maps")
-    print("==================")
-    print("")
 
-    for filename in files:
-        if filename.is_file():
-            print(filename)
-            Path(folder, PurePath(filename).parent).mkdir(parents=True, exist_ok=True)
-            run_benchmark(
-                filename,
-                folder,
-                ticks=ticks,
-                runs=runs,
-                save=True,
-                disable_mods=disable_mods,
-                factorio_bin=factorio_path,
-                high_priority=high_priority,
-            )
+def compare_matrix(folder: str, versions: list[str]) -> dict[str, dict[str, Any]]:
+    """compares the results of several versions in '<folder>/<version>': prints the mean
+    wholeUpdate of every map and version with the change to the first version, writes
+    the mean and p99 of every metric to 'matrix.json' and a chart per metric to 'graphs'."""
+    matrix: dict[str, dict[str, Any]] = {}
+    for version in versions:
+        version_folder = str(PurePath(folder, version))
+        for result_path in find_results(version_folder, "**/*"):
+            stats = read_result_header(result_path).get("statistics", {})
+            map_name = str(result_path.relative_to(Path(version_folder, "saves")))
+            matrix.setdefault(map_name, {})[version] = {
+                metric: {"mean": values["mean"], "p99": values["p99"]}
+                for metric, values in stats.items()
+            }
+    with open(PurePath(folder, "matrix.json"), "w") as f:
+        json.dump({"versions": versions, "maps": matrix}, f, indent=2)
 
-    print("==================")
-    print("creating graphs")
-    processed_table: list[list[float]] = []
-    maps: list[str] = []
-    errfile: list[list[int]] = []
-    old_subfolder = Path()
+    print(f"{'mean wholeUpdate [ms]':40}" + "".join(f"{version:>22}" for version in versions))
+    for map_name, results in sorted(matrix.items()):
+        line = f"{map_name:40}"
+        first = results.get(versions[0], {}).get("wholeUpdate", {}).get("mean")
+        for version in versions:
+            mean = results.get(version, {}).get("wholeUpdate", {}).get("mean")
+            if mean is None:
+                line += f"{'-':>22}"
+            elif first and version != versions[0]:
+                line += f"{mean:>12.3f} ({mean / first - 1:+6.1%})"
+            else:
+                line += f"{mean:>22.3f}"
+        print(line)
 
-    for file in sorted(Path(folder, "saves").glob(map_regex)):
-        # check if file is actually a file or a folder
+    graphs = Path(folder, "graphs")
+    graphs.mkdir(parents=True, exist_ok=True)
+    maps = sorted(matrix)
+    for col in itertools.chain(range(1, 11), range(22, 32)):
+        metric = outheader[col]
+        for statistic in ("mean", "p99"):
+            values = {
+                version: [
+                    matrix[map_name].get(version, {}).get(metric, {}).get(statistic, 0.0)
+                    for map_name in maps
+                ]
+                for version in versions
+            }
+            if not any(any(bars) for bars in values.values()):
+                continue
+            name = metric if statistic == "mean" else f"{metric}_p99"
+            plot_grouped_bar_chart(
+                values, maps, f"{metric} {statistic}", PurePath(graphs, f"{name}.png"), "ms/frame"
+            )
+    return matrix
 
-        if not Path.is_file(file):
-            continue
 
-        # check if we are in a new folder and if so generate the old graphs.
-        file_name = Path(file).name
-        subfolder = Path(file).parent
-        if old_subfolder.samefile(Path()):
-            old_subfolder = subfolder
-        # print(subfolder_name)
-        if not subfolder.samefile(old_subfolder):
-            plot_benchmark_results(
-                processed_table,
-                outheader,
-                maps,
-                folder,
-                PurePath(*old_subfolder.parts[2:]),
-                errfile,
+def history_costs(
+    database: str = HISTORY_DATABASE, hardware: str | None = None
+) -> dict[str, tuple[float, float]]:
+    """the mean wholeUpdate time in ms and the relative standard deviation of the run means
+    of the latest result of every map, results on `hardware` are preferred"""
+    connection = open_history(database)
+    latest: dict[str, tuple[bool, str, int, float]] = {}
+    for map_name, result_hardware, timestamp, result_id, mean in connection.execute(
+        "SELECT map, hardware, timestamp, id, mean FROM results "
+        "JOIN metrics ON metrics.result_id = results.id WHERE metric = 'wholeUpdate'"
+    ):
+        candidate = (result_hardware == hardware, timestamp, result_id, mean)
+        if map_name not in latest or candidate > latest[map_name]:
+            latest[map_name] = candidate
+    costs = {}
+    for map_name, (_, _, result_id, mean) in latest.items():
+        run_means = [
+            run_mean
+            for (run_mean,) in connection.execute(
+                "SELECT mean FROM run_metrics WHERE result_id = ? AND metric = 'wholeUpdate'",
+                (result_id,),
             )
-            processed_table = []
-            maps = []
-            old_subfolder = subfolder
+        ]
+        deviation = statistics.stdev(run_means) / mean if len(run_means) > 1 and mean else 0.02
+        costs[map_name] = (mean, deviation)
+    connection.close()
+    return costs
 
-        with open(file, "r", newline="") as cfile:
 
-            cfilestr = list(csv.reader(cfile, dialect="excel"))
-            inlist: list[list[float]] = []
-
-            for i in cfilestr[0 : len(cfilestr)]:
-                try:
-                    if int(i[0][1:]) % ticks < skipticks:
-                        # figure out how to actually skip these ticks.
-                        continue
-                    inlist.append([t / 1000000 for t in list(map(int, i[1:-1]))])
-                except Exception:  # noqa: PIE786
-                    pass
-                    # print("can't convert to int")
-
-            processed_line = []
-            maps.append(file_name)
-            for rowi in range(32):
-                processed_line.append(statistics.mean([a[rowi] for a in inlist]))
-            processed_table.append(processed_line)
+def fit_entity_costs(
+    censuses: dict[str, dict[str, Any]], means: dict[str, dict[str, float]]
+) -> dict[str, Any]:
+    """fits the mean time of every subsystem of `COST_MODEL` as a base time plus a cost per
+    counted thing, by least squares over all maps. `censuses` and the mean tick time of every
+    metric in ms (`means`) are by map. The costs are in µs per tick, the mean time of
+    wholeUpdate outside the fitted subsystems is kept as `rest`. Every fit keeps at least one
+    degree of freedom, so there are only as many entity types as the maps allow."""
+    maps = sorted(set(censuses) & set(means))
+    features = {map_name: census_features(censuses[map_name]) for map_name in maps}
+    model: dict[str, Any] = {"maps": maps, "metrics": {}}
+    for metric, counted in COST_MODEL.items():
+        names = [name for name in counted if name != "entities"]
+        if "entities" in counted:
+            totals: dict[str, float] = {}
+            for map_name in maps:
+                for entity_type, count in censuses[map_name].get("entities", {}).items():
+                    totals[entity_type] = totals.get(entity_type, 0) + count
+            names += sorted(totals, key=lambda name: -totals[name])[: len(maps) - len(names) - 2]
+        # a count that is the same on every map can't be told apart from the base time
+        names = [name for name in names if len({features[m].get(name, 0.0) for m in maps}) > 1]
+        if not names or len(maps) < len(names) + 2:
+            continue
+        x = np.array([[features[m].get(name, 0.0) for name in names] + [1.0] for m in maps])
+        y = np.array([means[m].get(metric, 0.0) for m in maps])
+        coefficients = np.linalg.lstsq(x, y, rcond=None)[0]
+        residual = float(((y - x @ coefficients) ** 2).sum())
+        variance = float(((y - y.mean()) ** 2).sum())
+        model["metrics"][metric] = {
+            "base": coefficients[-1].item(),
+            "costs": {name: cost.item() * 1000 for name, cost in zip(names, coefficients)},
+            "r2": 1 - residual / variance if variance > 0 else 1.0,
+        }
+    model["rest"] = (
+        statistics.mean(
+            means[m].get("wholeUpdate", 0.0) - sum(means[m].get(k, 0.0) for k in model["metrics"])
+            for m in maps
+        )
+        if maps
+        else 0.0
+    )
+    return model
 
-            if consistency is not None:
-                # do the consistency plot
-                plot_ups_consistency(
-                    folder=folder,
-                    subfolder=PurePath(*old_subfolder.parts[2:]),
-                    data=[a[consistency_index] for a in inlist],
-                    ticks=ticks,
-                    skipticks=skipticks,
-                    name="consistency_" + file_name + "_" + consistency,
-                )
 
-    plot_benchmark_results(
-        processed_table, outheader, maps, folder, PurePath(*old_subfolder.parts[2:]), errfile
-    )
+def predict_tick_time(model: dict[str, Any], census: dict[str, Any]) -> float:
+    """the wholeUpdate time in ms of a map with the `census`, by the fitted `model`
 
-    print("")
-    print("the benchmark is finished")
-    print("==================")
+    >>> model = {"rest": 1.0, "metrics": {"trains": {"base": 0.5, "costs": {"trains": 100}}}}
+    >>> predict_tick_time(model, {"entities": {}, "trains": 20})
+    3.5
+    """
+    features = census_features(census)
+    tick_time = float(model["rest"])
+    for fit in model["metrics"].values():
+        tick_time += fit["base"]
+        tick_time += sum(
+            cost / 1000 * features.get(name, 0.0) for name, cost in fit["costs"].items()
+        )
+    return tick_time
 
 
-def plot_ups_consistency(
-    folder: str,
-    subfolder: PurePath,
-    data: list[float],
-    ticks: int,
-    skipticks: int,
-    name: str = "default",
-) -> None:
-    subfolder_path = PurePath(folder, "graphs", subfolder)
+def fit_cost_model(
+    folder: str, factorio_bin: str | None = None, use_cache: bool = True
+) -> dict[str, Any]:
+    """fits the entity costs to the results in a result folder. The census of every map is
+    taken if it isn't cached yet. Prints the costs and the measured and predicted UPS of every
+    map, the model is written to 'entity_costs.json' in the folder."""
+    factorio_path = PurePath(factorio_bin or PurePath("factorio", "bin", "x64", "factorio"))
+    censuses: dict[str, dict[str, Any]] = {}
+    means: dict[str, dict[str, float]] = {}
+    for result_path in find_results(folder, "**/*"):
+        map_name = str(result_path.relative_to(folder))
+        map_ = Path(f"{map_name}.zip")
+        stats = read_result_header(result_path).get("statistics", {})
+        if not map_.is_file() or not stats:
+            print("no save or tick statistics for", map_name)
+            continue
+        census = map_census(map_, factorio_path, use_cache)
+        if census is None:
+            continue
+        censuses[map_name] = census
+        means[map_name] = {metric: values["mean"] for metric, values in stats.items()}
 
-    # if not Path(subfolder_path).exists:
-    Path(subfolder_path).mkdir(parents=True, exist_ok=True)
-    darray = []
-    med = []
-    maxi = []
-    mini = []
-
-    t = list(range(skipticks, ticks))
-    for i in range(int(len(data) / (ticks - skipticks))):
-        darray.append(data[(ticks - skipticks) * i : (ticks - skipticks) * (i + 1)])
-    for i in range(len(darray[0])):
-        # first discard the highest value as that can frequently be an outlier.
-        c = sorted([a[i] for a in darray])[:-1]
-        med.append(statistics.median(c))
-        maxi.append(max(c))
-        mini.append(min(c))
-
-    for i in range(int(len(data) / (ticks - skipticks))):
-        plt.plot(
-            t,
-            data[(ticks - skipticks) * i : (ticks - skipticks) * (i + 1)],
-            "k",
-            alpha=0.2,
-            linewidth=0.6,
+    model = fit_entity_costs(censuses, means)
+    print(f"fitted {len(model['maps'])} maps")
+    for metric, fit in model["metrics"].items():
+        print(f"{metric:40} base {fit['base']:8.3f} ms   R² {fit['r2']:.3f}")
+        for name, cost in fit["costs"].items():
+            print(f"  {name:38} {cost:12.4f} µs per tick")
+    if not model["metrics"]:
+        print("not enough maps to fit the costs")
+    print(f"{'map':60} {'measured UPS':>14} {'predicted UPS':>14}")
+    for map_name in model["maps"]:
+        predicted = predict_tick_time(model, censuses[map_name])
+        measured = means[map_name].get("wholeUpdate", 0.0)
+        print(
+            f"{map_name:60} {1000 / measured if measured else 0:14.1f} "
+            f"{1000 / predicted if predicted > 0 else 0:14.1f}"
         )
-    plt.plot(t, med, "r", label="median", linewidth=0.6)
-    plt.title(label=name)
-    plt.xlabel(xlabel="tick")
-    plt.ylabel(ylabel="tick time [ms]")
-    plt.legend()
-    plt.tight_layout()
-    # Use PurePath to build the file path for the output image
-    out_path = PurePath(subfolder_path, f"{name}_all.png")
-    # plt.show()
-    plt.savefig(out_path, dpi=800)
-    plt.clf()
-    plt.close()
-
-    plt.plot(t, maxi, label="maximum", linewidth=0.3)
-    plt.plot(t, mini, label="minimum", linewidth=0.3)
-    plt.plot(t, med, "r", label="median", linewidth=0.6)
-    plt.title(label=name)
-    plt.xlabel(xlabel="tick")
-    plt.ylabel(ylabel="tick time [ms]")
-    plt.legend()
-    plt.tight_layout()
-    # Use PurePath to build the file path for the output image
-    out_path = PurePath(subfolder_path, f"{name}_min_max_med.png")
-    # plt.show()
-    plt.savefig(out_path, dpi=800)
-    plt.clf()
-    plt.close()
+    with open(PurePath(folder, COST_MODEL_NAME), "w") as f:
+        json.dump(model, f, indent=2)
+    return model
 
 
-def plot_benchmark_results(
-    data_table: list[list[float]],
-    titles: list[str],
-    maps: list[str],
-    folder: str,
-    subfolder: PurePath,
-    errfile: list[list[int]],
+def predict_ups(
+    model_path: str, map_regex: str, factorio_bin: str | None = None, use_cache: bool = True
 ) -> None:
-    """Generate plots of benchmark results."""
-    # Create the output subfolder if it does not exist
-    subfolder_path = PurePath(folder, "graphs", subfolder)
-    # if not Path(subfolder_path).exists:
-    Path(subfolder_path).mkdir(parents=True, exist_ok=True)
+    """prints the UPS the fitted model in `model_path` predicts for the selected maps"""
+    factorio_path = PurePath(factorio_bin or PurePath("factorio", "bin", "x64", "factorio"))
+    with open(model_path) as f:
+        model = json.load(f)
+    for file in find_maps(map_regex):
+        if not file.is_file():
+            continue
+        census = map_census(file, factorio_path, use_cache)
+        if census is None:
+            print(f"{str(file):60} no census")
+            continue
+        tick_time = predict_tick_time(model, census)
+        print(f"{str(file):60} {1000 / tick_time if tick_time > 0 else 0:10.1f} UPS")
 
-    for col in itertools.chain(range(1, 11), range(22, 32)):
-        fig, ax = plt.subplots()
-        update = [a[col] for a in data_table]
-        hbars = ax.barh(maps, update)
-        ax.bar_label(
-            hbars,
-            labels=[f"{x:.3f}" for x in [a[col] for a in data_table]],
-            padding=3,
+
+def print_census(map_regex: str, factorio_bin: str | None = None, use_cache: bool = True) -> None:
+    """takes the census of the selected maps and prints the counts"""
+    factorio_path = PurePath(factorio_bin or PurePath("factorio", "bin", "x64", "factorio"))
+    for file in find_maps(map_regex):
+        if not file.is_file():
+            continue
+        census = map_census(file, factorio_path, use_cache)
+        if census is None:
+            print(f"{str(file):60} no census")
+            continue
+        entities: dict[str, int] = census["entities"]
+        print(
+            f"{str(file):60} {sum(entities.values()):9} entities "
+            + ", ".join(f"{census.get(name, 0)} {name}" for name in census if name != "entities")
         )
-        ax.margins(0.1, 0.05)
-        ax.set_title(titles[col])
-        ax.set_xlabel("Mean frametime [ms/frame]")
-        ax.set_ylabel("Map name")
-        plt.tight_layout()
-        # Use PurePath to build the file path for the output image
-        out_path = PurePath(subfolder_path, f"{titles[col]}.png")
-        plt.savefig(out_path)
-        plt.clf()
-        plt.close()
+        for entity_type, count in sorted(entities.items(), key=lambda item: -item[1])[:10]:
+            print(f"  {entity_type:38} {count:9}")
 
 
 def create_mods_dir() -> None:
@@ -532,10 +4004,17 @@ def create_mods_dir() -> None:
         destination.write_bytes(source.read_bytes())
 
 
+def parse_skipticks(value: str) -> int | None:
+    """'auto' (None) or a number of ticks"""
+    return None if value == "auto" else int(value)
+
+
 def init_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description=(
-            "Benchmark Factorio maps. " 'The default configuration is `-r "**" -s 20 -t 1000 -e 5'
+            "Benchmark Factorio maps. "
+            'The default configuration is `-r "**" -s auto -t 1000 -e 5`, the warm-up of every '
+            "map is detected (MSER-5)"
         )
     )
     parser.add_argument(
@@ -563,20 +4042,21 @@ def init_parser() -> argparse.ArgumentParser:
         help=str(
             "generates a update time consistency plot for the given metric. It "
             "has to be a metric accessible by --benchmark-verbose. the default "
-            "value is 'wholeUpdate'. the first 10 ticks are skipped.(this can "
-            "be set by setting '--skipticks'.",
+            "value is 'wholeUpdate'. the warm-up ticks are skipped (this can "
+            "be set by setting '--skipticks').",
         ),
     )
     parser.add_argument(
         "-s",
         "--skipticks",
-        type=int,
-        default="20",
+        type=parse_skipticks,
+        default="auto",
         help=str(
             "the amount of ticks that are ignored at the beginning of very "
             "benchmark. helps to get more consistent data, especially for "
             "consistency plots. change this to '0' if you want to use all the "
-            "data",
+            "data. by default ('auto') the warm-up of every map is detected from its tick "
+            "times and stored in the result.",
         ),
     )
     parser.add_argument(
@@ -596,6 +4076,27 @@ def init_parser() -> argparse.ArgumentParser:
             "higher if `--consistency` is set.",
         ),
     )
+    parser.add_argument(
+        "--target-error",
+        type=float,
+        help=str(
+            "adaptive repetitions: after the first `--repetitions` runs, more runs are added "
+            "in batches until the 95%% confidence interval of the mean tick time is within "
+            "this relative error (e.g. 0.01 for 1%%) or `--max-repetitions` is reached."
+        ),
+    )
+    parser.add_argument(
+        "--max-repetitions",
+        type=int,
+        default=20,
+        help="the maximum number of repetitions per map with `--target-error`. default 20",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=2,
+        help="the number of repetitions added per batch with `--target-error`. default 2",
+    )
     parser.add_argument(
         "--version_link",
         type=str,
@@ -605,6 +4106,29 @@ def init_parser() -> argparse.ArgumentParser:
             "forget to update afterwards.",
         ),
     )
+    parser.add_argument(
+        "--install-version",
+        nargs="+",
+        metavar="VERSION",
+        help=str(
+            "install headless factorio versions (like 1.1.100 or stable) into "
+            f"'{VERSION_STORE}/<version>', next to each other. uses `--sha256`"
+        ),
+    )
+    parser.add_argument(
+        "--matrix",
+        nargs="+",
+        metavar="VERSION",
+        help=str(
+            "benchmark the selected maps with each of these versions from the version store "
+            "(installed if needed) and compare them in tables and graphs"
+        ),
+    )
+    parser.add_argument(
+        "--sha256",
+        type=str,
+        help="the expected sha256 of the download of `-u` or `-m`",
+    )
     parser.add_argument(
         "-m",
         "--install_maps",
@@ -637,6 +4161,242 @@ def init_parser() -> argparse.ArgumentParser:
         ),
     )
     parser.add_argument("--custom_script", type=str, help="run a custom lua script upon migration.")
+    parser.add_argument(
+        "--max-run-time",
+        type=float,
+        metavar="SECONDS",
+        help="abort a benchmark (one factorio call) after this many seconds and skip the map",
+    )
+    parser.add_argument(
+        "--min-ups",
+        type=float,
+        metavar="UPS",
+        help=str(
+            "abort a benchmark and skip the map if a run is slower than this. Factorio reports "
+            "a run only once it is over, so this skips the remaining runs, a slow last run is "
+            "kept"
+        ),
+    )
+    parser.add_argument(
+        "--min-ups-after",
+        type=int,
+        default=1000,
+        metavar="TICKS",
+        help="runs with fewer ticks aren't checked against `--min-ups`. default 1000",
+    )
+    parser.add_argument(
+        "--stage",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help=str(
+            "copy the saves into a RAM backed directory (default /dev/shm) ahead of their "
+            "benchmark, so loading them doesn't depend on the disk or network"
+        ),
+    )
+    parser.add_argument(
+        "--stage-budget",
+        type=float,
+        metavar="MB",
+        help=f"the memory the staged saves may take, implies `--stage`. default {STAGE_BUDGET_MB}",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help=str(
+            "serve the progress of the benchmark on http://127.0.0.1:PORT/metrics (prometheus) "
+            "and /progress (json). It is updated after every run"
+        ),
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        metavar="SECONDS",
+        help=str(
+            "split a wall clock budget into runs per map, so the total measurement error is as "
+            "small as possible. the run durations and their spread are predicted from the "
+            "history database, the priority of the manifests weights the maps."
+        ),
+    )
+    parser.add_argument(
+        "--telemetry",
+        type=float,
+        nargs="?",
+        const=0.1,
+        metavar="INTERVAL",
+        help=str(
+            "sample the memory, cpu time, context switches and page faults of factorio and the "
+            "cpu frequency and load of the system every INTERVAL seconds (default 0.1) and "
+            "store them next to the tick data. hardware counters are recorded with perf if "
+            "it is installed."
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=str(
+            "always benchmark every map. by default runs are stored in 'cache/results' and "
+            "reused as long as the map, factorio version, mods and ticks are the same. if "
+            "more repetitions are requested than cached only the missing ones are run."
+        ),
+    )
+    parser.add_argument(
+        "--coordinator",
+        type=str,
+        metavar="[HOST:]PORT",
+        help=str(
+            "distribute the selected maps to workers (`--worker`) instead of benchmarking "
+            "them here. uses `-r`, `-t`, `-e`, `-dm`, `-s` and `-c`."
+        ),
+    )
+    parser.add_argument(
+        "--versions",
+        nargs="+",
+        help="with `--coordinator`: benchmark every map on workers with each of these versions",
+    )
+    parser.add_argument(
+        "--lease-timeout",
+        type=float,
+        default=60,
+        help=str(
+            "with `--coordinator`: seconds without a heartbeat after which a worker counts as "
+            "dead and its job is retried. default 60"
+        ),
+    )
+    parser.add_argument(
+        "--worker",
+        type=str,
+        metavar="URL",
+        help="run the jobs of the coordinator at URL, e.g. http://benchmark-master:8000",
+    )
+    parser.add_argument(
+        "--worker-name",
+        type=str,
+        help="the name of this worker, letters, digits, _, . and -. default <hostname>-<pid>",
+    )
+    parser.add_argument(
+        "--database",
+        type=str,
+        default=HISTORY_DATABASE,
+        help=f"the history database every result is added to. default '{HISTORY_DATABASE}'",
+    )
+    parser.add_argument(
+        "--ingest",
+        nargs="+",
+        metavar="FOLDER",
+        help="add existing result folders to the history database. uses `-s`",
+    )
+    parser.add_argument(
+        "--list-saves",
+        action="store_true",
+        help=str(
+            "list the saves selected with `-r` grouped by their mods, with their version, size "
+            "and if they need to be migrated. uses the save index in 'cache/saves.json'"
+        ),
+    )
+    parser.add_argument(
+        "--convert",
+        nargs="+",
+        metavar="FOLDER",
+        help=str(
+            "pack the results in existing result folders into compressed '.ticks' archives, "
+            "like new results are stored"
+        ),
+    )
+    parser.add_argument(
+        "--census",
+        action="store_true",
+        help=str(
+            "count the entities by type, transport lines, fluid systems, electric networks and "
+            "trains of the maps selected with `-r` on a headless server. the counts are cached "
+            "in 'cache/census' until the save changes"
+        ),
+    )
+    parser.add_argument(
+        "--fit-costs",
+        type=str,
+        metavar="FOLDER",
+        help=str(
+            "fit the time of the subsystems to the census of the maps in a result folder, "
+            f"which gives a cost per entity. the model is written to '{COST_MODEL_NAME}'"
+        ),
+    )
+    parser.add_argument(
+        "--predict-ups",
+        type=str,
+        metavar="MODEL",
+        help=f"predict the UPS of the maps selected with `-r` with a '{COST_MODEL_NAME}'",
+    )
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("OLD_VERSION", "NEW_VERSION"),
+        help="list the statistically significant slowdowns between two factorio versions",
+    )
+    parser.add_argument(
+        "--ab",
+        nargs=2,
+        metavar=("BIN_A", "BIN_B"),
+        help=str(
+            "compare two factorio binaries. the runs of both are interleaved (ABBA) on every map "
+            "and the speedup of B over A is reported per metric with a bootstrap confidence "
+            "interval. `-e` is the number of runs per side."
+        ),
+    )
+    parser.add_argument(
+        "--ab-mods",
+        nargs=2,
+        metavar=("MODS_A", "MODS_B"),
+        help="compare two mod directories like `--ab`, can be combined with it",
+    )
+    parser.add_argument(
+        "--regressions",
+        action="store_true",
+        help="list the significant slowdowns of every map between its two latest versions",
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=0.05,
+        help="significance level for `--compare` and `--regressions`. default 0.05",
+    )
+    parser.add_argument(
+        "--min-change",
+        type=float,
+        default=0.01,
+        help="the minimum relative slowdown that is reported. default 0.01",
+    )
+    parser.add_argument(
+        "--graphs",
+        choices=["png", "html", "both"],
+        default="both",
+        help=str(
+            "render the graphs as png files, as an interactive html report ('report.html' in "
+            "the result folder) or both. the report shows every tick of the `-c` metric, or "
+            "wholeUpdate, and a downsampled series of every other metric."
+        ),
+    )
+    parser.add_argument(
+        "--render-only",
+        type=str,
+        metavar="FOLDER",
+        help=str(
+            "don't run any benchmarks, only aggregate the results in the given result folder "
+            "and render the graphs again. uses `-r`, `-s` and `-c`."
+        ),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=str(
+            "the number of factorio instances that run in parallel. every instance is pinned "
+            "to its own set of cores (one L3 cache if possible). with `-mi` "
+            "the number of servers that migrate maps at the same time."
+        ),
+    )
     return parser
 
 
@@ -646,52 +4406,156 @@ def init_parser() -> argparse.ArgumentParser:
 if __name__ == "__main__":
     atexit.register(exit_handler)
     args = init_parser().parse_args()
-    consistency_index: int = 0
     create_mods_dir()
     if args.consistency is not None:
         try:
-            consistency_index = outheader.index(args.consistency)
+            outheader.index(args.consistency)
         except ValueError as e:
             print("the chosen consistency variable doesn't exist:", e)
             exit(0)
 
+    if args.list_saves:
+        list_saves(args.regex)
+        exit()
+
+    if args.convert is not None:
+        for result_folder in args.convert:
+            convert_results(result_folder)
+        exit()
+
+    if args.census:
+        print_census(args.regex, use_cache=not args.no_cache)
+        exit()
+
+    if args.fit_costs is not None:
+        fit_cost_model(args.fit_costs, use_cache=not args.no_cache)
+        exit()
+
+    if args.predict_ups is not None:
+        predict_ups(args.predict_ups, args.regex, use_cache=not args.no_cache)
+        exit()
+
+    if args.ingest is not None:
+        for result_folder in args.ingest:
+            ingest_results(result_folder, args.skipticks, args.database)
+        exit()
+
+    if args.compare is not None:
+        old_version, new_version = args.compare
+        compare_versions(old_version, new_version, args.database, args.alpha, args.min_change)
+        exit()
+
+    if args.regressions:
+        find_regressions(args.database, args.alpha, args.min_change)
+        exit()
+
+    if args.render_only is not None:
+        render_results(
+            args.render_only, args.regex, args.skipticks, args.consistency, graphs=args.graphs
+        )
+        exit()
+
+    if args.worker is not None:
+        run_worker(args.worker, name=args.worker_name)
+        exit()
+
+    if args.coordinator is not None:
+        run_coordinator(
+            args.coordinator,
+            args.ticks,
+            args.repetitions,
+            args.disable_mods,
+            args.skipticks,
+            args.consistency,
+            map_regex=args.regex,
+            versions=args.versions,
+            lease_timeout=args.lease_timeout,
+        )
+        exit()
+
     if args.migrate is not None:
 
         if args.migrate == "inplace":
             if args.custom_script:
-                migrate_folder(True, map_regex=args.regex, custom_script=args.custom_script)
+                migrate_folder(
+                    True, map_regex=args.regex, custom_script=args.custom_script, jobs=args.jobs
+                )
             else:
-                migrate_folder(True, map_regex=args.regex)
+                migrate_folder(True, map_regex=args.regex, jobs=args.jobs)
         elif args.migrate == "copy":
             if args.custom_script:
-                migrate_folder(False, map_regex=args.regex, custom_script=args.custom_script)
+                migrate_folder(
+                    False, map_regex=args.regex, custom_script=args.custom_script, jobs=args.jobs
+                )
             else:
-                migrate_folder(False, map_regex=args.regex)
+                migrate_folder(False, map_regex=args.regex, jobs=args.jobs)
         exit()
 
     if args.update:
         if args.version_link:
-            install_factorio(args.version_link)
+            install_factorio(args.version_link, args.sha256)
         else:
-            install_factorio()
+            install_factorio(sha256=args.sha256)
         create_mods_dir()
         exit()
 
     if args.install_maps:
-        install_maps(args.install_maps)
+        install_maps(args.install_maps, args.sha256)
+        exit()
+
+    if args.install_version:
+        for version in args.install_version:
+            install_version(version, args.sha256)
+        print("stored versions:", ", ".join(stored_versions()))
         exit()
 
     if args.disable_mods:
         sync_mods(map=PurePath(""), disable_all=True)
 
-    benchmark_folder(
-        args.ticks,
-        args.repetitions,
-        args.disable_mods,
-        args.skipticks,
-        args.consistency,
-        map_regex=args.regex,
-        high_priority=args.high_priority,
-    )
+    if args.ab is not None or args.ab_mods is not None:
+        default_bin = PurePath("factorio", "bin", "x64", "factorio")
+        bins = [PurePath(b) for b in args.ab] if args.ab else [default_bin] * 2
+        mods_dirs: list[PurePath | None] = [None, None]
+        if args.ab_mods:
+            mods_dirs = [PurePath(m) for m in args.ab_mods]
+        ab_compare(
+            [file for file in find_maps(args.regex) if file.is_file()],
+            list(zip(bins, mods_dirs)),
+            args.ticks,
+            args.repetitions,
+            disable_mods=args.disable_mods or args.ab_mods is not None,
+            skipticks=args.skipticks,
+            high_priority=args.high_priority,
+            alpha=args.alpha,
+        )
+        exit()
+
+    options: dict[str, Any] = {
+        "ticks": args.ticks,
+        "runs": args.repetitions,
+        "disable_mods": args.disable_mods,
+        "skipticks": args.skipticks,
+        "consistency": args.consistency,
+        "map_regex": args.regex,
+        "high_priority": args.high_priority,
+        "jobs": args.jobs,
+        "use_cache": not args.no_cache,
+        "target_error": args.target_error,
+        "max_runs": args.max_repetitions,
+        "batch_size": args.batch_size,
+        "telemetry": args.telemetry,
+        "graphs": args.graphs,
+        "time_budget": args.time_budget,
+        "database": args.database,
+        "metrics_port": args.metrics_port,
+        "stage_dir": args.stage,
+        "stage_budget": args.stage_budget,
+    }
+    if args.max_run_time is not None or args.min_ups is not None:
+        options["abort"] = AbortRules(args.max_run_time, args.min_ups, args.min_ups_after)
+    if args.matrix is not None:
+        benchmark_matrix(args.matrix, **options)
+    else:
+        benchmark_folder(**options)
 
     # plot_benchmark_results()
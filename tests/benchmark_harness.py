@@ -0,0 +1,148 @@
+"""benchmarks of the benchmarker itself, so changes to the harness don't add overhead to the
+measurements. Runs on the fake factorio of `fake_factorio.py`:
+
+    python -m tests.benchmark_harness --output harness.json
+    python -m tests.benchmark_harness --baseline harness.json
+
+Every benchmark reports a throughput (higher is better), the best of `--repeat` rounds. With
+a baseline the exit code is 1 if any of them got more than `--max-slowdown` slower.
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path, PurePath
+
+import numpy as np
+
+import benchmarker
+from tests import fake_factorio
+
+
+def fake_log(ticks: int, runs: int) -> bytes:
+    """the output of the fake factorio for a benchmark"""
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        fake_factorio.benchmark(
+            ["--benchmark-ticks", str(ticks), "--benchmark-runs", str(runs)], time.monotonic()
+        )
+        return sys.stdout.getvalue().encode()
+    finally:
+        sys.stdout = stdout
+
+
+def quiet(function: Callable[[], object], clock: Callable[[], float] = time.perf_counter) -> float:
+    """runs `function` with its output thrown away and returns the seconds it took"""
+    with open(os.devnull, "w") as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            start = clock()
+            function()
+            return clock() - start
+        finally:
+            sys.stdout = stdout
+
+
+def run_suite(ticks: int, runs: int, repeat: int, workdir: Path) -> dict[str, float]:
+    """the throughput of every benchmark, in ticks or graphs per second"""
+    log = fake_log(ticks, runs)
+    tick_data = np.array(
+        [values for _, values in benchmarker.read_benchmark_log(io.BytesIO(log)) if values],
+        dtype=np.int64,
+    ).reshape(runs, ticks, len(benchmarker.outheader))
+    total = runs * ticks
+    factorio = fake_factorio.install(workdir / "bin")
+    os.chdir(workdir)
+    Path("saves").mkdir(exist_ok=True)
+    Path("saves", "map.zip").write_bytes(b"map")
+
+    def parse() -> None:
+        for _ in benchmarker.read_benchmark_log(io.BytesIO(log)):
+            pass
+
+    def archive() -> None:
+        for col in range(tick_data.shape[2]):
+            column = tick_data[:, :, col]
+            benchmarker.decode_column(benchmarker.encode_column(column), column.shape)
+
+    def run_benchmark() -> None:
+        shutil.rmtree("out", ignore_errors=True)
+        Path("out", "saves").mkdir(parents=True)
+        benchmarker.run_benchmark(PurePath("saves", "map.zip"), "out", ticks, runs, factorio)
+
+    def render() -> None:
+        shutil.rmtree(Path("out", "graphs"), ignore_errors=True)
+        benchmarker.render_results("out", "**/*", 0, "wholeUpdate", graphs="png")
+
+    benchmarks: dict[str, tuple[Callable[[], object], float]] = {
+        "parse ticks/s": (parse, total),
+        "statistics ticks/s": (lambda: benchmarker.tick_statistics(tick_data), total),
+        "warm-up detection ticks/s": (
+            lambda: benchmarker.detect_warmup(np.median(tick_data[:, :, 1], axis=0)),
+            ticks,
+        ),
+        "archive ticks/s": (archive, total),
+        "report ticks/s": (
+            lambda: benchmarker.series_pyramid(tick_data[:, :, 1] / 1000000, "s"),
+            total,
+        ),
+    }
+    results = {}
+    for name, (function, amount) in benchmarks.items():
+        results[name] = amount / min(quiet(function) for _ in range(repeat))
+    results["run_benchmark ticks/s"] = total / min(quiet(run_benchmark) for _ in range(repeat))
+    # only the cpu time of the harness, without the fake factorio
+    cpu_seconds = min(quiet(run_benchmark, time.process_time) for _ in range(repeat))
+    results["run_benchmark ticks/cpu-s"] = total / cpu_seconds
+    seconds = min(quiet(render) for _ in range(repeat))
+    results["graphs/s"] = len(list(Path("out", "graphs").rglob("*.png"))) / seconds
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=20000, help="ticks per run. default 20000")
+    parser.add_argument("--runs", type=int, default=3, help="runs per benchmark. default 3")
+    parser.add_argument("--repeat", type=int, default=3, help="rounds per benchmark. default 3")
+    parser.add_argument("--output", type=str, help="write the results to this json file")
+    parser.add_argument("--baseline", type=str, help="compare with the results in this file")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=0.1,
+        help="the relative slowdown against the baseline that fails. default 0.1",
+    )
+    args = parser.parse_args()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            results = run_suite(args.ticks, args.runs, args.repeat, Path(workdir))
+        finally:
+            os.chdir(cwd)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failed = False
+    for name, value in results.items():
+        line = f"{name:28} {value:14,.1f}"
+        if name in baseline:
+            change = value / baseline[name] - 1
+            failed |= change < -args.max_slowdown
+            line += f" {change:+8.1%}"
+        print(line)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""a stand-in for the factorio binary, for the tests and the harness benchmarks.
+
+It answers `--version`, runs `--benchmark` with `--benchmark-verbose all` output and serves a
+map with `--start-server` and an RCON interface. The entity census is answered with the
+`census.json` in the save, or an empty one. The tick times are synthetic: every metric
+has a base cost with noise, the first ticks are slower (warm-up) and there are occasional
+spikes. They are set with environment variables:
+
+FAKE_FACTORIO_VERSION   the version, default 1.1.100
+FAKE_FACTORIO_TICK_MS   the mean wholeUpdate time in ms, default 2
+FAKE_FACTORIO_NOISE     the relative noise of every metric, default 0.05
+FAKE_FACTORIO_WARMUP    the number of slower ticks at the start of every run, default 50
+FAKE_FACTORIO_LOAD_MS   how long loading the map takes in ms, default 0
+FAKE_FACTORIO_RUN_MS    the wall time of every run in ms, a script logs a line during it,
+                        default 0
+FAKE_FACTORIO_SEED      the random seed, by default a different one every time
+"""
+import json
+import os
+import random
+import socket
+import stat
+import struct
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+# the --benchmark-verbose columns after the timestamp, as a share of the game update
+METRICS = {
+    "wholeUpdate": 1.0,
+    "latencyUpdate": 0.01,
+    "gameUpdate": 0.95,
+    "circuitNetworkUpdate": 0.03,
+    "transportLinesUpdate": 0.2,
+    "fluidsUpdate": 0.05,
+    "heatManagerUpdate": 0.005,
+    "entityUpdate": 0.4,
+    "particleUpdate": 0.01,
+    "mapGenerator": 0.0,
+    "mapGeneratorBasicTilesSupportCompute": 0.0,
+    "mapGeneratorBasicTilesSupportApply": 0.0,
+    "mapGeneratorCorrectedTilesPrepare": 0.0,
+    "mapGeneratorCorrectedTilesCompute": 0.0,
+    "mapGeneratorCorrectedTilesApply": 0.0,
+    "mapGeneratorVariations": 0.0,
+    "mapGeneratorEntitiesPrepare": 0.0,
+    "mapGeneratorEntitiesCompute": 0.0,
+    "mapGeneratorEntitiesApply": 0.0,
+    "crcComputation": 0.0,
+    "electricNetworkUpdate": 0.08,
+    "logisticManagerUpdate": 0.04,
+    "constructionManagerUpdate": 0.01,
+    "pathFinder": 0.01,
+    "trains": 0.06,
+    "trainPathFinder": 0.005,
+    "commander": 0.002,
+    "chartRefresh": 0.02,
+    "luaGarbageIncremental": 0.002,
+    "chartUpdate": 0.01,
+    "scriptUpdate": 0.03,
+}
+
+
+def install(directory: Path, **settings: str) -> Path:
+    """writes an executable `factorio` into `directory` that runs this script with the
+    current interpreter and returns its path. `settings` like version="1.1.101" are set as
+    FAKE_FACTORIO_* environment variables."""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / "factorio"
+    exports = "".join(f'export FAKE_FACTORIO_{k.upper()}="{v}"\n' for k, v in settings.items())
+    path.write_text(
+        f'#!/bin/sh\n{exports}exec "{sys.executable}" "{Path(__file__).absolute()}" "$@"\n'
+    )
+    path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def option(args: list[str], name: str, default: str | None = None) -> str | None:
+    """the value after `name` in the command line"""
+    return args[args.index(name) + 1] if name in args else default
+
+
+def log(start: float, message: str) -> None:
+    """a line of the factorio log, with the seconds since the start in front"""
+    sys.stdout.write(f"{time.monotonic() - start:8.3f} {message}\n")
+    sys.stdout.flush()
+
+
+def tick_rows(ticks: int, rng: random.Random, clock: int) -> tuple[list[str], int, int]:
+    """the verbose rows of one run, the total update time and the clock after the run"""
+    tick_ns = float(os.environ.get("FAKE_FACTORIO_TICK_MS", "2")) * 1000000
+    noise = float(os.environ.get("FAKE_FACTORIO_NOISE", "0.05"))
+    warmup = int(os.environ.get("FAKE_FACTORIO_WARMUP", "50"))
+    rows = []
+    total = 0
+    for tick in range(ticks):
+        scale = 1 + (warmup - tick) / warmup if tick < warmup else 1.0
+        if rng.random() < 0.002:
+            # garbage collection, autosaves and the like
+            scale *= rng.uniform(3, 10)
+        values = [
+            max(int(share * tick_ns * scale * rng.gauss(1, noise)), 0) if share else 0
+            for share in METRICS.values()
+        ]
+        total += values[0]
+        rows.append(f"t{tick},{clock}," + ",".join(map(str, values)) + ",")
+        clock += values[0] + 50000
+    return rows, total, clock
+
+
+def benchmark(args: list[str], start: float) -> None:
+    """the output of `--benchmark` with `--benchmark-verbose all`"""
+    map_ = option(args, "--benchmark")
+    ticks = int(option(args, "--benchmark-ticks", "1000") or 1000)
+    runs = int(option(args, "--benchmark-runs", "1") or 1)
+    seed = os.environ.get("FAKE_FACTORIO_SEED")
+    rng = random.Random(int(seed) if seed is not None else None)
+    log(start, f"Loading map {map_}: {os.path.getsize(map_) if map_ else 0} bytes.")
+    time.sleep(float(os.environ.get("FAKE_FACTORIO_LOAD_MS", "0")) / 1000)
+    log(start, "Loading Mod settings")
+    log(start, "Info PlayerData.cpp:71: Local player-data.json unavailable")
+    clock = time.monotonic_ns()
+    verbose = []
+    run_ms = float(os.environ.get("FAKE_FACTORIO_RUN_MS", "0"))
+    for run in range(runs):
+        rows, total, clock = tick_rows(ticks, rng, max(clock, time.monotonic_ns()))
+        if run_ms:
+            time.sleep(run_ms / 1000)
+            log(start, f"Script @__level__/control.lua:1: run {run + 1}")
+        sys.stdout.write(f"  Performed {ticks} updates in {total / 1000000:.3f} ms\n")
+        sys.stdout.write(
+            f"  avg: {total / ticks / 1000000:.3f} ms, checksum: {rng.getrandbits(32)}\n"
+        )
+        verbose.append(f"run {run + 1}:")
+        verbose.append("tick,timestamp," + ",".join(METRICS) + ",")
+        verbose.extend(rows)
+    sys.stdout.write("\n".join(verbose) + "\n")
+    log(start, "Goodbye")
+
+
+def read_packet(connection: socket.socket) -> tuple[int, int, str] | None:
+    """the next RCON packet, None if the connection was closed"""
+    data = b""
+    while len(data) < 4 or len(data) < 4 + struct.unpack("<i", data[:4])[0]:
+        chunk = connection.recv(4096)
+        if not chunk:
+            return None
+        data += chunk
+    length, packet_id, packet_type = struct.unpack("<iii", data[:12])
+    return packet_id, packet_type, data[12 : 4 + length - 2].decode()
+
+
+def send_packet(connection: socket.socket, packet_id: int, packet_type: int, body: str) -> None:
+    payload = struct.pack("<ii", packet_id, packet_type) + body.encode() + b"\0\0"
+    connection.sendall(struct.pack("<i", len(payload)) + payload)
+
+
+def census(map_: Path) -> str:
+    """the answer to the census script: the `census.json` in the save"""
+    with zipfile.ZipFile(map_) as archive:
+        if "census.json" in archive.namelist():
+            return archive.read("census.json").decode()
+    counts = (
+        "transport_lines",
+        "fluid_systems",
+        "electric_networks",
+        "electric_entities",
+        "trains",
+    )
+    return json.dumps({"entities": {}} | {name: 0 for name in counts})
+
+
+def server(args: list[str], start: float) -> None:
+    """a headless server that loads a map and answers RCON commands until it is killed"""
+    map_ = Path(option(args, "--start-server") or "")
+    rcon_port = int(option(args, "--rcon-port", "27015") or 27015)
+    password = option(args, "--rcon-password", "")
+    log(start, f"Loading map {map_}: {map_.stat().st_size} bytes.")
+    log(start, "Hosting game at IP ADDR:({0.0.0.0:" + str(option(args, "--port", "34197")) + "})")
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("127.0.0.1", rcon_port))
+        listener.listen()
+        log(start, "Starting RCON interface at IP ADDR:({0.0.0.0:" + str(rcon_port) + "})")
+        connection, address = listener.accept()
+    with connection:
+        packet = read_packet(connection)
+        if packet is None:
+            return
+        authenticated = packet[1] == 3 and packet[2] == password
+        send_packet(connection, packet[0] if authenticated else -1, 2, "")
+        if not authenticated:
+            log(start, "Authentication failed")
+            return
+        log(start, f"New RCON connection from IP ADDR:({{{address[0]}:{address[1]}}})")
+        while (packet := read_packet(connection)) is not None:
+            packet_id, _, command = packet
+            if command.startswith("/server-save"):
+                send_packet(connection, packet_id, 0, "")
+                log(start, f"Saving game as {map_.absolute()}")
+                map_.touch()
+                log(start, "Saving finished")
+            elif "table_to_json" in command:
+                send_packet(connection, packet_id, 0, census(map_))
+            else:
+                send_packet(connection, packet_id, 0, f"executed {command}")
+    while True:
+        time.sleep(1)
+
+
+def main(args: list[str]) -> None:
+    version = os.environ.get("FAKE_FACTORIO_VERSION", "1.1.100")
+    if "--version" in args:
+        print(f"Version: {version} (build 12345, linux64, headless)")
+        print("Binary version: 64")
+        return
+    start = time.monotonic()
+    log(
+        start,
+        f"{time.strftime('%Y-%m-%d %H:%M:%S')}; Factorio {version} (build 12345, linux64, headless)",
+    )
+    log(start, "Program arguments: " + " ".join(f'"{arg}"' for arg in args))
+    if "--benchmark" in args:
+        benchmark(args, start)
+    elif "--start-server" in args:
+        server(args, start)
+    else:
+        log(start, "Error: nothing to do")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,1083 @@
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import threading
+import urllib.error
+import urllib.request
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import benchmarker
+from tests import benchmark_harness, fake_factorio
+
+
+@pytest.fixture(autouse=True)
+def version_cache(tmp_path, monkeypatch):
+    # every test probes the factorio versions into a cache of its own
+    monkeypatch.setattr(benchmarker, "factorio_versions", {})
+    cache = benchmarker.PurePath(tmp_path, "cache", "factorio_versions.json")
+    monkeypatch.setattr(benchmarker, "VERSION_CACHE", cache)
+
+
+def test_parse_tick_line() -> None:
+    values = list(range(len(benchmarker.outheader)))
+    line = "t12," + ",".join(map(str, values)) + ","
+    assert benchmarker.parse_tick_line(line) == values
+    assert benchmarker.parse_tick_line("tick,timestamp,wholeUpdate,") is None
+    assert benchmarker.parse_tick_line("  Performed 1000 updates in 1234.5 ms") is None
+
+
+def test_read_benchmark_log() -> None:
+    values = ",".join(["1"] * len(benchmarker.outheader))
+    stream = io.BytesIO(f"  Performed 1 updates in 2.000 ms\r\nt0,{values},\r\n".encode())
+    lines = list(benchmarker.read_benchmark_log(stream))
+    assert lines[0] == ("  Performed 1 updates in 2.000 ms", None)
+    assert lines[1][1] == [1] * len(benchmarker.outheader)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """serves `content` with range requests, the first `drops` responses are cut off"""
+
+    content = b""
+    drops = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        start = int(self.headers.get("Range", "bytes=0-")[6:].split("-")[0])
+        body = self.content[start:]
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if RangeHandler.drops > 0:
+            RangeHandler.drops -= 1
+            body = body[: len(body) // 2]
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(benchmarker.time, "sleep", lambda seconds: None)
+    httpd = HTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/download"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_install_maps_resumes(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as maps:
+        maps.writestr("group/map.zip", os.urandom(100000))
+    RangeHandler.content = archive.getvalue()
+    RangeHandler.drops = 2
+    benchmarker.install_maps(server, hashlib.sha256(RangeHandler.content).hexdigest())
+    assert (tmp_path / "saves" / "group" / "map.zip").stat().st_size == 100000
+    assert not list(tmp_path.glob("maps.zip*"))
+
+
+def test_install_factorio_streams(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:xz") as tar:
+        data = os.urandom(200000)
+        info = tarfile.TarInfo("factorio/bin/x64/factorio")
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    RangeHandler.content = archive.getvalue()
+    RangeHandler.drops = 1
+    benchmarker.install_factorio(server)
+    assert (tmp_path / "factorio" / "bin" / "x64" / "factorio").read_bytes() == data
+    assert not list(tmp_path.glob("factorio.tar.xz*"))
+
+
+def test_install_factorio_verifies_before_extracting(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:xz") as tar:
+        info = tarfile.TarInfo("factorio/bin/x64/factorio")
+        info.size = 4
+        tar.addfile(info, io.BytesIO(b"fake"))
+    RangeHandler.content = archive.getvalue()
+    RangeHandler.drops = 0
+    with pytest.raises(ValueError):
+        benchmarker.install_factorio(server, "0" * 64)
+    assert not list(tmp_path.iterdir())
+    benchmarker.install_factorio(server, hashlib.sha256(RangeHandler.content).hexdigest())
+    assert (tmp_path / "factorio" / "bin" / "x64" / "factorio").read_bytes() == b"fake"
+    assert not list(tmp_path.glob("factorio.tar.xz*"))
+
+
+def test_install_version_resolves_aliases(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    seen = []
+
+    class AliasHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_HEAD(self):
+            seen.append(("HEAD", self.path))
+            if self.path.startswith("/stable/"):
+                self.send_response(302)
+                self.send_header("Location", "/releases/factorio-headless_linux_1.1.100.tar.xz")
+            else:
+                self.send_response(200)
+            self.end_headers()
+
+        def do_GET(self):
+            seen.append(("GET", self.path))
+            self.send_response(404)
+            self.end_headers()
+
+    httpd = HTTPServer(("127.0.0.1", 0), AliasHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    link = f"http://127.0.0.1:{httpd.server_port}/{{version}}/headless/linux64"
+    monkeypatch.setattr(benchmarker, "DOWNLOAD_LINK", link)
+    binary = tmp_path / benchmarker.version_binary("1.1.100")
+    binary.parent.mkdir(parents=True)
+    binary.touch()
+    try:
+        assert benchmarker.install_version("stable") == "1.1.100"
+        assert benchmarker.install_version("1.1.100") == "1.1.100"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert [method for method, path in seen] == ["HEAD", "HEAD"]
+
+
+def test_download_checksum_mismatch(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    RangeHandler.content = b"not the expected content"
+    RangeHandler.drops = 0
+    with pytest.raises(ValueError), benchmarker.Download(server, "file") as download:
+        download.finish("0" * 64)
+    assert not list(tmp_path.iterdir())
+
+
+def make_save(path, mods):
+    def string(s):
+        return bytes([len(s)]) + s.encode()
+
+    header = bytes([1, 0, 1, 0, 80, 0, 0, 0, 0]) + string("") + string("map") + string("base")
+    header += bytes(3) + string("") + bytes(4) + bytes([1, 1, 80, 0, 0, 0, len(mods)])
+    for name, version in mods:
+        header += string(name) + bytes(map(int, version.split("."))) + bytes(4)
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("map/level-init.dat", header)
+        archive.writestr("map/level.dat0", b"")
+
+
+def test_prepare_mods_syncs_every_mod_set_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mods = [("base", "1.1.80"), ("Krastorio2", "1.3.21")]
+    for name in ("a", "b"):
+        make_save(tmp_path / f"{name}.zip", mods)
+    make_save(tmp_path / "c.zip", mods[:1])
+    mods_dir = tmp_path / "factorio" / "mods"
+    mods_dir.mkdir(parents=True)
+    synced = []
+
+    def sync_mods(map_, disable_all=False):
+        synced.append(map_.name)
+        enabled = {name for name, _ in benchmarker.read_save_mods(map_)}
+        mod_list = [{"name": name, "enabled": name in enabled} for name in ("base", "Krastorio2")]
+        (mods_dir / "mod-list.json").write_text(benchmarker.json.dumps({"mods": mod_list}))
+        (mods_dir / "Krastorio2_1.3.21.zip").write_bytes(b"mod")
+
+    monkeypatch.setattr(benchmarker, "sync_mods", sync_mods)
+    assert benchmarker.read_save_mods(tmp_path / "a.zip") == mods
+    dirs = [benchmarker.prepare_mods(tmp_path / f"{name}.zip") for name in "abc"]
+    assert synced == ["a.zip", "c.zip"]
+    assert dirs[0] == dirs[1] != dirs[2]
+    assert (tmp_path / dirs[0] / "Krastorio2_1.3.21.zip").exists()
+    assert not (tmp_path / dirs[2] / "Krastorio2_1.3.21.zip").exists()
+
+
+def test_telemetry_sampler(tmp_path):
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(0.3)"])
+    sampler = benchmarker.TelemetrySampler(process.pid, 0.01)
+    sampler.start()
+    process.wait()
+    samples = sampler.stop()
+    assert len(samples["timestamp"]) > 1
+    # the perf counters, if perf is installed, have timestamps of their own
+    for key, values in samples.items():
+        timestamps = samples["perf_timestamp" if key.startswith("perf_") else "timestamp"]
+        assert len(values) == len(timestamps)
+    path = str(tmp_path / "telemetry.npz")
+    benchmarker.save_telemetry(path, samples, append=False)
+    benchmarker.save_telemetry(path, samples, append=True)
+    with np.load(path) as saved:
+        assert len(saved["rss"]) == 2 * len(samples["rss"])
+
+
+def test_series_pyramid_keeps_peaks():
+    data = np.ones((3, 20000))
+    data[1, 12345] = 50
+    info, blocks = benchmarker.series_pyramid(data, "s")
+    assert [level["points"] for level in info["levels"]] == [1000, 4000, 16000, 20000]
+    for _, block in blocks:
+        assert max(benchmarker.json.loads(block)["hi"]) == 50
+    coarse, blocks = benchmarker.series_pyramid(data, "s", max_points=500)
+    assert [level["points"] for level in coarse["levels"]] == [500]
+
+
+def test_load_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    group = tmp_path / "saves" / "group"
+    group.mkdir(parents=True)
+    (tmp_path / "saves" / "benchmark.json").write_text('{"ticks": 100, "priority": 2}')
+    manifest = {"runs": 3, "description": "belts", "maps": {"b": {"ticks": 50}}}
+    (group / "benchmark.json").write_text(benchmarker.json.dumps(manifest))
+    settings = benchmarker.load_manifest(benchmarker.PurePath("saves", "group", "a.zip"))
+    assert settings == {"ticks": 100, "priority": 2, "runs": 3, "description": "belts"}
+    assert benchmarker.load_manifest(benchmarker.PurePath("saves", "group", "b.zip"))["ticks"] == 50
+    assert benchmarker.find_maps("**/*.json") == []
+
+
+def test_archive_result(tmp_path):
+    result = tmp_path / "saves" / "map"
+    result.parent.mkdir()
+    rows = [[tick, 1000 * tick] + [5000 - tick] * 30 for tick in range(4)] * 2
+    log = ["  Performed 4 updates in 1 ms"] + [
+        f"t{row[0]}," + ",".join(map(str, row)) for row in rows
+    ]
+    result.write_text('{"avgs": ["1", "2"]}\n' + "\n".join(log) + "\n")
+    # results from before the tick data was stored separately only have the log
+    benchmarker.convert_results(str(tmp_path))
+    assert not result.exists()
+    assert benchmarker.read_result_header(result)["archive"]["shape"] == [2, 4]
+    tick_data = benchmarker.load_tick_data(result)
+    assert tick_data.tolist() == np.array(rows).reshape(2, 4, 32).tolist()
+    column = benchmarker.load_tick_data(result, ["wholeUpdate"])
+    assert column[:, :, 0].tolist() == [[0, 1000, 2000, 3000]] * 2
+    with zipfile.ZipFile(f"{result}.ticks") as archive:
+        assert archive.read("log.txt").decode() == log[0] + "\n"
+    assert benchmarker.find_results(str(tmp_path), "*") == [result]
+
+
+@pytest.fixture
+def factorio(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_FACTORIO_SEED", "1")
+    return fake_factorio.install(tmp_path / "bin")
+
+
+def test_run_benchmark(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    folder = tmp_path / "out"
+    (folder / "saves").mkdir(parents=True)
+    avgs = benchmarker.run_benchmark(
+        benchmarker.PurePath("saves", "map.zip"), str(folder), 300, 2, factorio, skipticks=None
+    )
+    assert len(avgs) == 2 and all(1.5 < avg < 2.5 for avg in avgs)
+    result = folder / "saves" / "map"
+    header = benchmarker.read_result_header(result)
+    assert header["version"] == "1.1.100 linux64 headless"
+    # the warm-up of the fake is 50 ticks
+    assert 20 <= header["skipticks"] <= 100
+    tick_data = benchmarker.load_tick_data(result)
+    assert tick_data.shape == (2, 300, len(benchmarker.outheader))
+    assert np.all(np.diff(tick_data[:, :, 0], axis=1) > 0)
+    assert "Goodbye" in result.read_text()
+
+
+def test_benchmark_folder(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves" / "group").mkdir(parents=True)
+    for name in ("a", "b"):
+        make_save(tmp_path / "saves" / "group" / f"{name}.zip", [("base", "1.1.80")])
+    benchmarker.benchmark_folder(
+        200, 2, True, None, "wholeUpdate", "**/*", str(factorio), "out", use_cache=False
+    )
+    assert sorted(path.name for path in (tmp_path / "out" / "saves" / "group").iterdir()) == [
+        "a.ticks",
+        "b.ticks",
+    ]
+    graphs = tmp_path / "out" / "graphs" / "group"
+    assert (graphs / "wholeUpdate.png").exists()
+    assert (graphs / "consistency_a_wholeUpdate_all.png").exists()
+    assert (tmp_path / "out" / "report.html").exists()
+    connection = benchmarker.open_history()
+    assert connection.execute("SELECT COUNT(*) FROM results").fetchone() == (2,)
+
+
+def test_ingest_results_twice(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves").mkdir()
+    for name in ("a_b", "axb"):
+        make_save(tmp_path / "saves" / f"{name}.zip", [("base", "1.1.80")])
+    benchmarker.benchmark_folder(100, 2, True, 0, None, "*", str(factorio), "out", use_cache=False)
+    benchmarker.ingest_results("out", None)
+    benchmarker.ingest_results("out", None, "single.sqlite", "a_b.*")
+    benchmarker.ingest_results("out", None, "single.sqlite", "a_b.*")
+    for database, results in ((benchmarker.HISTORY_DATABASE, 2), ("single.sqlite", 1)):
+        connection = benchmarker.open_history(database)
+        counts = [
+            connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("results", "metrics", "run_metrics")
+        ]
+        metrics = results * len(benchmarker.outheader)
+        assert counts == [results, metrics, 2 * metrics]
+    # the _ in a_b must not match the x in axb
+    map_name = str(benchmarker.PurePath("saves", "a_b"))
+    connection = benchmarker.open_history()
+    assert connection.execute(
+        "SELECT map FROM results WHERE map LIKE ? ESCAPE '\\'",
+        (benchmarker.escape_like(map_name),),
+    ).fetchall() == [(map_name,)]
+
+
+def test_find_regressions_corrects_across_maps(tmp_path, monkeypatch):
+    database = str(tmp_path / "history.sqlite")
+    connection = benchmarker.open_history(database)
+    with connection:
+        for map_name, mean in (("a", 1.0), ("b", 3.0)):
+            for version, slowdown in (("1.1.0", 0), ("1.1.1", 1)):
+                result_id = connection.execute(
+                    "INSERT INTO results (folder, map, version, mods, hardware, timestamp, "
+                    "ticks, runs, skipticks) VALUES (?, ?, ?, 'm', 'h', '', 100, 2, 0)",
+                    (version, map_name, version),
+                ).lastrowid
+                connection.executemany(
+                    "INSERT INTO run_metrics VALUES (?, 'wholeUpdate', ?, ?)",
+                    [(result_id, run, mean + slowdown) for run in range(2)],
+                )
+    connection.close()
+    # both slowdowns are significant on their own, but not as two tests
+    p_values = {1.0: 0.03, 3.0: 0.04}
+    monkeypatch.setattr(benchmarker, "welch_test", lambda a, b: p_values[a[0]])
+    assert benchmarker.compare_versions("1.1.0", "1.1.1", database, map_pattern="a")
+    assert benchmarker.compare_versions("1.1.0", "1.1.1", database, map_pattern="b")
+    assert benchmarker.find_regressions(database) == []
+    p_values[1.0] = 0.02
+    assert [map_name for map_name, *_ in benchmarker.find_regressions(database)] == ["a", "b"]
+
+
+def test_plots(tmp_path):
+    data = np.random.default_rng(1).normal(2, 0.1, (3, 100))
+    benchmarker.plot_ups_consistency(str(tmp_path), benchmarker.PurePath("g"), data, 10, "c")
+    assert (tmp_path / "graphs" / "g" / "c_min_max_med.png").exists()
+    benchmarker.plot_bar_chart([1.0, 2.5], ["a", "b"], "mean", tmp_path / "bar.png")
+    assert (tmp_path / "bar.png").exists()
+
+
+def test_migrate_map(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    map_ = tmp_path / "map.zip"
+    make_save(map_, [("base", "1.1.80")])
+    monkeypatch.setattr(benchmarker, "prepare_mods", lambda map_: tmp_path / "mods")
+    monkeypatch.setattr(benchmarker, "threadreg", [])
+    [(port, rcon_port)] = benchmarker.allocate_ports(1, 23000, 23100)
+    assert benchmarker.migrate_map(factorio, map_, False, "/c game.print(1)", port, rcon_port)
+    assert (tmp_path / "map1_1_100.zip").read_bytes() == map_.read_bytes()
+
+
+def test_migrate_folder_retries_after_an_error(factorio, tmp_path, monkeypatch, capsys):
+    import factorio_rcon
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    monkeypatch.setattr(benchmarker, "prepare_mods", lambda map_: tmp_path / "mods")
+    monkeypatch.setattr(benchmarker, "threadreg", [])
+    send_command = factorio_rcon.RCONClient.send_command
+    failures = [factorio_rcon.RCONReceiveError("connection reset")]
+
+    def flaky_send_command(self, command):
+        if failures:
+            raise failures.pop()
+        return send_command(self, command)
+
+    monkeypatch.setattr(factorio_rcon.RCONClient, "send_command", flaky_send_command)
+    with pytest.raises(SystemExit):
+        benchmarker.migrate_folder(True, str(factorio), "map.zip", retries=1)
+    output = capsys.readouterr().out
+    assert "RCONReceiveError('connection reset')" in output
+    assert "2 attempt(s)" in output and "1 of 1 maps migrated" in output
+    assert benchmarker.threadreg == []
+
+
+def test_harness_benchmarks(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    results = benchmark_harness.run_suite(300, 2, 1, tmp_path)
+    assert "parse ticks/s" in results and "graphs/s" in results
+    assert all(value > 0 for value in results.values())
+
+
+def test_factorio_version_is_probed_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(benchmarker, "factorio_versions", {})
+    factorio = tmp_path / "factorio"
+    script = (
+        '#!/bin/sh\necho probe >> probes\necho "Version: 1.1.100 (build 1, linux64, headless)"\n'
+    )
+    factorio.write_text(script)
+    factorio.chmod(0o755)
+    for _ in range(3):
+        assert benchmarker.get_factorio_version(factorio, True) == "1.1.100 linux64 headless"
+    # a new process uses the cache file
+    monkeypatch.setattr(benchmarker, "factorio_versions", {})
+    assert benchmarker.get_factorio_version(factorio) == "1.1.100"
+    assert (tmp_path / "probes").read_text() == "probe\n"
+    factorio.write_text(script + "# updated\n")
+    assert benchmarker.get_factorio_version(factorio) == "1.1.100"
+    assert (tmp_path / "probes").read_text() == "probe\nprobe\n"
+
+
+def test_save_index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(benchmarker, "save_index", {})
+    (tmp_path / "saves").mkdir()
+    mods = [("base", "1.1.80"), ("Krastorio2", "1.3.21")]
+    make_save(tmp_path / "saves" / "a.zip", mods)
+    make_save(tmp_path / "saves" / "b.zip", mods[:1])
+    read = []
+    read_save_info = benchmarker.read_save_info
+    monkeypatch.setattr(
+        benchmarker, "read_save_info", lambda map_: read.append(map_.name) or read_save_info(map_)
+    )
+    saves = benchmarker.index_saves(benchmarker.find_maps("*"))
+    info = saves[benchmarker.Path("saves", "a.zip")]
+    assert info["version"] == "1.1.80"
+    assert info["mods"] == [list(mod) for mod in mods]
+    assert info["mods_fingerprint"] == benchmarker.mods_fingerprint(mods)
+    # the index is kept on disk and only changed saves are read again
+    monkeypatch.setattr(benchmarker, "save_index", {})
+    make_save(tmp_path / "saves" / "b.zip", mods)
+    os.utime(tmp_path / "saves" / "b.zip", ns=(1, 1))
+    (tmp_path / "saves" / "a.zip").rename(tmp_path / "saves" / "c.zip")
+    saves = benchmarker.index_saves(benchmarker.find_maps("*"))
+    assert sorted(read) == ["a.zip", "b.zip", "b.zip", "c.zip"]
+    assert len({info["mods_fingerprint"] for info in saves.values()}) == 1
+    assert sorted(benchmarker.save_index) == [os.path.join("saves", f"{name}.zip") for name in "bc"]
+
+
+def test_dedupe_install(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for version, changed in (("1.1.100", b"old"), ("1.1.101", b"new")):
+        install = tmp_path / version
+        (install / "data").mkdir(parents=True)
+        (install / "data" / "base.lua").write_bytes(b"x" * 1000)
+        (install / "data" / "changed.lua").write_bytes(changed)
+        benchmarker.dedupe_install(install)
+    assert benchmarker.dedupe_install(tmp_path / "1.1.101") == 1003
+    shared = [tmp_path / version / "data" / "base.lua" for version in ("1.1.100", "1.1.101")]
+    assert shared[0].stat().st_ino == shared[1].stat().st_ino
+    changed = [tmp_path / version / "data" / "changed.lua" for version in ("1.1.100", "1.1.101")]
+    assert changed[0].read_bytes() == b"old" and changed[1].read_bytes() == b"new"
+
+
+def test_ab_compare(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("FAKE_FACTORIO_SEED", "1")
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    sides = [
+        (fake_factorio.install(tmp_path / name, tick_ms=tick_ms), None)
+        for name, tick_ms in (("a", "2"), ("b", "1"))
+    ]
+    assert benchmarker.ab_compare([], sides, 100, 2, "empty") == {}
+    map_ = benchmarker.Path("saves", "map.zip")
+    comparison = benchmarker.ab_compare([map_], sides, 100, 2, "ab", skipticks=50)
+    metrics = comparison[str(map_)]["metrics"]
+    # with the same seed every tick of B takes exactly half as long
+    assert metrics["wholeUpdate"]["speedup"] == pytest.approx(2, rel=0.01)
+    assert metrics["wholeUpdate"]["verdict"] == "B is faster"
+    saved = json.loads((tmp_path / "ab" / "ab_comparison.json").read_text())
+    assert saved["maps"][str(map_)]["runs"] == 2
+    assert saved["maps"][str(map_)]["metrics"]["wholeUpdate"]["verdict"] == "B is faster"
+    for side in ("A", "B"):
+        assert benchmarker.read_result_header(tmp_path / "ab" / side / "saves" / "map")
+        assert not (tmp_path / "ab" / side / "runs").exists()
+
+
+def test_benchmark_matrix(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("FAKE_FACTORIO_SEED", "1")
+    for version, tick_ms in (("1.1.100", "2"), ("1.1.101", "3")):
+        binary = benchmarker.version_binary(version)
+        fake_factorio.install(tmp_path / binary.parent, version=version, tick_ms=tick_ms)
+    assert benchmarker.stored_versions() == ["1.1.100", "1.1.101"]
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "a.zip", [("base", "1.1.80")])
+    benchmarker.benchmark_matrix(
+        ["1.1.100", "1.1.101"],
+        "matrix",
+        ticks=200,
+        runs=2,
+        disable_mods=True,
+        skipticks=None,
+        consistency=None,
+        map_regex="*",
+        graphs="png",
+    )
+    matrix = benchmarker.json.loads((tmp_path / "matrix" / "matrix.json").read_text())
+    results = matrix["maps"]["a"]
+    assert results["1.1.101"]["wholeUpdate"]["mean"] > results["1.1.100"]["wholeUpdate"]["mean"]
+    assert (tmp_path / "matrix" / "graphs" / "wholeUpdate.png").exists()
+    assert (tmp_path / "matrix" / "1.1.101" / "saves" / "a.ticks").exists()
+
+
+def test_session_progress(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    (tmp_path / "out" / "saves").mkdir(parents=True)
+    progress = benchmarker.SessionProgress()
+    progress.plan(os.path.join("saves", "map"), 600, None)
+    progress.plan(os.path.join("saves", "next"), 1200, 4.0)
+    assert progress.eta() is None
+    benchmarker.run_benchmark(
+        benchmarker.PurePath("saves", "map.zip"), "out", 300, 2, factorio, progress=progress
+    )
+    state = progress.snapshot()
+    assert (
+        state["ticks_done"] == 600
+        and state["maps"][os.path.join("saves", "map")]["state"] == "running"
+    )
+    progress.finish(os.path.join("saves", "map"))
+    # the next map is predicted to take twice as long per tick
+    assert progress.eta() > 0
+    server = benchmarker.MetricsServer(("127.0.0.1", 0), progress)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}"
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            metrics = response.read().decode()
+        with urllib.request.urlopen(f"{url}/progress") as response:
+            assert benchmarker.json.load(response)["ticks_planned"] == 1800
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert "factorio_benchmark_eta_seconds " in metrics
+    assert 'factorio_benchmark_maps{state="done"} 1' in metrics
+
+
+def test_abort_rules(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("FAKE_FACTORIO_TICK_MS", "20")
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    benchmarker.benchmark_folder(
+        300,
+        2,
+        True,
+        0,
+        None,
+        "*",
+        str(factorio),
+        "out",
+        use_cache=False,
+        abort=benchmarker.AbortRules(min_ups=100, min_ups_ticks=200),
+    )
+    aborted = benchmarker.json.loads((tmp_path / "out" / "aborted.json").read_text())
+    assert list(aborted) == [os.path.join("saves", "map")]
+    assert "below 100" in aborted[os.path.join("saves", "map")]
+    assert not list((tmp_path / "out" / "saves").iterdir())
+    # there is nothing left to save after the last run, so it is kept
+    avgs = benchmarker.run_benchmark(
+        benchmarker.PurePath("saves", "map.zip"),
+        "out",
+        300,
+        1,
+        factorio,
+        abort=benchmarker.AbortRules(min_ups=100, min_ups_ticks=200),
+    )
+    assert avgs is not None and len(avgs) == 1
+
+
+def test_progress_is_reported_after_every_run(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("FAKE_FACTORIO_RUN_MS", "300")
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    (tmp_path / "out" / "saves").mkdir(parents=True)
+    progress = benchmarker.SessionProgress()
+    updates = []
+    update = progress.update
+
+    def timed_update(name, run, *args):
+        updates.append((run, benchmarker.time.monotonic()))
+        update(name, run, *args)
+
+    monkeypatch.setattr(progress, "update", timed_update)
+    benchmarker.run_benchmark(
+        benchmarker.PurePath("saves", "map.zip"), "out", 100, 2, factorio, progress=progress
+    )
+    # the first run is reported while the second one still runs
+    assert [run for run, _ in updates] == [1, 2]
+    assert updates[1][1] - updates[0][1] > 0.2
+    assert progress.snapshot()["ticks_done"] == 200
+
+
+def test_map_census(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(benchmarker, "prepare_mods", lambda map_: tmp_path / "mods")
+    monkeypatch.setattr(benchmarker, "threadreg", [])
+    map_ = tmp_path / "map.zip"
+    make_save(map_, [("base", "1.1.80")])
+    census = {"entities": {"inserter": 12, "transport-belt": 40}, "transport_lines": 80}
+    with zipfile.ZipFile(map_, "a") as archive:
+        archive.writestr("census.json", benchmarker.json.dumps(census))
+    assert benchmarker.map_census(map_, factorio) == census
+    assert len(list((tmp_path / "cache" / "census").iterdir())) == 1
+    # the second time it comes from the cache, without a server
+    monkeypatch.setattr(benchmarker, "take_census", None)
+    assert benchmarker.map_census(map_, factorio) == census
+
+
+def test_fit_entity_costs():
+    rng = np.random.default_rng(1)
+    censuses, means = {}, {}
+    for i in range(12):
+        entities = {"inserter": int(rng.integers(0, 5000)), "assembling-machine": i * 100}
+        lines = int(rng.integers(0, 20000))
+        censuses[f"map{i}"] = {"entities": entities, "transport_lines": lines, "trains": i}
+        means[f"map{i}"] = {
+            # 2 µs per inserter and 5 µs per assembler, 0.1 µs per transport line
+            "entityUpdate": 0.3
+            + entities["inserter"] * 0.002
+            + entities["assembling-machine"] * 0.005,
+            "transportLinesUpdate": 0.1 + lines * 0.0001,
+        }
+        means[f"map{i}"]["wholeUpdate"] = sum(means[f"map{i}"].values()) + 1.5
+    model = benchmarker.fit_entity_costs(censuses, means)
+    costs = model["metrics"]["entityUpdate"]["costs"]
+    assert costs["inserter"] == pytest.approx(2) and costs["assembling-machine"] == pytest.approx(5)
+    lines = model["metrics"]["transportLinesUpdate"]
+    assert lines["costs"]["transport_lines"] == pytest.approx(0.1) and lines["r2"] > 0.999
+    # trains cost nothing here
+    assert model["metrics"]["trains"]["costs"]["trains"] == pytest.approx(0, abs=1e-9)
+    predicted = benchmarker.predict_tick_time(model, censuses["map3"])
+    assert predicted == pytest.approx(means["map3"]["wholeUpdate"])
+
+
+def test_save_stager(tmp_path):
+    saves = []
+    for name in ("a", "b", "c"):
+        saves.append(tmp_path / "saves" / f"{name}.zip")
+        saves[-1].parent.mkdir(exist_ok=True)
+        saves[-1].write_bytes(name.encode() * 1000)
+    stager = benchmarker.SaveStager(str(tmp_path / "shm"), budget=2500)
+    try:
+        stager.prefetch(saves)
+        first = stager.get(saves[0])
+        assert first.is_relative_to(stager.directory) and Path(first).read_bytes() == b"a" * 1000
+        second = stager.get(saves[1])
+        stager.release(saves[0])
+        # c only fits once the released copy of a is evicted
+        third = stager.get(saves[2])
+        assert Path(third).read_bytes() == b"c" * 1000 and not Path(first).exists()
+        assert Path(second).exists()
+        stager.release(saves[1])
+        stager.release(saves[2])
+    finally:
+        stager.close()
+    assert not stager.directory.exists()
+
+
+def test_benchmark_folder_staged(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("FAKE_FACTORIO_LOAD_MS", "200")
+    (tmp_path / "saves").mkdir()
+    for name in ("a", "b"):
+        make_save(tmp_path / "saves" / f"{name}.zip", [("base", "1.1.80")])
+    benchmarker.benchmark_folder(
+        100,
+        1,
+        True,
+        0,
+        None,
+        "*",
+        str(factorio),
+        "out",
+        use_cache=False,
+        graphs="png",
+        stage_dir=str(tmp_path / "shm"),
+    )
+    for name in ("a", "b"):
+        header = benchmarker.read_result_header(tmp_path / "out" / "saves" / name)
+        assert 0.2 <= header["load_time"] < 5
+    with zipfile.ZipFile(tmp_path / "out" / "saves" / "a.ticks") as archive:
+        log = archive.read("log.txt").decode()
+    assert str(tmp_path / "shm") in log
+    assert not list((tmp_path / "shm").iterdir())
+
+
+def test_benchmark_folder_closes_the_stager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "a.zip", [("base", "1.1.80")])
+
+    def broken_run_benchmark(*args, **kwargs):
+        raise OSError("factorio is missing")
+
+    monkeypatch.setattr(benchmarker, "run_benchmark", broken_run_benchmark)
+    with pytest.raises(OSError):
+        benchmarker.benchmark_folder(
+            100, 1, True, 0, None, "*", "factorio", "out", stage_dir=str(tmp_path / "shm")
+        )
+    # the warm-up failed after the saves were prefetched
+    assert not list((tmp_path / "shm").iterdir())
+
+
+def test_load_time(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("FAKE_FACTORIO_LOAD_MS", "300")
+    # a script logs a line at the end of every run
+    monkeypatch.setenv("FAKE_FACTORIO_RUN_MS", "500")
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    (tmp_path / "out" / "saves").mkdir(parents=True)
+    benchmarker.run_benchmark(benchmarker.PurePath("saves", "map.zip"), "out", 100, 2, factorio)
+    header = benchmarker.read_result_header(tmp_path / "out" / "saves" / "map")
+    assert 0.3 <= header["load_time"] < 0.6
+
+
+def test_run_benchmark_tick_array(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    for folder in ("first", "second"):
+        (tmp_path / folder / "saves").mkdir(parents=True)
+    map_ = benchmarker.PurePath("saves", "map.zip")
+    avgs = benchmarker.run_benchmark(map_, "first", 200, 2, factorio)
+    first = np.load(tmp_path / "first" / "saves" / "map.npy", mmap_mode="r")
+    # one row per run and tick, one column per metric of the verbose output
+    assert first.dtype == np.int64 and first.shape == (2, 200, len(benchmarker.outheader))
+    whole = first[:, :, benchmarker.outheader.index("wholeUpdate")]
+    assert whole.sum(axis=1) / 1e6 / 200 == pytest.approx(avgs, abs=1e-3)
+    # the tick rows aren't duplicated in the log
+    with open(tmp_path / "first" / "saves" / "map") as log:
+        assert not any(benchmarker.parse_tick_line(line.strip()) for line in log)
+    # runs of an earlier batch come first
+    benchmarker.run_benchmark(map_, "second", 200, 1, factorio, previous=(first, avgs))
+    merged = np.load(tmp_path / "second" / "saves" / "map.npy")
+    assert merged.shape == (3, 200, len(benchmarker.outheader))
+    assert np.array_equal(merged[:2], first)
+    header = benchmarker.read_result_header(tmp_path / "second" / "saves" / "map")
+    assert len(header["avgs"]) == 3
+
+
+def test_tick_statistics():
+    rng = np.random.default_rng(1)
+    data = rng.integers(1, 30, size=(3, 500, 2)) * 10**6
+    stats = benchmarker.tick_statistics(data)
+    flat = data.reshape(-1, 2) / 1e6
+    assert stats["mean"] == pytest.approx(flat.mean(axis=0))
+    assert stats["std"] == pytest.approx(flat.std(axis=0))
+    for q in benchmarker.PERCENTILES:
+        assert stats[f"p{q:g}"] == pytest.approx(np.percentile(flat, q, axis=0))
+    assert stats["over_budget"].tolist() == (flat > benchmarker.TICK_BUDGET_MS).sum(axis=0).tolist()
+    # a streak at the end of one run doesn't continue into the next run
+    streaks = np.array([[1, 1, 20, 20], [20, 20, 1, 1]])[:, :, None] * 10**6
+    stats = benchmarker.tick_statistics(streaks)
+    assert stats["streaks"][0] == 2 and stats["longest_streak"][0] == 2
+
+
+def test_stored_statistics(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    (tmp_path / "out" / "saves").mkdir(parents=True)
+    map_ = benchmarker.PurePath("saves", "map.zip")
+    benchmarker.run_benchmark(map_, "out", 200, 2, factorio, skipticks=None)
+    result = tmp_path / "out" / "saves" / "map"
+    skipticks = benchmarker.read_result_header(result)["skipticks"]
+    stored = benchmarker.stored_statistics(result, skipticks)
+    computed = benchmarker.tick_statistics(benchmarker.load_tick_data(result)[:, skipticks:])
+    assert set(stored) == set(computed)
+    for name, values in stored.items():
+        assert np.isnan(values[0]) and values[1:] == pytest.approx(computed[name][1:], abs=1e-3)
+    assert benchmarker.stored_statistics(result, skipticks + 1) is None
+
+    # the graphs and the report use the statistics of the header
+    def recomputed(*args, **kwargs):
+        raise AssertionError("the statistics were computed again")
+
+    monkeypatch.setattr(benchmarker, "tick_statistics", recomputed)
+    benchmarker.render_results("out", "*", None, "wholeUpdate")
+    assert (tmp_path / "out" / "report.html").exists()
+
+
+def test_summarize_ticks():
+    data = np.zeros((2, 100, len(benchmarker.outheader)), dtype=np.int64)
+    data[:, :, 0] = np.arange(100) * 10**7
+    whole = benchmarker.outheader.index("wholeUpdate")
+    data[:, :10, whole] = 50 * 10**6
+    data[:, 10:, whole] = 2 * 10**6
+    summary = benchmarker.summarize_ticks(data, 10)
+    assert summary["skipticks"] == 10
+    # the timestamp isn't a metric
+    assert list(summary["statistics"]) == benchmarker.outheader[1:]
+    assert summary["statistics"]["wholeUpdate"]["max"] == 2
+    assert summary["statistics"]["wholeUpdate"]["over_budget"] == 0
+    assert benchmarker.summarize_ticks(data, 0)["statistics"]["wholeUpdate"]["max"] == 50
+    assert benchmarker.summarize_ticks(data, 100) == {"skipticks": 100}
+
+
+def test_detect_warmup():
+    rng = np.random.default_rng(1)
+    flat = rng.normal(2, 0.05, 2000)
+    ramp = np.linspace(8, 2, 100)
+    assert benchmarker.detect_warmup(np.concatenate([ramp, flat])) == pytest.approx(100, abs=10)
+    assert benchmarker.detect_warmup(flat) <= 10
+    assert benchmarker.detect_warmup(np.array([1.0, 2.0, 3.0])) == 0
+
+
+def test_resolve_skipticks(tmp_path):
+    data = np.zeros((2, 1000, len(benchmarker.outheader)), dtype=np.int64)
+    whole = benchmarker.outheader.index("wholeUpdate")
+    data[:, :, whole] = 2 * 10**6
+    data[:, :200, whole] = np.linspace(10, 2, 200) * 10**6
+    # "auto" detects the warm-up, a fixed -s is used as it is
+    assert benchmarker.resolve_skipticks(data, None) == pytest.approx(200, abs=10)
+    assert benchmarker.resolve_skipticks(data, 17) == 17
+    result = tmp_path / "map"
+    result.write_text('{"skipticks": 42}\n')
+    assert benchmarker.result_skipticks(result, data, None) == 42
+    assert benchmarker.result_skipticks(result, data, 5) == 5
+    assert benchmarker.result_skipticks(tmp_path / "missing", data, None) == pytest.approx(
+        200, abs=10
+    )
+
+
+@pytest.mark.skipif(not hasattr(os, "sched_setaffinity"), reason="no cpu affinity")
+@pytest.mark.skipif(benchmarker.shutil.which("taskset") is None, reason="needs taskset")
+def test_affinity_is_set_before_the_start():
+    cpus = sorted(os.sched_getaffinity(0))[:1]
+    command = [sys.executable, "-c", "import os; print(sorted(os.sched_getaffinity(0)))"]
+    assert benchmarker.pinned_command(command, None) is None
+    child = subprocess.run(
+        benchmarker.pinned_command(command, cpus),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert child.stdout.strip() == str(cpus)
+
+
+def test_benchmark_folder_parallel(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else [0]
+    # the core sets of two instances, even on a machine with a single cpu
+    monkeypatch.setattr(benchmarker, "get_core_sets", lambda jobs: [cpus[:1], cpus[-1:]])
+    (tmp_path / "saves").mkdir()
+    for name in ("a", "b", "c"):
+        make_save(tmp_path / "saves" / f"{name}.zip", [("base", "1.1.80")])
+    benchmarker.benchmark_folder(
+        100, 2, True, 0, None, "*", str(factorio), "out", jobs=2, use_cache=False, graphs="png"
+    )
+    headers = [benchmarker.read_result_header(tmp_path / "out" / "saves" / name) for name in "abc"]
+    assert all(len(header["avgs"]) == 2 for header in headers)
+    assert {tuple(header["cpus"]) for header in headers} <= {tuple(cpus[:1]), tuple(cpus[-1:])}
+    assert sorted(path.name for path in (tmp_path / "factorio" / "instances").iterdir()) == [
+        "0",
+        "1",
+    ]
+
+
+def test_result_cache(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    map_ = benchmarker.PurePath("saves", "map.zip")
+
+    def benchmark(folder, runs=2, **options):
+        (tmp_path / folder / "saves").mkdir(parents=True)
+        benchmarker.benchmark_map(map_, folder, 100, runs, factorio, **options)
+        return benchmarker.read_result_header(tmp_path / folder / "saves" / "map")
+
+    first = benchmark("first")
+    assert "cached_runs" not in first
+    assert len(list((tmp_path / "cache" / "results").glob("*.json"))) == 1
+    second = benchmark("second")
+    assert second["cached_runs"] == 2 and second["avgs"] == first["avgs"]
+    assert np.array_equal(
+        benchmarker.load_tick_data(tmp_path / "second" / "saves" / "map"),
+        benchmarker.load_tick_data(tmp_path / "first" / "saves" / "map"),
+    )
+    # more runs than cached only benchmark the missing one
+    third = benchmark("third", runs=3)
+    assert third["cached_runs"] == 2 and third["avgs"][:2] == first["avgs"]
+    assert len(third["avgs"]) == 3
+    # --no-cache
+    assert "cached_runs" not in benchmark("uncached", use_cache=False)
+    assert len(list((tmp_path / "cache" / "results").glob("*.json"))) == 1
+    # a changed save gets its own entry
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.81")])
+    assert "cached_runs" not in benchmark("changed")
+
+
+def test_adaptive_repetitions(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("FAKE_FACTORIO_NOISE", "0.5")
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "map.zip", [("base", "1.1.80")])
+    map_ = benchmarker.PurePath("saves", "map.zip")
+
+    def benchmark(folder, target_error, max_runs):
+        (tmp_path / folder / "saves").mkdir(parents=True)
+        benchmarker.benchmark_map(
+            map_,
+            folder,
+            100,
+            2,
+            factorio,
+            use_cache=False,
+            target_error=target_error,
+            max_runs=max_runs,
+            batch_size=2,
+        )
+        result = tmp_path / folder / "saves" / "map"
+        with zipfile.ZipFile(f"{result}.ticks") as archive:
+            log = archive.read("log.txt").decode()
+        return benchmarker.read_result_header(result), benchmarker.load_tick_data(result), log
+
+    # the target can't be reached, so batches are added up to --max-repetitions
+    header, tick_data, log = benchmark("capped", 1e-6, 7)
+    assert len(header["avgs"]) == 7 and tick_data.shape[0] == 7
+    assert log.count("Performed") == 7
+    # every batch of the fake starts with the same seed, so only the timestamps differ
+    assert np.array_equal(tick_data[2:4, :, 1:], tick_data[:2, :, 1:])
+    # batches are added until the target is reached
+    header, tick_data, log = benchmark("target", 0.05, 50)
+    avgs = [float(avg) for avg in header["avgs"]]
+    assert 2 < len(avgs) < 50 and tick_data.shape[0] == len(avgs)
+    assert header["relative_error"] <= 0.05 < benchmarker.relative_error(avgs[:-2])
+
+
+def test_coordinator_and_workers(factorio, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves").mkdir()
+    jobs = []
+    for name in ("a", "b", "c"):
+        make_save(tmp_path / "saves" / f"{name}.zip", [("base", "1.1.80")])
+        jobs.append({"id": len(jobs), "map": f"saves/{name}.zip", "version": None})
+        jobs[-1] |= {"ticks": 100, "runs": 1, "disable_mods": True, "folder": "out"}
+    coordinator = benchmarker.BenchmarkCoordinator(jobs, lease_timeout=1)
+    (tmp_path / "out" / "saves").mkdir(parents=True)
+    # the slow worker takes longer than the lease and its heartbeats don't get through
+    heartbeat = coordinator.heartbeat
+    coordinator.heartbeat = lambda job_id, worker: worker != "slow" and heartbeat(job_id, worker)
+    slow = fake_factorio.install(tmp_path / "slow", load_ms="2500")
+    server = benchmarker.CoordinatorServer(("127.0.0.1", 0), coordinator)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    errors = []
+
+    def worker(binary, name):
+        try:
+            benchmarker.run_worker(url, str(binary), name, poll_interval=0.1)
+        except Exception as e:  # noqa: PIE786
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(slow, "slow"))]
+    workers[0].start()
+    while not coordinator.leases:
+        benchmarker.time.sleep(0.05)
+    [slow_job] = coordinator.leases
+    workers.append(threading.Thread(target=worker, args=(factorio, "fast")))
+    workers[1].start()
+    try:
+        while not coordinator.finished():
+            benchmarker.time.sleep(0.1)
+            coordinator.expire()
+        for thread in workers:
+            thread.join(30)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not errors and not any(thread.is_alive() for thread in workers)
+    assert coordinator.done == {0, 1, 2} and coordinator.attempts[slow_job] == 2
+    for name in ("a", "b", "c"):
+        header = benchmarker.read_result_header(tmp_path / "out" / "saves" / name)
+        assert header["worker"] == "fast"
+    assert set(coordinator.workers) == {"slow", "fast"}
+
+
+def test_coordinator_rejects_bad_requests(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    jobs = [{"id": 0, "map": "saves/a.zip", "version": None, "folder": "out"}]
+    coordinator = benchmarker.BenchmarkCoordinator(jobs)
+    server = benchmarker.CoordinatorServer(("127.0.0.1", 0), coordinator)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    def status(method, path, data=b"{}", headers=None):
+        request = urllib.request.Request(url + path, data, headers or {}, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    lease = json.dumps({"worker": "../../x", "version": "1.1.100", "hardware": {}}).encode()
+    try:
+        assert status("POST", "/lease", lease) == 400
+        assert status("POST", "/lease", b"not json") == 400
+        assert status("POST", "/heartbeat/abc", b'{"worker": "a"}') == 400
+        assert status("POST", "/done/7", b'{"worker": "a"}') == 400
+        assert status("POST", "/done/0", b'{"worker": "a"}') == 400
+        assert status("PUT", "/upload/0/log", b"x", {"Worker": "../x"}) == 400
+        assert status("PUT", "/upload/x/log", b"x", {"Worker": "a"}) == 400
+        assert status("GET", "/map/abc", None) == 404
+        lease = json.dumps({"worker": "a", "version": "1.1.100", "hardware": {}}).encode()
+        assert status("POST", "/lease", lease) == 200
+        assert status("PUT", "/upload/0/log", b"x", {"Worker": "a"}) == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+    # uploads are named after the attempt, not the worker
+    assert [path.name for path in (tmp_path / "out" / "saves").iterdir()] == ["a.log.1"]
+    assert set(coordinator.workers) == {"a"}
+
+
+def test_worker_heartbeat_survives_errors(factorio, tmp_path, monkeypatch, capsys):
+    import requests
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saves").mkdir()
+    make_save(tmp_path / "saves" / "a.zip", [("base", "1.1.80")])
+    jobs = [{"id": 0, "map": "saves/a.zip", "version": None, "folder": "out"}]
+    jobs[0] |= {"ticks": 100, "runs": 1, "disable_mods": True}
+    coordinator = benchmarker.BenchmarkCoordinator(jobs, lease_timeout=1.5)
+    (tmp_path / "out" / "saves").mkdir(parents=True)
+    slow = fake_factorio.install(tmp_path / "slow", load_ms="2500")
+    server = benchmarker.CoordinatorServer(("127.0.0.1", 0), coordinator)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    post = requests.post
+    failures = [requests.ConnectionError("coordinator restarting")]
+
+    def flaky_post(link, **kwargs):
+        if "/heartbeat/" in link and failures:
+            raise failures.pop()
+        return post(link, **kwargs)
+
+    monkeypatch.setattr(requests, "post", flaky_post)
+    worker = threading.Thread(target=benchmarker.run_worker, args=(url, str(slow), "w", 0.1))
+    worker.start()
+    try:
+        while not coordinator.finished():
+            benchmarker.time.sleep(0.1)
+            coordinator.expire()
+        worker.join(30)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert coordinator.done == {0} and coordinator.attempts[0] == 1
+    assert "heartbeat of job 0 failed" in capsys.readouterr().out